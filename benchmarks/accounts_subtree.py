@@ -0,0 +1,99 @@
+# ruff: noqa: T201
+"""Benchmark hierarchical account lookups against the chart of accounts size.
+
+Compares the `(ledger_id, paths)` partial index with the `(ledger_id, path, name)` index,
+which was the only one before, for the query "all accounts under Expenses:Group8".
+
+Usage:
+    python -m benchmarks.accounts_subtree [--sizes 100 1000 10000] [--repeat 200]
+
+The benchmark writes to the `<database>_benchmark` database of the configured MongoDB server
+and drops it at the end.
+"""
+
+import argparse
+import asyncio
+import time
+from typing import Any
+from uuid import uuid7
+
+from benchmarks.common import benchmark_settings
+from opum_ledger.core.utils import split_path
+from opum_ledger.db import init_db
+from opum_ledger.domain.accounts import ROOT_PATH
+from opum_ledger.models.accounts import AccountModel
+
+GROUPS = 50
+SUBTREE = "Expenses:Group8"
+INDEXES = {
+    "ledger_id_path_name": "ledger_id_path_name_live",
+    "ledger_id_paths_live": "ledger_id_paths_live",
+}
+
+
+def chart_of_accounts(ledger_id: Any, size: int) -> list[AccountModel]:  # pyright: ignore[reportExplicitAny]
+    accounts: list[AccountModel] = []
+    for number in range(size):
+        path = f"{ROOT_PATH[number % len(ROOT_PATH)]}:Group{number % GROUPS}:Account{number}"
+        accounts.append(
+            AccountModel(
+                id=uuid7(),
+                name=f"Account{number}",
+                path=path,
+                paths=split_path(path),
+                ledger_id=ledger_id,
+            )
+        )
+    return accounts
+
+
+async def measure(ledger_id: Any, index: str, repeat: int) -> tuple[float, int, int]:  # pyright: ignore[reportExplicitAny]
+    """Return the mean lookup time in ms, and the keys and documents examined by one lookup."""
+    collection = AccountModel.get_pymongo_collection()
+    query = {"ledger_id": ledger_id, "paths": SUBTREE, "deleted_at": None}
+
+    started = time.perf_counter()
+    for _ in range(repeat):
+        _ = await collection.find(query).hint(index).to_list()
+    elapsed = (time.perf_counter() - started) / repeat * 1000
+
+    explain = await collection.database.command(
+        {
+            "explain": {"find": collection.name, "filter": query, "hint": index},
+            "verbosity": "executionStats",
+        }
+    )
+    stats = explain["executionStats"]
+    return elapsed, stats["totalKeysExamined"], stats["totalDocsExamined"]
+
+
+async def run(sizes: list[int], repeat: int) -> None:
+    settings = benchmark_settings()
+    client = await init_db(settings)
+    try:
+        print(f"{'accounts':>10} {'index':>22} {'ms/lookup':>10} {'keys':>8} {'docs':>8} {'found':>6}")
+        for size in sizes:
+            ledger_id = uuid7()
+            _ = await AccountModel.insert_many(chart_of_accounts(ledger_id, size))
+            found = await AccountModel.find(
+                AccountModel.ledger_id == ledger_id,
+                AccountModel.paths == SUBTREE,
+            ).count()
+            for label, index in INDEXES.items():
+                elapsed, keys, docs = await measure(ledger_id, index, repeat)
+                print(f"{size:>10} {label:>22} {elapsed:>10.3f} {keys:>8} {docs:>8} {found:>6}")
+    finally:
+        await client.drop_database(settings.db.database)
+        await client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[100, 1_000, 10_000, 50_000])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+    asyncio.run(run(args.sizes, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
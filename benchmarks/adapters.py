@@ -0,0 +1,115 @@
+# ruff: noqa: T201
+"""Benchmark the validation of a page of transactions with a new and a prebuilt `TypeAdapter`.
+
+The startup cost is building the adapter of each listed type, paid once by `type_adapter` when the
+domain modules are imported. The steady state compares a page validated with an adapter built for
+the request, as the list reads did, with the prebuilt adapter, and counts the adapters built while
+serving the pages, which must be none.
+
+Usage:
+    python -m benchmarks.adapters [--repeat 200]
+
+The benchmark does not use the database.
+"""
+
+import argparse
+import time
+from collections.abc import Callable, Iterator
+from contextlib import contextmanager
+from datetime import UTC, datetime, timedelta
+from typing import Any
+from uuid import uuid7
+
+from pydantic import TypeAdapter
+
+from opum_ledger.domain.accounts import Account
+from opum_ledger.domain.commodities import Commodity
+from opum_ledger.domain.transactions import TransactionsDAL
+from opum_ledger.domain.types.transaction import Transaction
+
+PAGE_SIZES = (1, 50, 500)
+
+
+def transaction_documents(count: int) -> list[dict[str, Any]]:
+    """Return documents as read with `TRANSACTION_PROJECTION`."""
+    ledger_id, commodity_id = uuid7(), uuid7()
+    accounts = [uuid7(), uuid7()]
+    started = datetime(2024, 1, 1, tzinfo=UTC)
+    return [
+        {
+            "id": uuid7(),
+            "ledger_id": ledger_id,
+            "description": f"Groceries #{number}",
+            "date_time": started + timedelta(hours=number),
+            "created_at": started,
+            "updated_at": started,
+            "revision": 1,
+            "tags": ["food", "weekly"],
+            "details": [
+                {"account_id": accounts[0], "amount": {"commodity_id": commodity_id, "amount": -1250 - number}},
+                {"account_id": accounts[1], "amount": {"commodity_id": commodity_id, "amount": 1250 + number}},
+            ],
+        }
+        for number in range(count)
+    ]
+
+
+@contextmanager
+def count_adapters() -> Iterator[list[int]]:
+    """Count the `TypeAdapter`s built in the block."""
+    built = [0]
+    init = TypeAdapter.__init__
+
+    def counting_init(self: TypeAdapter[Any], *args: Any, **kwargs: Any) -> None:
+        built[0] += 1
+        init(self, *args, **kwargs)
+
+    TypeAdapter.__init__ = counting_init  # pyright: ignore[reportAttributeAccessIssue]
+    try:
+        yield built
+    finally:
+        TypeAdapter.__init__ = init  # pyright: ignore[reportAttributeAccessIssue]
+
+
+Validator = Callable[[list[dict[str, Any]]], list[Transaction]]
+
+
+def measure(validate: Validator, documents: list[dict[str, Any]], repeat: int) -> tuple[float, int]:
+    """Return the mean time of a page validation in ms and the number of adapters built meanwhile."""
+    _ = validate(documents)
+    with count_adapters() as built:
+        started = time.perf_counter()
+        for _ in range(repeat):
+            _ = validate(documents)
+        elapsed = time.perf_counter() - started
+    return elapsed / repeat * 1000, built[0]
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    print("startup, building the adapter of a listed type")
+    print(f"{'type':>22} {'ms':>10}")
+    for type_ in (list[Account], list[Commodity], list[Transaction]):
+        started = time.perf_counter()
+        _ = TypeAdapter(type_)
+        print(f"{str(type_).rsplit('.', 1)[-1]:>22} {(time.perf_counter() - started) * 1000:>10.3f}")
+
+    validators: dict[str, Validator] = {
+        "adapter per request": lambda documents: TypeAdapter(list[Transaction]).validate_python(documents),
+        "prebuilt adapter": TransactionsDAL._validate_documents,  # pyright: ignore[reportPrivateUsage]
+    }
+    print()
+    print(f"steady state, a page of transactions validated {args.repeat} times")
+    print(f"{'validator':>22} {'page':>6} {'ms/page':>10} {'built':>7}")
+    for size in PAGE_SIZES:
+        documents = transaction_documents(size)
+        for label, validate in validators.items():
+            elapsed, built = measure(validate, documents, args.repeat)
+            print(f"{label:>22} {size:>6} {elapsed:>10.3f} {built:>7}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,41 @@
+"""Helpers shared by the benchmarks."""
+
+import statistics
+
+from blacksheep import Application
+from blacksheep.testing import TestClient
+
+from opum_ledger.app import configure_application
+from opum_ledger.core.services import configure_services
+from opum_ledger.settings import Settings, load_settings
+
+
+def benchmark_settings() -> Settings:
+    """Return the application settings with the benchmark database, `<database>_benchmark`."""
+    settings = load_settings()
+    settings.db.database = f"{settings.db.database}_benchmark"
+    return settings
+
+
+async def start_app(settings: Settings) -> tuple[Application, TestClient]:
+    """Start the application with the settings and return it with a client calling it in-process.
+
+    The requests go through the whole application, routing, authentication, binding and serialization,
+    without the network.
+    """
+    app = configure_application(*configure_services(settings))
+    await app.start()
+    return app, TestClient(app)
+
+
+def writer_headers(settings: Settings) -> list[tuple[bytes, bytes]]:
+    return [(b"X-API-KEY", settings.auth.rw_x_api_key.encode())]
+
+
+def latency_summary(samples: list[float]) -> str:
+    """Format latencies in seconds as mean and percentiles in milliseconds."""
+    quantiles = statistics.quantiles(samples, n=100)
+    return (
+        f"n={len(samples)} mean={statistics.fmean(samples) * 1000:.3f}ms "
+        f"p50={quantiles[49] * 1000:.3f}ms p95={quantiles[94] * 1000:.3f}ms p99={quantiles[98] * 1000:.3f}ms"
+    )
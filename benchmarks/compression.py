@@ -0,0 +1,70 @@
+# ruff: noqa: T201
+"""Benchmark the compression of a transactions page, size and latency on a WAN link.
+
+Encodes a `TransactionsPage` as the endpoint does, then compresses it with every encoding the
+compression middleware can negotiate, at the configured levels. The latency is the compression
+time plus the transfer time of the body at `--bandwidth` Mbit/s plus the decompression time.
+
+Usage:
+    python -m benchmarks.compression [--items 500] [--repeat 50] [--bandwidth 20]
+
+The benchmark does not use the database.
+"""
+
+import argparse
+import gzip
+import time
+from collections.abc import Callable
+
+from benchmarks.json_encoding import transactions_page
+from opum_ledger.core.compression import brotli, compressors, zstd
+from opum_ledger.core.json import dump_json
+from opum_ledger.settings import CompressionSettings
+
+
+def decompressors() -> dict[bytes, Callable[[bytes], bytes]]:
+    available: dict[bytes, Callable[[bytes], bytes]] = {b"identity": lambda data: data}
+    if zstd is not None:
+        available[b"zstd"] = zstd.decompress
+    if brotli is not None:
+        available[b"br"] = brotli.decompress  # pyright: ignore
+    available[b"gzip"] = gzip.decompress
+    return available
+
+
+def timed(function: Callable[[bytes], bytes], data: bytes, repeat: int) -> tuple[float, bytes]:
+    """Return the mean time of a call in ms and its result."""
+    result = function(data)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        _ = function(data)
+    return (time.perf_counter() - started) / repeat * 1000, result
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=50)
+    parser.add_argument("--bandwidth", type=float, default=20.0, help="link bandwidth in Mbit/s")
+    args = parser.parse_args()
+
+    body = dump_json(transactions_page(args.items))
+    encoders: dict[bytes, Callable[[bytes], bytes]] = {b"identity": lambda data: data}
+    encoders.update(compressors(CompressionSettings()))
+    decoders = decompressors()
+
+    print(f"TransactionsPage with {args.items} transactions, {args.bandwidth} Mbit/s link")
+    print(f"{'encoding':>10} {'bytes':>10} {'ratio':>7} {'comp ms':>9} {'decomp ms':>10} {'latency ms':>11}")
+    for encoding, compress in encoders.items():
+        compress_ms, compressed = timed(compress, body, args.repeat)
+        decompress_ms, _ = timed(decoders[encoding], compressed, args.repeat)
+        transfer_ms = len(compressed) * 8 / (args.bandwidth * 1_000_000) * 1000
+        latency = compress_ms + transfer_ms + decompress_ms
+        print(
+            f"{encoding.decode():>10} {len(compressed):>10} {len(body) / len(compressed):>7.1f}"
+            f" {compress_ms:>9.3f} {decompress_ms:>10.3f} {latency:>11.3f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
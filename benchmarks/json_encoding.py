@@ -0,0 +1,77 @@
+# ruff: noqa: T201
+"""Benchmark the serialization of a transactions page to the response body.
+
+Compares the orjson path, `model_dump()` of every model for orjson then the `str` round trip
+BlackSheep needs, with `json_response` serializing the models straight to bytes with pydantic-core.
+
+Usage:
+    python -m benchmarks.json_encoding [--items 500] [--repeat 200]
+
+The benchmark does not use the database.
+"""
+
+import argparse
+import time
+from collections.abc import Callable
+from datetime import UTC, datetime, timedelta
+from uuid import uuid7
+
+from opum_ledger.controllers.transactions import TransactionsPage
+from opum_ledger.core.json import dump_json, dumps
+from opum_ledger.domain.types.transaction import Transaction
+
+
+def transactions_page(items: int) -> TransactionsPage:
+    commodity_id = uuid7()
+    accounts = [uuid7(), uuid7()]
+    started = datetime(2024, 1, 1, tzinfo=UTC)
+    transactions = [
+        Transaction.model_validate(
+            {
+                "id": uuid7(),
+                "ledger_id": uuid7(),
+                "description": f"Groceries #{number}",
+                "date_time": started + timedelta(hours=number),
+                "created_at": started,
+                "updated_at": started,
+                "tags": ["food", "weekly"],
+                "details": [
+                    {"account_id": accounts[0], "amount": {"commodity_id": commodity_id, "amount": -1250 - number}},
+                    {"account_id": accounts[1], "amount": {"commodity_id": commodity_id, "amount": 1250 + number}},
+                ],
+            }
+        )
+        for number in range(items)
+    ]
+    return TransactionsPage(transactions=transactions, skip=0, limit=items, count=items, has_more=False)
+
+
+def measure(encode: Callable[[TransactionsPage], bytes], page: TransactionsPage, repeat: int) -> tuple[float, int]:
+    """Return the mean time of an encoding in ms and the body size."""
+    body = encode(page)
+    started = time.perf_counter()
+    for _ in range(repeat):
+        _ = encode(page)
+    return (time.perf_counter() - started) / repeat * 1000, len(body)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--items", type=int, default=500)
+    parser.add_argument("--repeat", type=int, default=200)
+    args = parser.parse_args()
+
+    page = transactions_page(args.items)
+    encoders: dict[str, Callable[[TransactionsPage], bytes]] = {
+        "orjson + model_dump": lambda page: dumps(page).encode("utf8"),
+        "pydantic-core bytes": dump_json,
+    }
+    print(f"TransactionsPage with {args.items} transactions")
+    print(f"{'encoder':>22} {'ms/page':>10} {'bytes':>10}")
+    for label, encode in encoders.items():
+        elapsed, size = measure(encode, page, args.repeat)
+        print(f"{label:>22} {elapsed:>10.3f} {size:>10}")
+
+
+if __name__ == "__main__":
+    main()
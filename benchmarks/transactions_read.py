@@ -0,0 +1,124 @@
+# ruff: noqa: T201
+"""Benchmark the CPU time of reading transactions, per 1,000 transactions.
+
+Compares the Beanie path, raw documents validated into `TransactionModel` and then again into
+`Transaction` from the attributes, with the raw path: documents projected on the `Transaction`
+fields by MongoDB and validated once. The CPU time covers the BSON decoding and the validation,
+the wall time adds the database round trips.
+
+Usage:
+    python -m benchmarks.transactions_read [--transactions 10000] [--repeat 5]
+
+The benchmark writes to the `<database>_benchmark` database of the configured MongoDB server
+and drops it at the end.
+"""
+
+import argparse
+import asyncio
+import time
+from collections.abc import Awaitable, Callable
+from datetime import UTC, datetime, timedelta
+from typing import Any
+from uuid import UUID, uuid7
+
+from benchmarks.common import benchmark_settings
+from opum_ledger.core.adapters import type_adapter
+from opum_ledger.db import init_db
+from opum_ledger.domain.transactions import TRANSACTION_PROJECTION
+from opum_ledger.domain.types.transaction import Transaction
+from opum_ledger.models.transactions import TransactionModel
+
+INSERT_BATCH_SIZE = 1000
+
+
+def ledger_transactions(ledger_id: UUID, count: int) -> list[TransactionModel]:
+    commodity_id = uuid7()
+    accounts = [uuid7(), uuid7()]
+    started = datetime(2024, 1, 1, tzinfo=UTC)
+    return [
+        TransactionModel.model_validate(
+            {
+                "id": uuid7(),
+                "ledger_id": ledger_id,
+                "description": f"Groceries #{number}",
+                "date_time": started + timedelta(minutes=number),
+                "tags": ["food", "weekly"],
+                "details": [
+                    {"account_id": accounts[0], "amount": {"commodity_id": commodity_id, "amount": -1250 - number}},
+                    {"account_id": accounts[1], "amount": {"commodity_id": commodity_id, "amount": 1250 + number}},
+                ],
+            }
+        )
+        for number in range(count)
+    ]
+
+
+async def read_documents(ledger_id: UUID) -> list[Transaction]:
+    documents: list[dict[str, Any]] = (
+        await TransactionModel.get_pymongo_collection()
+        .find(  # pyright: ignore
+            {"ledger_id": ledger_id, "deleted_at": None}
+        )
+        .to_list()
+    )
+    transactions = type_adapter(list[TransactionModel]).validate_python(documents)
+    return type_adapter(list[Transaction]).validate_python(transactions, from_attributes=True)
+
+
+async def read_raw(ledger_id: UUID) -> list[Transaction]:
+    documents: list[dict[str, Any]] = (
+        await TransactionModel.get_pymongo_collection()
+        .find(  # pyright: ignore
+            {"ledger_id": ledger_id, "deleted_at": None}, TRANSACTION_PROJECTION
+        )
+        .to_list()
+    )
+    return type_adapter(list[Transaction]).validate_python(documents)
+
+
+async def measure(
+    read: Callable[[UUID], Awaitable[list[Transaction]]],
+    ledger_id: UUID,
+    repeat: int,
+) -> tuple[float, float]:
+    """Return the CPU and the wall time in ms per 1,000 transactions."""
+    read_count = 0
+    cpu_started, wall_started = time.process_time(), time.perf_counter()
+    for _ in range(repeat):
+        read_count += len(await read(ledger_id))
+    cpu, wall = time.process_time() - cpu_started, time.perf_counter() - wall_started
+    return cpu / read_count * 1_000_000, wall / read_count * 1_000_000
+
+
+async def run(count: int, repeat: int) -> None:
+    settings = benchmark_settings()
+    client = await init_db(settings)
+    try:
+        ledger_id = uuid7()
+        transactions = ledger_transactions(ledger_id, count)
+        for start in range(0, count, INSERT_BATCH_SIZE):
+            _ = await TransactionModel.insert_many(transactions[start : start + INSERT_BATCH_SIZE])
+
+        readers = {"beanie documents": read_documents, "raw projected": read_raw}
+        for read in readers.values():
+            _ = await read(ledger_id)  # warm up
+        print(f"{count} transactions read {repeat} times")
+        print(f"{'path':>18} {'cpu ms/1k':>10} {'wall ms/1k':>11}")
+        for label, read in readers.items():
+            cpu, wall = await measure(read, ledger_id, repeat)
+            print(f"{label:>18} {cpu:>10.2f} {wall:>11.2f}")
+    finally:
+        await client.drop_database(settings.db.database)
+        await client.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--transactions", type=int, default=10_000)
+    parser.add_argument("--repeat", type=int, default=5)
+    args = parser.parse_args()
+    asyncio.run(run(args.transactions, args.repeat))
+
+
+if __name__ == "__main__":
+    main()
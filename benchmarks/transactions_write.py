@@ -0,0 +1,100 @@
+# ruff: noqa: T201
+"""Benchmark the latency of creating a transaction with POST /api/v1/transactions/{ledger_id}.
+
+Requests go through the whole application in-process, so the numbers are the server side
+latency: binding, validation, the database writes and the response serialization.
+Run it on two revisions to compare them, a regression shows in the percentiles.
+
+Usage:
+    python -m benchmarks.transactions_write [--requests 2000] [--warmup 100]
+
+The benchmark writes to the `<database>_benchmark` database of the configured MongoDB server
+and drops it at the end.
+"""
+
+import argparse
+import asyncio
+import time
+
+from blacksheep import JSONContent, Response
+
+from benchmarks.common import benchmark_settings, latency_summary, start_app, writer_headers
+from opum_ledger.db import init_db
+
+
+async def created(response: Response) -> str:
+    data = await response.json()
+    if response.status != 200:
+        raise RuntimeError(f"Request failed with {response.status}: {data}")
+    return data["id"]
+
+
+async def run(requests: int, warmup: int) -> None:
+    settings = benchmark_settings()
+    app, client = await start_app(settings)
+    headers = writer_headers(settings)
+    try:
+        ledger_id = await created(
+            await client.post(
+                "/api/v1/ledgers/",
+                headers=headers,
+                content=JSONContent({"name": f"Benchmark {time.time_ns()}"}),
+            )
+        )
+        commodity_id = await created(
+            await client.post(
+                f"/api/v1/commodities/{ledger_id}",
+                headers=headers,
+                content=JSONContent({"name": "US Dollar", "code": "USD", "symbol": "$", "ledger_id": ledger_id}),
+            )
+        )
+        accounts = [
+            await created(
+                await client.post(
+                    f"/api/v1/accounts/{ledger_id}",
+                    headers=headers,
+                    content=JSONContent({"name": name, "path": path}),
+                )
+            )
+            for name, path in (("Cash", "Assets:Cash"), ("Food", "Expenses:Food"))
+        ]
+        transaction = JSONContent(
+            {
+                "description": "Groceries",
+                "date_time": "2024-01-15T10:30:00Z",
+                "tags": ["food"],
+                "details": [
+                    {"account_id": accounts[0], "amount": {"commodity_id": commodity_id, "amount": -1250}},
+                    {"account_id": accounts[1], "amount": {"commodity_id": commodity_id, "amount": 1250}},
+                ],
+            }
+        )
+
+        path = f"/api/v1/transactions/{ledger_id}"
+        samples: list[float] = []
+        for number in range(warmup + requests):
+            started = time.perf_counter()
+            response = await client.post(path, headers=headers, content=transaction)
+            elapsed = time.perf_counter() - started
+            _ = await created(response)
+            if number >= warmup:
+                samples.append(elapsed)
+
+        print(f"POST {path.replace(ledger_id, '{ledger_id}')}: {latency_summary(samples)}")
+    finally:
+        await app.stop()
+        client_db = await init_db(settings)
+        await client_db.drop_database(settings.db.database)
+        await client_db.close()
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--warmup", type=int, default=100)
+    args = parser.parse_args()
+    asyncio.run(run(args.requests, args.warmup))
+
+
+if __name__ == "__main__":
+    main()
@@ -6,12 +6,15 @@ from blacksheep.server.diagnostics import get_diagnostic_app
 from rodi import Container
 
 from opum_ledger.core.auth import use_auth
+from opum_ledger.core.compression import use_compression
+from opum_ledger.core.content import use_content_negotiation
 from opum_ledger.core.docs import configure_docs
 from opum_ledger.core.errors import configure_error_handlers
 from opum_ledger.core.json import use_orjson
 from opum_ledger.core.logging import config_logger
 from opum_ledger.core.services import configure_services
 from opum_ledger.db import use_beanie
+from opum_ledger.purge import use_purge
 from opum_ledger.settings import Settings, load_settings
 
 
@@ -28,6 +31,9 @@ def configure_application(
 
     use_auth(app, settings)
     use_beanie(app, settings)
+    use_purge(app, settings)
+    use_compression(app, settings)
+    use_content_negotiation(app)
 
     app.use_cors(  # pyright: ignore[reportUnusedCallResult]
         allow_methods="GET POST PUT DELETE",
@@ -36,8 +42,8 @@ def configure_application(
         allow_credentials=True,
     )
 
-    # TODO:
-    # pass orjson to pydantic
+    # responses built with `api_response` are serialized by pydantic-core, or MessagePack if asked,
+    # orjson serializes the values returned as they are by the request handlers
     use_orjson()
 
     configure_error_handlers(app)
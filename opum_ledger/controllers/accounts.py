@@ -4,16 +4,30 @@ from dataclasses import dataclass
 from typing import Annotated
 
 import pendulum
-from blacksheep import Response, json
+from blacksheep import FromQuery, Response
+from blacksheep.exceptions import BadRequest
 from blacksheep.server.authorization import auth
 from blacksheep.server.controllers import APIController, delete, get, post, put
-from pydantic import RootModel
+from pydantic import BaseModel, RootModel
 
-from opum_ledger.controllers.base import IfMatch
+from opum_ledger.controllers.base import (
+    IfMatch,
+    IfNoneMatch,
+    changes_etag,
+    not_modified,
+    parse_fieldset,
+    revision_etag,
+)
+from opum_ledger.core.bindings import FromJSONBody
+from opum_ledger.core.content import api_response
 from opum_ledger.core.logging import logger
 from opum_ledger.domain.accounts import Account, AccountsBL, AccountUpdate, NewAccount
-from opum_ledger.domain.types.account import AccountUUID
+from opum_ledger.domain.changes import ChangesBL
+from opum_ledger.domain.transactions import TransactionsBL
+from opum_ledger.domain.types.account import AccountPath, AccountUUID
+from opum_ledger.domain.types.commodity import CommodityUUID
 from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.transaction import AccountBalance, AccountRegisterEntry, RegisterCursor
 
 
 @dataclass
@@ -26,6 +40,16 @@ class AccountsResponse:
 AccountsTree = RootModel[dict[str, list[Account]]]
 
 
+class AccountRegister(BaseModel):
+    """A page of the account register."""
+
+    entries: list[AccountRegisterEntry]
+    balances: dict[CommodityUUID, int]
+    limit: int
+    has_more: bool = False
+    next_cursor: str | None = None
+
+
 class Accounts(APIController):
     """API controller for accounts."""
 
@@ -38,14 +62,26 @@ class Accounts(APIController):
     async def get_accounts(
         self,
         accounts: AccountsBL,
+        changes: ChangesBL,
         ledger_id: LedgerUUID,
-    ) -> AccountsResponse:
+        fields: FromQuery[str | None] = FromQuery(None),  # noqa: B008
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, AccountsResponse]:
         """Get ledger accounts.
 
         This handler returns a list of accounts for the ledger.
+        `fields` is a comma separated list of the account fields to return, `id` is always returned.
+        The ETag follows the ledger changes, pass it in `If-None-Match` to get 304 if nothing changed.
         """
-        ledger_accounts = await accounts.get_ledger_accounts(ledger_id)
-        return AccountsResponse(accounts=ledger_accounts)
+        fieldset = parse_fieldset(Account, fields.value)
+        ledger_etag = changes_etag(await changes.get_ledger_sequence(ledger_id))
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+
+        ledger_accounts = await accounts.get_ledger_accounts(ledger_id, fieldset=fieldset)
+        response = api_response(AccountsResponse(accounts=ledger_accounts))
+        response.add_header(b"ETag", ledger_etag)
+        return response
 
     @auth(roles=["writer"])
     @post("/{ledger_id}")
@@ -53,7 +89,7 @@ class Accounts(APIController):
         self,
         accounts: AccountsBL,
         ledger_id: LedgerUUID,
-        new_account: NewAccount,
+        new_account: FromJSONBody[NewAccount],
     ) -> Annotated[Response, Account]:
         """Add a new account.
 
@@ -61,15 +97,12 @@ class Accounts(APIController):
         """
         account = await accounts.create_account(
             ledger_id=ledger_id,
-            new_account=new_account,
+            new_account=new_account.value,
         )
 
-        # Return JSON response with ETag header (timestamp of updated_at)
-        response = json(account)
-        response.add_header(
-            b"ETag",
-            str(account.updated_at.timestamp()).encode("utf-8"),
-        )
+        # The ETag is the account revision, for the conditional updates with If-Match
+        response = api_response(account)
+        response.add_header(b"ETag", revision_etag(account.revision))
 
         # TODO: Should be an open balance transaction here?
 
@@ -88,19 +121,12 @@ class Accounts(APIController):
 
         Delete a selected account from the ledger.
         """
-        try:
-            updated_at = (
-                # pendulum.from_format(if_unmodified_since.value, "ddd, DD MMM YYYY HH:mm:ss z")
-                pendulum.from_timestamp(float(etag.value)) if etag else None
-            )
-        except ValueError:
-            updated_at = None
-            logger.debug("Failed to parse ETag header: %s", etag.value if etag else "None")
+        revision = etag.revision if etag else None
 
         await accounts.delete_ledger_account(
             ledger_id=ledger_id,
             account_id=account_id,
-            updated_at=updated_at,
+            revision=revision,
         )
         # TODO: Should be a close balance transaction here?
 
@@ -111,15 +137,131 @@ class Accounts(APIController):
         accounts: AccountsBL,
         ledger_id: LedgerUUID,
         account_id: AccountUUID,
-    ) -> Account:
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, Account]:
         """Get the account.
 
         Get a selected account from the ledger.
+
+        The ETag is the account revision, pass it in `If-None-Match` to get 304 if the account did not change.
         """
-        return await accounts.get_ledger_account(
+        account = await accounts.get_ledger_account(
             ledger_id=ledger_id,
             account_id=account_id,
         )
+        account_etag = revision_etag(account.revision)
+        if etag and etag.matches(account_etag):
+            return not_modified(account_etag)
+        response = api_response(account)
+        response.add_header(b"ETag", account_etag)
+        return response
+
+    @auth(roles=["reader"])
+    @get("/{ledger_id}/{account_id}/balance")
+    async def get_account_balance(
+        self,
+        accounts: AccountsBL,
+        transactions: TransactionsBL,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+        verify: FromQuery[bool] = FromQuery(False),  # noqa: B008
+    ) -> Annotated[Response, list[AccountBalance]]:
+        """Get the account balance.
+
+        Get the balance of a selected account per commodity.
+
+        With `verify=true` the balances are checked against the account transactions, the ids of the
+        commodities whose balance drifted are listed in the `X-Balance-Drift` header. The balances are
+        repaired with the `recompute-balances` management command.
+        """
+        account = await accounts.get_ledger_account(
+            ledger_id=ledger_id,
+            account_id=account_id,
+        )
+        balance = await transactions.get_ledger_account_balance(
+            ledger_id=ledger_id,
+            account_id=account.id,
+        )
+        response = api_response(balance)
+        if verify.value:
+            drift = await transactions.get_ledger_account_balance_drift(
+                ledger_id=ledger_id,
+                account_id=account.id,
+            )
+            if drift:
+                logger.warning("Account %s balances drifted from its transactions: %s", account.id, drift)
+                response.add_header(b"X-Balance-Drift", ",".join(str(commodity_id) for commodity_id in drift).encode())
+        return response
+
+    @auth(roles=["reader"])
+    @get("/{ledger_id}/{account_id}/register")
+    async def get_account_register(
+        self,
+        accounts: AccountsBL,
+        transactions: TransactionsBL,
+        changes: ChangesBL,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+        after: FromQuery[int | None] = FromQuery(None),  # noqa: B008
+        before: FromQuery[int | None] = FromQuery(None),  # noqa: B008
+        limit: FromQuery[int] = FromQuery(20),  # noqa: B008
+        cursor: FromQuery[str | None] = FromQuery(None),  # noqa: B008
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, AccountRegister]:
+        """Get the account register.
+
+        The details of the account in date order, each one with the account balance in its commodity
+        after it. `balances` are the account balances per commodity after the last entry of the page,
+        the first page starts from the balances before `after`.
+
+        Pass `next_cursor` of the previous page as `cursor` to get the next page, it carries the running
+        balances so the cost of a page does not grow with the account history.
+
+        The ETag follows the ledger changes, pass it in `If-None-Match` to get 304 if nothing changed.
+        """
+        if limit.value < 1:
+            raise BadRequest("Invalid limit")
+        try:
+            page_cursor = RegisterCursor.decode(cursor.value) if cursor.value else None
+        except ValueError as e:
+            raise BadRequest("Invalid cursor") from e
+        ledger_etag = changes_etag(await changes.get_ledger_sequence(ledger_id))
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+
+        account = await accounts.get_ledger_account(
+            ledger_id=ledger_id,
+            account_id=account_id,
+        )
+        entries, balances, has_more = await transactions.get_account_register(
+            ledger_id=ledger_id,
+            account_id=account.id,
+            after=pendulum.from_timestamp(after.value) if after.value else None,
+            before=pendulum.from_timestamp(before.value) if before.value else None,
+            limit=limit.value,
+            cursor=page_cursor,
+        )
+        next_cursor = (
+            RegisterCursor(
+                date_time=entries[-1].date_time,
+                id=entries[-1].transaction_id,
+                index=entries[-1].index,
+                balances=balances,
+            ).encode()
+            if has_more
+            else None
+        )
+        response = api_response(
+            AccountRegister(
+                entries=entries,
+                balances=balances,
+                limit=limit.value,
+                has_more=has_more,
+                next_cursor=next_cursor,
+            )
+        )
+        response.add_header(b"ETag", ledger_etag)
+        return response
 
     @auth(roles=["writer"])
     @put("/{ledger_id}/{account_id}")
@@ -128,31 +270,24 @@ class Accounts(APIController):
         accounts: AccountsBL,
         ledger_id: LedgerUUID,
         account_id: AccountUUID,
-        account: AccountUpdate,
+        account: FromJSONBody[AccountUpdate],
         etag: IfMatch | None = None,
     ) -> Annotated[Response, Account]:
         """Update the account.
 
         Update a selected account in the ledger.
         """
-        try:
-            updated_at = pendulum.from_timestamp(float(etag.value)) if etag else None
-        except ValueError:
-            updated_at = None
-            logger.debug("Failed to parse ETag header: %s", etag.value if etag else "None")
+        revision = etag.revision if etag else None
 
         updated_account = await accounts.update_ledger_account(
             ledger_id=ledger_id,
             account_id=account_id,
-            updated_account=account,
-            updated_at=updated_at,
+            updated_account=account.value,
+            revision=revision,
         )
 
-        response = json(updated_account)
-        response.add_header(
-            b"ETag",
-            str(updated_account.updated_at.timestamp()).encode("utf-8"),
-        )
+        response = api_response(updated_account)
+        response.add_header(b"ETag", revision_etag(updated_account.revision))
 
         return response
 
@@ -161,11 +296,44 @@ class Accounts(APIController):
     async def get_accounts_tree(
         self,
         accounts: AccountsBL,
+        changes: ChangesBL,
         ledger_id: LedgerUUID,
-    ) -> dict[str, list[Account]]:
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, AccountsTree]:
         """Get ledger accounts tree.
 
         This handler returns a tree of accounts for the ledger.
+        The ETag follows the ledger changes, pass it in `If-None-Match` to get 304 if nothing changed.
         """
+        ledger_etag = changes_etag(await changes.get_ledger_sequence(ledger_id))
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+
         tree = await accounts.get_ledger_accounts_tree(ledger_id)
-        return tree
+        response = api_response(tree)
+        response.add_header(b"ETag", ledger_etag)
+        return response
+
+    @auth(roles=["reader"])
+    @get("/tree/{ledger_id}/{path}")
+    async def get_accounts_subtree(
+        self,
+        accounts: AccountsBL,
+        changes: ChangesBL,
+        ledger_id: LedgerUUID,
+        path: AccountPath,
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, AccountsTree]:
+        """Get ledger accounts subtree.
+
+        This handler returns a tree of the account with the path and all the accounts under it,
+        like all the accounts under `Expenses:Travel`.
+        """
+        ledger_etag = changes_etag(await changes.get_ledger_sequence(ledger_id))
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+
+        tree = await accounts.get_ledger_accounts_tree(ledger_id, path=path)
+        response = api_response(tree)
+        response.add_header(b"ETag", ledger_etag)
+        return response
@@ -1,4 +1,15 @@
-from blacksheep import FromHeader
+from collections.abc import Iterable
+from typing import TypeVar
+
+from blacksheep import FromHeader, Response
+from blacksheep.exceptions import BadRequest
+from pydantic import BaseModel
+
+from opum_ledger.core.compression import strip_etag_encoding
+from opum_ledger.core.exceptions import PreconditionFailed
+from opum_ledger.domain.base import Fieldset
+
+M = TypeVar("M", bound=BaseModel)
 
 
 class IfUnmodifiedSince(FromHeader[str]):
@@ -7,3 +18,69 @@ class IfUnmodifiedSince(FromHeader[str]):
 
 class IfMatch(FromHeader[str]):
     name = "If-Match"
+
+    @property
+    def revision(self) -> int | None:
+        """Return the revision of a `"<revision>"` ETag, `None` for `*` that matches any revision.
+
+        The ETag of a compressed response, `"<revision>-<encoding>"`, has the same revision.
+
+        Raises:
+            PreconditionFailed: If the ETag is not a revision, it can not match the current one.
+
+        """
+        value = self.value.strip()
+        if value == "*":
+            return None
+        try:
+            return int(strip_etag_encoding(value).strip('"'))
+        except ValueError as e:
+            raise PreconditionFailed(f"Invalid ETag {value}") from e
+
+
+class IfNoneMatch(FromHeader[str]):
+    name = "If-None-Match"
+
+    def matches(self, etag: bytes) -> bool:
+        """Tell whether any of the listed ETags matches `etag`, with the weak comparison of GET requests."""
+        value = self.value.strip()
+        if value == "*":
+            return True
+        current = strip_etag_encoding(etag.decode().removeprefix("W/"))
+        return any(strip_etag_encoding(tag.strip().removeprefix("W/")) == current for tag in value.split(","))
+
+
+class LastEventId(FromHeader[str]):
+    name = "Last-Event-ID"
+
+
+def revision_etag(revision: int) -> bytes:
+    """Return the strong ETag of a revision."""
+    return f'"{revision}"'.encode()
+
+
+def changes_etag(seq: int) -> bytes:
+    """Return the weak ETag of a ledger list at the ledger change counter `seq`.
+
+    The ETag is weak, the same counter stands for every representation of the list.
+    """
+    return f'W/"{seq}"'.encode()
+
+
+def not_modified(etag: bytes) -> Response:
+    return Response(304, [(b"ETag", etag)])
+
+
+def parse_fieldset(model: type[M], fields: str | None, required: Iterable[str] = ("id",)) -> Fieldset[M] | None:
+    """Return the fieldset of the `fields` query parameter, `None` for all the fields.
+
+    Raises:
+        BadRequest: If a field is not a field of the model.
+
+    """
+    if not fields:
+        return None
+    try:
+        return Fieldset.parse(model, fields, required)
+    except ValueError as e:
+        raise BadRequest(str(e)) from e
@@ -2,14 +2,22 @@
 
 from typing import Annotated
 
-import pendulum
-from blacksheep import Response, json
+from blacksheep import FromQuery, Response
 from blacksheep.server.authorization import auth
 from blacksheep.server.controllers import APIController, delete, get, post, put
 from pydantic import UUID7
 
-from opum_ledger.controllers.base import IfMatch
-from opum_ledger.core.logging import logger
+from opum_ledger.controllers.base import (
+    IfMatch,
+    IfNoneMatch,
+    changes_etag,
+    not_modified,
+    parse_fieldset,
+    revision_etag,
+)
+from opum_ledger.core.bindings import FromJSONBody
+from opum_ledger.core.content import api_response
+from opum_ledger.domain.changes import ChangesBL
 from opum_ledger.domain.commodities import CommoditiesBL, Commodity, NewCommodity, UpdateCommodity
 
 
@@ -25,14 +33,28 @@ class Commodities(APIController):
     async def get_commodities(
         self,
         commodities: CommoditiesBL,
+        changes: ChangesBL,
         ledger_id: UUID7,
-    ) -> list[Commodity]:
+        fields: FromQuery[str | None] = FromQuery(None),  # noqa: B008
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, list[Commodity]]:
         """Get ledger commodities.
 
         This handler returns a list of commodities for the partnership.
+        `fields` is a comma separated list of the commodity fields to return, `id` is always returned.
+        The ETag follows the ledger changes, pass it in `If-None-Match` to get 304 if nothing changed.
         """
-        partnership_commodities: list[Commodity] = await commodities.get_ledger_commodities(ledger_id)
-        return partnership_commodities
+        fieldset = parse_fieldset(Commodity, fields.value)
+        ledger_etag = changes_etag(await changes.get_ledger_sequence(ledger_id))
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+
+        partnership_commodities: list[Commodity] = await commodities.get_ledger_commodities(
+            ledger_id, fieldset=fieldset
+        )
+        response = api_response(partnership_commodities)
+        response.add_header(b"ETag", ledger_etag)
+        return response
 
     @auth(roles=["writer"])
     @post("/{ledger_id}")
@@ -40,7 +62,7 @@ class Commodities(APIController):
         self,
         commodities: CommoditiesBL,
         ledger_id: UUID7,
-        commodity: NewCommodity,
+        commodity: FromJSONBody[NewCommodity],
     ) -> Annotated[Response, Commodity]:
         """Add a new commodity.
 
@@ -48,18 +70,15 @@ class Commodities(APIController):
         """
         new_commodity = await commodities.create(
             ledger_id=ledger_id,
-            commodity_code=commodity.code,
-            commodity_name=commodity.name,
-            commodity_subunit=commodity.subunit,
-            commodity_symbol=commodity.symbol,
-            commodity_no_market=commodity.no_market,
+            commodity_code=commodity.value.code,
+            commodity_name=commodity.value.name,
+            commodity_subunit=commodity.value.subunit,
+            commodity_symbol=commodity.value.symbol,
+            commodity_no_market=commodity.value.no_market,
         )
 
-        response = json(new_commodity)
-        response.add_header(
-            b"ETag",
-            str(new_commodity.updated_at.timestamp()).encode("utf-8"),
-        )
+        response = api_response(new_commodity)
+        response.add_header(b"ETag", revision_etag(new_commodity.revision))
 
         return response
 
@@ -70,15 +89,19 @@ class Commodities(APIController):
         commodities: CommoditiesBL,
         ledger_id: UUID7,
         commodity_id: UUID7,
+        etag: IfMatch | None = None,
     ) -> None:
         """Delete a commodity.
 
         Delete a commodity from the ledger.
         You can not delete a commodity if it is used in a transaction.
         """
+        revision = etag.revision if etag else None
+
         await commodities.delete_ledger_commodity(
             ledger_id=ledger_id,
             commodity_id=commodity_id,
+            revision=revision,
         )
 
     @auth(roles=["writer"])
@@ -88,33 +111,23 @@ class Commodities(APIController):
         commodities: CommoditiesBL,
         ledger_id: UUID7,
         commodity_id: UUID7,
-        commodity: UpdateCommodity,
+        commodity: FromJSONBody[UpdateCommodity],
         etag: IfMatch | None = None,
     ) -> Annotated[Response, Commodity]:
         """Update commodity.
 
         Update selected commodity in the ledger.
         """
-        try:
-            updated_at = (
-                # pendulum.from_format(if_unmodified_since.value, "ddd, DD MMM YYYY HH:mm:ss z")
-                pendulum.from_timestamp(float(etag.value)) if etag else None
-            )
-        except ValueError:
-            updated_at = None
-            logger.debug("Failed to parse ETag header: %s", etag.value if etag else "None")
+        revision = etag.revision if etag else None
 
         updated_commodity = await commodities.update_one(
             ledger_id=ledger_id,
             commodity_id=commodity_id,
-            data=commodity,
-            updated_at=updated_at,
+            data=commodity.value,
+            revision=revision,
         )
 
-        response = json(commodity)
-        response.add_header(
-            b"ETag",
-            str(updated_commodity.updated_at.timestamp()).encode("utf-8"),
-        )
+        response = api_response(updated_commodity)
+        response.add_header(b"ETag", revision_etag(updated_commodity.revision))
 
         return response
@@ -2,14 +2,19 @@
 
 from typing import Annotated
 
-import pendulum
-from blacksheep import Response, json
+from blacksheep import FromQuery, Response
+from blacksheep.contents import StreamedContent
+from blacksheep.exceptions import BadRequest
 from blacksheep.server.authorization import auth
 from blacksheep.server.controllers import APIController, get, post, put
+from essentials.exceptions import ObjectNotFound
 from pydantic import UUID7
 
-from opum_ledger.controllers.base import IfMatch
-from opum_ledger.core.logging import logger
+from opum_ledger.controllers.base import IfMatch, IfNoneMatch, LastEventId, not_modified, revision_etag
+from opum_ledger.core.bindings import FromJSONBody
+from opum_ledger.core.content import api_response
+from opum_ledger.domain.events import LedgerEventsHub
+from opum_ledger.domain.feed import MAX_FEED_CHANGES, ChangesFeedBL, LedgerChanges
 from opum_ledger.domain.ledgers import Ledger, LedgersBL, NewLedger, UpdateLedger
 
 
@@ -26,10 +31,10 @@ class Ledgers(APIController):
     async def get_ledgers(
         self,
         ledgers: LedgersBL,
-    ) -> list[Ledger]:
+    ) -> Annotated[Response, list[Ledger]]:
         """Get ledgers."""
         all_ledgers = await ledgers.get_ledgers()
-        return all_ledgers
+        return api_response(all_ledgers)
 
     @auth(roles=["reader"])
     @get("/{ledger_id}")
@@ -37,14 +42,18 @@ class Ledgers(APIController):
         self,
         ledgers: LedgersBL,
         ledger_id: UUID7,
+        etag: IfNoneMatch | None = None,
     ) -> Annotated[Response, Ledger]:
-        """Get a single ledger by ID."""
+        """Get a single ledger by ID.
+
+        The ETag is the ledger revision, pass it in `If-None-Match` to get 304 if the ledger did not change.
+        """
         ledger = await ledgers.get_ledger(ledger_id)
-        response = json(ledger)
-        response.add_header(
-            b"ETag",
-            str(ledger.updated_at.timestamp()).encode("utf-8"),
-        )
+        ledger_etag = revision_etag(ledger.revision)
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+        response = api_response(ledger)
+        response.add_header(b"ETag", ledger_etag)
         return response
 
     @auth(roles=["writer"])
@@ -52,15 +61,12 @@ class Ledgers(APIController):
     async def create_ledger(
         self,
         ledgers: LedgersBL,
-        new_ledger: NewLedger,
+        new_ledger: FromJSONBody[NewLedger],
     ) -> Annotated[Response, Ledger]:
         """Create a new ledger."""
-        ledger = await ledgers.create_ledger(new_ledger.name, new_ledger.description)
-        response = json(ledger)
-        response.add_header(
-            b"ETag",
-            str(ledger.updated_at.timestamp()).encode("utf-8"),
-        )
+        ledger = await ledgers.create_ledger(new_ledger.value.name, new_ledger.value.description)
+        response = api_response(ledger)
+        response.add_header(b"ETag", revision_etag(ledger.revision))
         return response
 
     @auth(roles=["writer"])
@@ -69,27 +75,82 @@ class Ledgers(APIController):
         self,
         ledgers: LedgersBL,
         ledger_id: UUID7,
-        updated_ledger: UpdateLedger,
+        updated_ledger: FromJSONBody[UpdateLedger],
         etag: IfMatch | None = None,
     ) -> Annotated[Response, Ledger]:
         """Update ledger."""
-        try:
-            updated_at = (
-                # pendulum.from_format(if_unmodified_since.value, "ddd, DD MMM YYYY HH:mm:ss z")
-                pendulum.from_timestamp(float(etag.value)) if etag else None
-            )
-        except ValueError:
-            updated_at = None
-            logger.debug("Failed to parse ETag header: %s", etag.value if etag else "None")
+        revision = etag.revision if etag else None
 
         ledger = await ledgers.update_ledger(
             ledger_id,
-            updated_ledger,
-            updated_at=updated_at,
-        )
-        response = json(ledger)
-        response.add_header(
-            b"ETag",
-            str(ledger.updated_at.timestamp()).encode("utf-8"),
+            updated_ledger.value,
+            revision=revision,
         )
+        response = api_response(ledger)
+        response.add_header(b"ETag", revision_etag(ledger.revision))
         return response
+
+    @auth(roles=["reader"])
+    @get("/{ledger_id}/changes")
+    async def get_ledger_changes(
+        self,
+        ledgers: LedgersBL,
+        feed: ChangesFeedBL,
+        ledger_id: UUID7,
+        since: FromQuery[int | None] = FromQuery(None),  # noqa: B008
+        limit: FromQuery[int] = FromQuery(MAX_FEED_CHANGES),  # noqa: B008
+    ) -> Annotated[Response, LedgerChanges]:
+        """Get the ledger changes since a token.
+
+        Returns the current state of the transactions, accounts and commodities created or updated
+        since the token and the ids of the deleted ones. Pass the returned `token` as `since` to get
+        the next changes, and ask again right away while `has_more` is true.
+
+        Without `since` only the current token is returned: take it before the first full download
+        of the ledger, and sync from it afterwards. `since=0` returns all the recorded changes.
+        """
+        if not 0 < limit.value <= MAX_FEED_CHANGES:
+            raise BadRequest(f"limit must be between 1 and {MAX_FEED_CHANGES}")
+        if not await ledgers.exists(ledger_id):
+            raise ObjectNotFound("Ledger not found")
+
+        if since.value is None:
+            token = await feed.get_ledger_token(ledger_id)
+            return api_response(LedgerChanges(since=token, token=token))
+        if since.value < 0:
+            raise BadRequest("since must be a token returned by the changes feed")
+        return api_response(await feed.get_ledger_changes(ledger_id, since.value, limit.value))
+
+    @auth(roles=["reader"])
+    @get("/{ledger_id}/events")
+    async def get_ledger_events(
+        self,
+        ledgers: LedgersBL,
+        hub: LedgerEventsHub,
+        ledger_id: UUID7,
+        since: FromQuery[int | None] = FromQuery(None),  # noqa: B008
+        last_event_id: LastEventId | None = None,
+    ) -> Response:
+        """Stream the ledger changes as Server-Sent Events.
+
+        Every write is an event named `<entity>.<operation>`, like `transaction.created`, with the ids
+        of the written documents and, for transactions, the balance deltas as data. The event id is a
+        token of the changes feed: reconnecting with `Last-Event-ID`, or `since`, replays the missed
+        events before the new ones.
+        """
+        if not await ledgers.exists(ledger_id):
+            raise ObjectNotFound("Ledger not found")
+        try:
+            resume = int(last_event_id.value) if last_event_id else since.value
+        except ValueError as e:
+            raise BadRequest("Last-Event-ID must be an event id") from e
+
+        return Response(
+            200,
+            [
+                (b"Cache-Control", b"no-cache"),
+                # keep reverse proxies from buffering the stream
+                (b"X-Accel-Buffering", b"no"),
+            ],
+            StreamedContent(b"text/event-stream", lambda: hub.stream(ledger_id, resume)),
+        )
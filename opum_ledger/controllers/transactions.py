@@ -1,37 +1,94 @@
 """Transactions API controller module."""
 
-from asyncio.log import logger
-from typing import Annotated
+from typing import Annotated, Any
 
 import pendulum
-from blacksheep import FromQuery, Response
+from blacksheep import FromQuery, Request, Response
+from blacksheep.contents import StreamedContent
+from blacksheep.exceptions import BadRequest
 from blacksheep.server.authorization import auth
 from blacksheep.server.controllers import APIController, delete, get, post, put
 from essentials.exceptions import ObjectNotFound
-from pydantic import BaseModel
+from pydantic import BaseModel, Field, SerializeAsAny
 
-from opum_ledger.controllers.base import IfMatch
+from opum_ledger.controllers.base import (
+    IfMatch,
+    IfNoneMatch,
+    changes_etag,
+    not_modified,
+    parse_fieldset,
+    revision_etag,
+)
+from opum_ledger.core.bindings import FromJSONBody
+from opum_ledger.core.content import api_response
+from opum_ledger.core.exceptions import PayloadTooLarge
+from opum_ledger.domain.accounts import Account
+from opum_ledger.domain.changes import ChangesBL
+from opum_ledger.domain.commodities import Commodity
+from opum_ledger.domain.exports import ExportFormat, export_chunks
+from opum_ledger.domain.imports import ImportFormat, ImportResult, ImportsBL
 from opum_ledger.domain.ledgers import LedgersBL
 from opum_ledger.domain.transactions import (
     TransactionsBL,
 )
+from opum_ledger.domain.types.account import AccountUUID
+from opum_ledger.domain.types.commodity import CommodityUUID
 from opum_ledger.domain.types.ledger import LedgerUUID
 from opum_ledger.domain.types.transaction import (
+    BulkNewTransaction,
+    BulkTransactionResult,
     NewTransaction,
     Transaction,
     TransactionOrdering,
+    TransactionsCount,
+    TransactionsCursor,
+    TransactionsExpand,
     TransactionUUID,
     UpdateTransaction,
 )
+from opum_ledger.settings import Settings
 
 
 class TransactionsPage(BaseModel):
     """Pagination information for transactions."""
 
-    transactions: list[Transaction]
+    transactions: list[SerializeAsAny[Transaction]]
     skip: int
     limit: int
-    count: int
+    count: int | None
+    has_more: bool = False
+    next_cursor: str | None = None
+
+
+class ExpandedTransactionsPage(TransactionsPage):
+    """Transactions page with the accounts and the commodities its transactions reference, by id."""
+
+    accounts: dict[AccountUUID, Account] = Field(default_factory=dict)
+    commodities: dict[CommodityUUID, Commodity] = Field(default_factory=dict)
+
+
+MAX_BULK_TRANSACTIONS = 1000
+
+
+class NewTransactionsBulk(BaseModel):
+    """Transactions to create in bulk."""
+
+    transactions: list[BulkNewTransaction] = Field(
+        ...,
+        max_length=MAX_BULK_TRANSACTIONS,
+        description="The new transactions, each one in the same format as for a single transaction",
+    )
+    ordered: bool = Field(
+        True,
+        description="Stop at the first invalid or failed transaction",
+    )
+
+
+class BulkTransactionsResult(BaseModel):
+    """Result of a bulk transactions request."""
+
+    created: int
+    results: list[BulkTransactionResult]
 
 
 class Transactions(APIController):
@@ -47,6 +104,7 @@ class Transactions(APIController):
     async def get_transactions(
         self,
         transactions: TransactionsBL,
+        changes: ChangesBL,
         ledger_id: LedgerUUID,
         accounts: FromQuery[list[str]] = FromQuery([]),  # noqa: B008
         after: FromQuery[int | None] = FromQuery(None),  # noqa: B008
@@ -55,15 +113,56 @@ class Transactions(APIController):
         skip: FromQuery[int] = FromQuery(0),  # noqa: B008
         limit: FromQuery[int] = FromQuery(20),  # noqa: B008
         order_by: FromQuery[str] = FromQuery("-date_time"),  # noqa: B008
-    ) -> TransactionsPage:
-        """Get user ledger transactions."""
+        cursor: FromQuery[str | None] = FromQuery(None),  # noqa: B008
+        count: FromQuery[str] = FromQuery("exact"),  # noqa: B008
+        fields: FromQuery[str | None] = FromQuery(None),  # noqa: B008
+        expand: FromQuery[str | None] = FromQuery(None),  # noqa: B008
+        etag: IfNoneMatch | None = None,
+    ) -> Annotated[Response, TransactionsPage]:
+        """Get user ledger transactions.
+
+        Pass `next_cursor` of the previous page as `cursor` to get the next page.
+        Unlike `skip`, the cost of a cursor page does not grow with the page number.
+
+        `count` selects how the matching transactions are counted: `exact`, `estimate`
+        (capped count) or `none` (only `has_more` is returned).
+
+        `fields` is a comma separated list of the transaction fields to return, `id` and `date_time`,
+        the pagination key, are always returned. The other fields are not read from the database.
+
+        `expand` is a comma separated list of `accounts` and `commodities`: the page then also has the
+        accounts and the commodities referenced by its transactions, by id, to render them without
+        other requests. `details` is returned with the fields of the transactions.
+
+        The ETag follows the ledger changes, pass it in `If-None-Match` to get 304 if nothing changed.
+        """
         # TODO: Add search by tags
 
+        if limit.value < 1:
+            raise BadRequest("Invalid limit")
+        try:
+            count_mode = TransactionsCount(count.value)
+        except ValueError as e:
+            raise BadRequest(f"Invalid count: {count.value}") from e
+        try:
+            expanded = {TransactionsExpand(name.strip()) for name in (expand.value or "").split(",") if name.strip()}
+        except ValueError as e:
+            raise BadRequest(f"Invalid expand: {expand.value}") from e
+        required = ("id", "date_time", "details") if expanded else ("id", "date_time")
+        fieldset = parse_fieldset(Transaction, fields.value, required=required)
+        ledger_etag = changes_etag(await changes.get_ledger_sequence(ledger_id))
+        if etag and etag.matches(ledger_etag):
+            return not_modified(ledger_etag)
+
         after_dt = pendulum.from_timestamp(after.value) if after.value else None
         before_dt = pendulum.from_timestamp(before.value) if before.value else None
+        try:
+            page_cursor = TransactionsCursor.decode(cursor.value) if cursor.value else None
+        except ValueError as e:
+            raise BadRequest("Invalid cursor") from e
 
         selected_accounts = accounts.value
-        ledger_transactions, count = await transactions.find_ledger_transactions(
+        ledger_transactions, total, has_more = await transactions.find_ledger_transactions(
             ledger_id=ledger_id,
             accounts=selected_accounts,
             exchange=exchange.value,
@@ -72,12 +171,78 @@ class Transactions(APIController):
             limit=limit.value,
             skip=skip.value,
             order_by=TransactionOrdering(order_by.value),
+            cursor=page_cursor,
+            count_mode=count_mode,
+            fieldset=fieldset,
         )
-        return TransactionsPage(
-            transactions=ledger_transactions,
-            skip=skip.value,
-            limit=limit.value,
-            count=count,
+        next_cursor = (
+            TransactionsCursor.model_validate(ledger_transactions[-1], from_attributes=True).encode()
+            if has_more
+            else None
+        )
+        page_values: dict[str, Any] = {
+            "transactions": ledger_transactions,
+            "skip": skip.value,
+            "limit": limit.value,
+            "count": total,
+            "has_more": has_more,
+            "next_cursor": next_cursor,
+        }
+        page_model = TransactionsPage
+        if expanded:
+            page_model = ExpandedTransactionsPage
+            references = await transactions.get_details_references(
+                ledger_id, (detail for transaction in ledger_transactions for detail in transaction.details), expanded
+            )
+            page_values["accounts"] = references.accounts
+            page_values["commodities"] = references.commodities
+        # the transactions of a fieldset are not `Transaction` instances, the page is not validated again
+        page = page_model.model_construct(**page_values) if fieldset else page_model(**page_values)
+        response = api_response(page)
+        response.add_header(b"ETag", ledger_etag)
+        return response
+
+    @auth(roles=["reader"])
+    @get("/{ledger_id}/export")
+    async def export_transactions(
+        self,
+        transactions: TransactionsBL,
+        ledger_id: LedgerUUID,
+        accounts: FromQuery[list[str]] = FromQuery([]),  # noqa: B008
+        after: FromQuery[int | None] = FromQuery(None),  # noqa: B008
+        before: FromQuery[int | None] = FromQuery(None),  # noqa: B008
+        exchange: FromQuery[bool | None] = FromQuery(None),  # noqa: B008
+        order_by: FromQuery[str] = FromQuery("+date_time"),  # noqa: B008
+        format: FromQuery[str] = FromQuery("ndjson"),  # noqa: B008
+    ) -> Response:
+        """Export user ledger transactions.
+
+        Stream all the transactions matching the filters as NDJSON (a transaction per line)
+        or CSV (a row per transaction detail). Filters are the same as for the transactions list.
+        """
+        try:
+            export_format = ExportFormat(format.value)
+        except ValueError as e:
+            raise BadRequest(f"Unsupported export format: {format.value}") from e
+
+        batches = transactions.export_ledger_transactions(
+            ledger_id=ledger_id,
+            accounts=accounts.value,
+            exchange=exchange.value,
+            after=pendulum.from_timestamp(after.value) if after.value else None,
+            before=pendulum.from_timestamp(before.value) if before.value else None,
+            order_by=TransactionOrdering(order_by.value),
+        )
+
+        return Response(
+            200,
+            [
+                (
+                    b"Content-Disposition",
+                    f'attachment; filename="transactions-{ledger_id}.{export_format.value}"'.encode(),
+                )
+            ],
+            StreamedContent(export_format.content_type, lambda: export_chunks(batches, export_format)),
         )
 
     @auth(roles=["reader"])
@@ -87,18 +252,23 @@ class Transactions(APIController):
         transactions: TransactionsBL,
         ledger_id: LedgerUUID,
         transaction_id: TransactionUUID,
+        etag: IfNoneMatch | None = None,
     ) -> Annotated[Response, Transaction]:
-        """Get user ledger transaction."""
+        """Get user ledger transaction.
+
+        The ETag is the transaction revision, pass it in `If-None-Match` to get 304 if the transaction
+        did not change.
+        """
         transaction: Transaction = await transactions.get_ledger_transaction(
             ledger_id=ledger_id,
             transaction_id=transaction_id,
         )
+        transaction_etag = revision_etag(transaction.revision)
+        if etag and etag.matches(transaction_etag):
+            return not_modified(transaction_etag)
 
-        response = self.json(transaction)
-        response.add_header(
-            b"ETag",
-            str(pendulum.instance(transaction.updated_at).timestamp()).encode("utf-8"),
-        )
+        response = api_response(transaction)
+        response.add_header(b"ETag", transaction_etag)
 
         return response
 
@@ -109,7 +279,7 @@ class Transactions(APIController):
         ledgers: LedgersBL,
         transactions: TransactionsBL,
         ledger_id: LedgerUUID,
-        transaction: NewTransaction,
+        transaction: FromJSONBody[NewTransaction],
     ) -> Annotated[Response, Transaction]:
         """Add a new transaction.
 
@@ -120,17 +290,81 @@ class Transactions(APIController):
 
         new_transaction = await transactions.create_transaction(
             ledger_id=ledger_id,
-            new_transaction=transaction,
+            new_transaction=transaction.value,
         )
 
-        response = self.json(new_transaction)
-        response.add_header(
-            b"ETag",
-            str(new_transaction.updated_at.timestamp()).encode("utf-8"),
-        )
+        response = api_response(new_transaction)
+        response.add_header(b"ETag", revision_etag(new_transaction.revision))
 
         return response
 
+    @auth(roles=["writer"])
+    @post("/{ledger_id}/bulk")
+    async def add_transactions(
+        self,
+        ledgers: LedgersBL,
+        transactions: TransactionsBL,
+        ledger_id: LedgerUUID,
+        bulk: FromJSONBody[NewTransactionsBulk],
+    ) -> Annotated[Response, BulkTransactionsResult]:
+        """Add new transactions in bulk.
+
+        All valid transactions are written with a single database request.
+        The result holds the id or the error of every transaction, in the request order.
+        """
+        if not await ledgers.exists(ledger_id):
+            raise ObjectNotFound("Ledger does not exist.")
+
+        results = await transactions.create_transactions(
+            ledger_id=ledger_id,
+            items=bulk.value.transactions,
+            ordered=bulk.value.ordered,
+        )
+        return api_response(
+            BulkTransactionsResult(
+                created=sum(1 for result in results if result.id is not None),
+                results=results,
+            )
+        )
+
+    @auth(roles=["writer"])
+    @post("/{ledger_id}/import")
+    async def import_transactions(
+        self,
+        request: Request,
+        settings: Settings,
+        ledgers: LedgersBL,
+        imports: ImportsBL,
+        ledger_id: LedgerUUID,
+        format: FromQuery[str] = FromQuery("csv"),  # noqa: B008
+    ) -> Annotated[Response, ImportResult]:
+        """Import transactions from a file.
+
+        The request body is the file, CSV (as written by the export) or an hledger/ledger-cli journal.
+        It is read as a stream, up to `app.import_file_size_limit` bytes.
+        Invalid transactions are reported by line and do not stop the import.
+        """
+        try:
+            import_format = ImportFormat(format.value)
+        except ValueError as e:
+            raise BadRequest(f"Unsupported import format: {format.value}") from e
+
+        size_limit = settings.app.import_file_size_limit
+        content_length = request.get_first_header(b"Content-Length")
+        if content_length is not None and content_length.isdigit() and int(content_length) > size_limit:
+            raise PayloadTooLarge(f"Import file is larger than {size_limit} bytes")
+
+        if not await ledgers.exists(ledger_id):
+            raise ObjectNotFound("Ledger does not exist.")
+
+        result = await imports.import_transactions(
+            ledger_id=ledger_id,
+            chunks=request.stream(),
+            import_format=import_format,
+            size_limit=size_limit,
+        )
+        return api_response(result)
+
     @auth(roles=["writer"])
     @put("/{ledger_id}/{transaction_id}")
     async def update_transaction(
@@ -138,31 +372,24 @@ class Transactions(APIController):
         transactions: TransactionsBL,
         ledger_id: LedgerUUID,
         transaction_id: TransactionUUID,
-        update_transaction: UpdateTransaction,
+        update_transaction: FromJSONBody[UpdateTransaction],
         etag: IfMatch | None = None,
     ) -> Annotated[Response, Transaction]:
         """Update transaction.
 
         Update selected transaction in the ledger.
         """
-        try:
-            updated_at = pendulum.from_timestamp(float(etag.value)) if etag else None
-        except ValueError:
-            updated_at = None
-            logger.debug("Failed to parse ETag header: %s", etag.value if etag else "None")
+        revision = etag.revision if etag else None
 
         updated_transaction = await transactions.update_ledger_transaction(
             ledger_id=ledger_id,
             transaction_id=transaction_id,
-            data=update_transaction,
-            updated_at=updated_at,
+            data=update_transaction.value,
+            revision=revision,
         )
 
-        response = self.json(updated_transaction)
-        response.add_header(
-            b"ETag",
-            str(updated_transaction.updated_at.timestamp()).encode("utf-8"),
-        )
+        response = api_response(updated_transaction)
+        response.add_header(b"ETag", revision_etag(updated_transaction.revision))
 
         return response
 
@@ -179,14 +406,10 @@ class Transactions(APIController):
 
         Delete selected transaction from the ledger.
         """
-        try:
-            updated_at = pendulum.from_timestamp(float(etag.value)) if etag else None
-        except ValueError:
-            updated_at = None
-            logger.debug("Failed to parse ETag header: %s", etag.value if etag else "None")
+        revision = etag.revision if etag else None
 
         await transactions.delete_ledger_transaction(
             ledger_id=ledger_id,
             transaction_id=transaction_id,
-            updated_at=updated_at,
+            revision=revision,
         )
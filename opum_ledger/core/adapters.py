@@ -0,0 +1,28 @@
+"""Registry of the prebuilt pydantic `TypeAdapter`s.
+
+Building a `TypeAdapter` builds the core schema, the validator and the serializer of the type,
+which costs far more than validating a list with it. The domain modules get their adapters from
+`type_adapter` at import, so they are built once while the application is configured, and the
+request handlers only look them up.
+"""
+
+from typing import Any, TypeVar
+
+from pydantic import TypeAdapter
+
+T = TypeVar("T")
+
+_adapters: dict[Any, TypeAdapter[Any]] = {}  # pyright: ignore[reportExplicitAny]
+
+
+def type_adapter(type_: type[T]) -> TypeAdapter[T]:
+    """Return the adapter of the type, built on its first use only."""
+    adapter = _adapters.get(type_)
+    if adapter is None:
+        adapter = _adapters[type_] = TypeAdapter(type_)
+    return adapter
+
+
+def registered_adapters() -> int:
+    """Return the number of adapters built so far."""
+    return len(_adapters)
@@ -0,0 +1,45 @@
+"""Request binders.
+
+`FromJSONBody[Model]` binds a JSON request body validated by pydantic straight from the body bytes
+with `Model.model_validate_json`, in a single pass, without the dicts and lists `request.json()`
+builds first for the default `FromJSON` binding. A body that is not valid JSON or does not match
+the model raises `ValidationError`, mapped to a 400 response by the error handlers.
+
+A body sent as MessagePack, see `core.content`, is unpacked and validated by the same model.
+"""
+
+from typing import TypeVar
+
+from blacksheep import FromJSON, Request
+from blacksheep.server.bindings import InvalidRequestBody, JSONBinder
+from pydantic import BaseModel
+
+from opum_ledger.core.content import MSGPACK_TYPES, load_msgpack
+
+M = TypeVar("M", bound=BaseModel)
+
+
+class FromJSONBody(FromJSON[M]):
+    """A JSON request body validated from its bytes by the pydantic model."""
+
+
+class JSONBodyBinder(JSONBinder):
+    handle = FromJSONBody
+
+    async def get_value(self, request: Request) -> BaseModel | None:
+        if request.method in self._excluded_methods:
+            return None
+        body = await request.read()
+        if not body:
+            if self.required:
+                raise InvalidRequestBody("Missing body")
+            return None
+        if request.declares_json():
+            return self.expected_type.model_validate_json(body)
+        if (request.content_type() or b"").split(b";")[0].strip().lower() in MSGPACK_TYPES:
+            try:
+                data = load_msgpack(body)
+            except ValueError as e:
+                raise InvalidRequestBody("Invalid MessagePack body") from e
+            return self.expected_type.model_validate(data)
+        raise InvalidRequestBody("Expected a JSON or MessagePack body")
@@ -0,0 +1,125 @@
+"""Compression of the response bodies.
+
+The encoding is negotiated from `Accept-Encoding`: zstd, brotli or gzip, the one with the highest
+quality value, ties going to that order. Brotli is used only when the `brotli` package is installed,
+zstd only when Python is built with it.
+
+Bodies smaller than `app.compression.minimum_size` are sent as they are, the framing costs more
+than it saves. A strong ETag of a compressed body gets the encoding as a suffix, `"3"` becomes
+`"3-gzip"`, the bytes differ from the uncompressed ones and a strong validator must tell them apart.
+The suffix is removed again from the `If-Match` and `If-None-Match` values, see `strip_etag_encoding`.
+Bodies from `app.compression.thread_size` up are compressed in a worker thread, the
+compressors release the GIL and the event loop keeps serving meanwhile. Streamed bodies, the exports
+and the events, are never compressed.
+"""
+
+import asyncio
+import gzip
+from collections.abc import Awaitable, Callable
+
+from blacksheep import Application, Content, Request, Response
+
+from opum_ledger.core.content import header_qualities
+from opum_ledger.settings import CompressionSettings, Settings
+
+try:
+    from compression import zstd
+except ImportError:  # pragma: no cover
+    zstd = None
+
+try:
+    import brotli  # pyright: ignore[reportMissingImports]
+except ImportError:  # pragma: no cover
+    brotli = None
+
+# Media types worth compressing, the others (images, archives) are compressed already.
+COMPRESSIBLE_TYPES = (b"application/json", b"application/x-ndjson", b"application/msgpack", b"text/")
+
+# All the encodings the ETag suffixes can name, whether the compressor is available or not.
+ENCODINGS = (b"zstd", b"br", b"gzip")
+
+Compressor = Callable[[bytes], bytes]
+
+
+def compressors(settings: CompressionSettings) -> dict[bytes, Compressor]:
+    """Return the compressors by encoding, in the order of preference."""
+    available: dict[bytes, Compressor] = {}
+    if zstd is not None:
+        available[b"zstd"] = lambda data: zstd.compress(data, level=settings.zstd_level)
+    if brotli is not None:
+        available[b"br"] = lambda data: brotli.compress(data, quality=settings.brotli_quality)  # pyright: ignore
+    available[b"gzip"] = lambda data: gzip.compress(data, compresslevel=settings.gzip_level, mtime=0)
+    return available
+
+
+def negotiate_encoding(accept_encoding: bytes, available: list[bytes]) -> bytes | None:
+    """Return the encoding to use for the `Accept-Encoding` value, `None` to send the body as it is.
+
+    `available` is in the order of preference, used between the encodings of the same quality.
+    """
+    qualities = header_qualities(accept_encoding)
+    wildcard = qualities.get(b"*", 0.0)
+    best: bytes | None = None
+    best_quality = 0.0
+    for encoding in available:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+def encoded_etag(etag: bytes, encoding: bytes) -> bytes:
+    """Return the ETag of the body compressed with `encoding`, weak ETags are kept as they are."""
+    if etag.startswith(b"W/") or not etag.endswith(b'"'):
+        return etag
+    return etag[:-1] + b"-" + encoding + b'"'
+
+
+def strip_etag_encoding(etag: str) -> str:
+    """Remove the encoding suffix added by `encoded_etag`, to compare the ETag with the uncompressed one."""
+    for encoding in ENCODINGS:
+        suffix = f'-{encoding.decode()}"'
+        if etag.endswith(suffix):
+            return etag.removesuffix(suffix) + '"'
+    return etag
+
+
+def use_compression(app: Application, settings: Settings) -> None:
+    config = settings.app.compression
+    if not config.enabled:
+        return
+
+    available = compressors(config)
+    preference = list(available)
+
+    async def compression_middleware(
+        request: Request,
+        handler: Callable[[Request], Awaitable[Response]],
+    ) -> Response:
+        response = await handler(request)
+
+        content = response.content
+        if content is None or content.body is None or len(content.body) < config.minimum_size:
+            return response
+        if response.has_header(b"Content-Encoding") or not content.type.startswith(COMPRESSIBLE_TYPES):
+            return response
+        response.add_header(b"Vary", b"Accept-Encoding")
+
+        accept_encoding = request.get_first_header(b"Accept-Encoding")
+        encoding = negotiate_encoding(accept_encoding, preference) if accept_encoding else None
+        if encoding is None:
+            return response
+
+        compress = available[encoding]
+        if len(content.body) >= config.thread_size:
+            body = await asyncio.to_thread(compress, content.body)
+        else:
+            body = compress(content.body)
+        response.content = Content(content.type, body)
+        response.add_header(b"Content-Encoding", encoding)
+        etag = response.get_first_header(b"ETag")
+        if etag is not None:
+            response.set_header(b"ETag", encoded_etag(etag, encoding))
+        return response
+
+    app.middlewares.append(compression_middleware)
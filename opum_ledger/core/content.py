@@ -0,0 +1,108 @@
+"""Content negotiation of the API, JSON or MessagePack.
+
+A request sent with `Accept: application/msgpack` gets its `api_response` bodies in MessagePack,
+with the UUIDs as 16 bytes binaries and the datetimes as MessagePack timestamps instead of their
+text forms. Request bodies are read as MessagePack when sent with `Content-Type: application/msgpack`,
+see `FromJSONBody`. JSON stays the default and the format of the errors.
+"""
+
+import dataclasses
+from collections.abc import Awaitable, Callable
+from contextvars import ContextVar
+from datetime import UTC, date, datetime
+from decimal import Decimal
+from enum import Enum
+from typing import Any
+from uuid import UUID
+
+import msgpack
+from blacksheep import Application, Content, Request, Response
+from pydantic import BaseModel
+
+from opum_ledger.core.json import default, json_response
+
+MSGPACK = b"application/msgpack"
+MSGPACK_TYPES = (MSGPACK, b"application/x-msgpack", b"application/vnd.msgpack")
+
+# Whether the responses of the current request are written in MessagePack, set by the negotiation middleware.
+_msgpack_responses: ContextVar[bool] = ContextVar("msgpack_responses", default=False)
+
+
+def header_qualities(value: bytes) -> dict[bytes, float]:
+    """Return the quality of every item of an `Accept` like header, by lowercase item."""
+    qualities: dict[bytes, float] = {}
+    for item in value.lower().split(b","):
+        name, *parameters = item.split(b";")
+        quality = 1.0
+        for parameter in parameters:
+            key, _, number = parameter.partition(b"=")
+            if key.strip() == b"q":
+                try:
+                    quality = float(number)
+                except ValueError:
+                    quality = 0.0
+        qualities[name.strip()] = quality
+    return qualities
+
+
+def accepts_msgpack(accept: bytes) -> bool:
+    """Tell whether the `Accept` value prefers MessagePack to JSON, JSON wins the ties."""
+    qualities = header_qualities(accept)
+    msgpack_quality = max(qualities.get(media_type, 0.0) for media_type in MSGPACK_TYPES)
+    json_quality = qualities.get(b"application/json", qualities.get(b"application/*", qualities.get(b"*/*", 0.0)))
+    return msgpack_quality > json_quality
+
+
+def msgpack_default(obj: Any) -> Any:  # pyright: ignore[reportExplicitAny, reportAny]
+    """Convert the values MessagePack has no type for, keeping UUIDs and datetimes binary.
+
+    Models are dumped with the options of `dump_json`, so both formats have the same field names.
+    """
+    if isinstance(obj, BaseModel):
+        return obj.model_dump()
+    if isinstance(obj, UUID):
+        return obj.bytes
+    if isinstance(obj, datetime):
+        return msgpack.Timestamp.from_datetime(obj if obj.tzinfo else obj.replace(tzinfo=UTC))
+    if isinstance(obj, date):
+        return obj.isoformat()
+    if isinstance(obj, Enum):
+        return obj.value  # pyright: ignore[reportAny]
+    if isinstance(obj, Decimal):
+        return str(obj)
+    if dataclasses.is_dataclass(obj) and not isinstance(obj, type):
+        return {field.name: getattr(obj, field.name) for field in dataclasses.fields(obj)}  # pyright: ignore[reportAny]
+    return default(obj)
+
+
+def dump_msgpack(obj: Any) -> bytes:  # pyright: ignore[reportExplicitAny, reportAny]
+    return msgpack.packb(obj, default=msgpack_default)  # pyright: ignore[reportUnknownMemberType, reportReturnType]
+
+
+def load_msgpack(data: bytes) -> Any:  # pyright: ignore[reportExplicitAny, reportAny]
+    """Read a MessagePack body, timestamps become UTC datetimes and binaries stay bytes for the UUIDs."""
+    return msgpack.unpackb(data, timestamp=3)  # pyright: ignore[reportUnknownMemberType, reportAny]
+
+
+def api_response(obj: Any, status: int = 200) -> Response:  # pyright: ignore[reportExplicitAny, reportAny]
+    """Return a response with the body in the format negotiated for the request, JSON by default."""
+    if _msgpack_responses.get():
+        return Response(status, None, Content(MSGPACK, dump_msgpack(obj)))
+    return json_response(obj, status)
+
+
+def use_content_negotiation(app: Application) -> None:
+    async def content_negotiation_middleware(
+        request: Request,
+        handler: Callable[[Request], Awaitable[Response]],
+    ) -> Response:
+        accept = request.get_first_header(b"Accept")
+        token = _msgpack_responses.set(accept is not None and accepts_msgpack(accept))
+        try:
+            response = await handler(request)
+        finally:
+            _msgpack_responses.reset(token)
+        response.add_header(b"Vary", b"Accept")
+        return response
+
+    app.middlewares.append(content_negotiation_middleware)
@@ -14,7 +14,7 @@ from essentials.exceptions import (
 )
 from pydantic import ValidationError
 
-from opum_ledger.core.exceptions import PreconditionFailed
+from opum_ledger.core.exceptions import InvalidContent, PayloadTooLarge, PreconditionFailed
 from opum_ledger.core.logging import logger
 
 
@@ -150,6 +150,26 @@ def configure_error_handlers(app: Application) -> None:  # noqa: C901
             status=412,
         )
 
+    async def payload_too_large_error(_app: Application, _request: Request, exception: PayloadTooLarge) -> Response:
+        logger.debug("Payload Too Large ERROR", exc_info=exception)
+        return pretty_json(
+            {
+                "detail": str(exception) or "Payload too large",
+                "status_code": 413,
+            },
+            status=413,
+        )
+
+    async def invalid_content_error(_app: Application, _request: Request, exception: InvalidContent) -> Response:
+        logger.debug("Invalid content ERROR", exc_info=exception)
+        return pretty_json(
+            {
+                "detail": str(exception) or "Invalid content",
+                "status_code": 400,
+            },
+            status=400,
+        )
+
     app.exceptions_handlers.update(
         {
             500: server_error,
@@ -164,5 +184,7 @@ def configure_error_handlers(app: Application) -> None:  # noqa: C901
             InvalidRequestBody: invalid_body_error,
             ConflictException: conflict_error,
             PreconditionFailed: precondition_failed_error,
+            PayloadTooLarge: payload_too_large_error,
+            InvalidContent: invalid_content_error,
         }
     )
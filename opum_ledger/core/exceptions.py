@@ -6,3 +6,17 @@ class PreconditionFailed(Exception):
 
     def __init__(self, message="Precondition failed") -> None:
         super().__init__(message)
+
+
+class PayloadTooLarge(Exception):
+    """Exception raised when a request body exceeds the allowed size."""
+
+    def __init__(self, message="Payload too large") -> None:
+        super().__init__(message)
+
+
+class InvalidContent(Exception):
+    """Exception raised when a request body can not be read in the expected format."""
+
+    def __init__(self, message="Invalid content") -> None:
+        super().__init__(message)
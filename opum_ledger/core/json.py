@@ -5,6 +5,8 @@ from decimal import Decimal
 from typing import Any
 
 import orjson
+import pydantic_core
+from blacksheep import Content, Response
 from blacksheep.settings.json import json_settings
 from pendulum import Date, DateTime, Time
 from pydantic import BaseModel
@@ -55,6 +57,20 @@ def loads(obj: str) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
     return orjson.loads(obj)  # pyright: ignore[reportAny]
 
 
+def dump_json(obj: Any) -> bytes:  # pyright: ignore[reportExplicitAny, reportAny]
+    """Serialize to JSON bytes with pydantic-core.
+
+    Pydantic models, also inside lists, dicts and dataclasses, are written by their compiled
+    serializers without building the intermediate dicts `default` builds for orjson.
+    """
+    return pydantic_core.to_json(obj, bytes_mode="base64", fallback=default)
+
+
+def json_response(obj: Any, status: int = 200) -> Response:  # pyright: ignore[reportExplicitAny, reportAny]
+    """Return a JSON response with the body serialized straight to bytes, see `dump_json`."""
+    return Response(status, None, Content(b"application/json", dump_json(obj)))
+
+
 def use_orjson() -> None:
     """Enable orjson for JSON serialization."""
     json_settings.use(  # pyright: ignore[reportUnknownMemberType]
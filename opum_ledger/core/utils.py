@@ -1,5 +1,7 @@
 from itertools import accumulate
 
+from pydantic import ValidationError
+
 
 def split_path(path: str) -> list[str]:
     return list(
@@ -8,3 +10,10 @@ def split_path(path: str) -> list[str]:
             lambda x, y: f"{x}:{y}",
         )
     )
+
+
+def format_validation_error(error: ValidationError) -> str:
+    """Format validation errors into a single line message, like `details: Transaction is not balanced`."""
+    return "; ".join(
+        f"{'.'.join(str(loc) for loc in item['loc']) or 'value'}: {item['msg']}" for item in error.errors()
+    )
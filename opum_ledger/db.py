@@ -3,6 +3,8 @@ from blacksheep.server.application import Application
 from pymongo import AsyncMongoClient
 
 from opum_ledger.models.accounts import AccountModel
+from opum_ledger.models.balances import BalanceModel
+from opum_ledger.models.changes import ChangeModel, LedgerSequenceModel
 from opum_ledger.models.commodities import CommodityModel
 from opum_ledger.models.ledger import LedgerModel
 from opum_ledger.models.transactions import TransactionModel
@@ -13,6 +15,9 @@ DOCUMENT_MODELS: list[type[Document]] = [
     LedgerModel,
     AccountModel,
     TransactionModel,
+    BalanceModel,
+    ChangeModel,
+    LedgerSequenceModel,
 ]
 
 
@@ -1,25 +1,36 @@
 """Domain layer for account management in the ledger system."""
 
+import time
 from collections import defaultdict
+from collections.abc import Iterable
+from dataclasses import dataclass
 from datetime import datetime
+from typing import NoReturn
 from uuid import uuid7
 
 import pendulum
 from beanie import UpdateResponse
 from beanie.odm.operators.find.comparison import In
-from beanie.odm.operators.update.general import Set
+from beanie.odm.operators.update.general import Inc, Set
 from beanie.odm.queries.find import FindMany
 from essentials.exceptions import ConflictException, ObjectNotFound
-from pydantic import BaseModel, ConfigDict, TypeAdapter, field_validator, model_validator
+from pydantic import BaseModel, ConfigDict, field_validator, model_validator
 from pymongo.errors import DuplicateKeyError
-from pymongo.results import UpdateResult
 
+from opum_ledger.core.adapters import type_adapter
 from opum_ledger.core.exceptions import PreconditionFailed
 from opum_ledger.core.services import add_service
 from opum_ledger.core.utils import split_path
+from opum_ledger.domain.base import Fieldset, LedgerCache, api_projection
+from opum_ledger.domain.changes import ChangesDAL
+from opum_ledger.domain.details import set_account_path
 from opum_ledger.domain.types.account import AccountName, AccountPath, AccountUUID
+from opum_ledger.domain.types.change import ChangeEntity, ChangeOperation
 from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.revision import Revision
 from opum_ledger.models.accounts import AccountModel
+from opum_ledger.models.base import revision_match
+from opum_ledger.settings import Settings
 
 ROOT_PATH = [
     "Assets",
@@ -56,6 +67,7 @@ class Account(NewAccount):
     id: AccountUUID
     created_at: datetime
     updated_at: datetime
+    revision: Revision
 
 
 class AccountUpdate(BaseModel):
@@ -78,10 +90,62 @@ class AccountUpdate(BaseModel):
         return self
 
 
+# Listed accounts are read as raw documents and validated once into `Account`.
+ACCOUNT_PROJECTION = api_projection(Account)
+ACCOUNTS_ADAPTER = type_adapter(list[Account])
+
+
+@dataclass(frozen=True)
+class LedgerAccountsIndex:
+    """Ids of the ledger accounts by every prefix of their path.
+
+    An account `Expenses:Food:Lunch` is indexed under `Expenses`, `Expenses:Food` and
+    `Expenses:Food:Lunch`, the same way `AccountModel.paths` is matched in the database.
+    """
+
+    ids_by_path: dict[AccountPath, list[AccountUUID]]
+    accounts: dict[AccountUUID, Account]
+    loaded_at: float
+
+    @classmethod
+    def build(cls, accounts: Iterable[Account]) -> "LedgerAccountsIndex":
+        ids_by_path: dict[AccountPath, list[AccountUUID]] = defaultdict(list)
+        accounts_by_id: dict[AccountUUID, Account] = {}
+        for account in accounts:
+            accounts_by_id[account.id] = account
+            for path in account.paths:
+                ids_by_path[path].append(account.id)
+        return cls(ids_by_path=dict(ids_by_path), accounts=accounts_by_id, loaded_at=time.monotonic())
+
+    def resolve(self, paths: Iterable[AccountPath]) -> list[AccountUUID]:
+        """Return the ids of the accounts with any of the paths or under them."""
+        ids: dict[AccountUUID, None] = {}
+        for path in paths:
+            ids.update(dict.fromkeys(self.ids_by_path.get(path, [])))
+        return list(ids)
+
+
+@add_service(scope="singleton")
+class AccountsCache(LedgerCache[LedgerAccountsIndex]):
+    """In-process cache of the ledger accounts indexes.
+
+    The least recently used ledgers are evicted above `app.accounts_cache_size` ledgers.
+    Writes through `AccountsDAL` invalidate the ledger in this process, other processes
+    pick up the change after `app.accounts_cache_ttl` seconds.
+    """
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings.app.accounts_cache_size, settings.app.accounts_cache_ttl)
+
+
 @add_service(scope="scoped")
 class AccountsDAL:
     __model__ = AccountModel
 
+    def __init__(self, cache: AccountsCache, changes: ChangesDAL):
+        self.cache: AccountsCache = cache
+        self.changes: ChangesDAL = changes
+
     async def create_account(
         self,
         ledger_id: LedgerUUID,
@@ -100,6 +164,8 @@ class AccountsDAL:
         except DuplicateKeyError as e:
             raise ConflictException("Duplicate account in the ledger already exists") from e
 
+        self.cache.invalidate(ledger_id)
+        _ = await self.changes.record(ledger_id, ChangeEntity.ACCOUNT, ChangeOperation.CREATED, [account.id])
         return Account.model_validate(account)
 
     async def get_by_id(self, account_id: AccountUUID) -> Account:
@@ -127,7 +193,9 @@ class AccountsDAL:
         self,
         ledger_id: LedgerUUID,
         paths: list[AccountPath] | None = None,
+        fieldset: Fieldset[Account] | None = None,
     ) -> list[Account]:
+        """Return the ledger accounts, with only the fields of `fieldset` if it is given."""
         request: FindMany[AccountModel] = AccountModel.find(
             AccountModel.ledger_id == ledger_id,
             AccountModel.deleted_at == None,  # noqa E711
@@ -136,78 +204,146 @@ class AccountsDAL:
             request = request.find(
                 In(AccountModel.paths, paths),
             )
-        accounts = await request.to_list()
-        return TypeAdapter(list[Account]).validate_python(accounts)
+        projection = fieldset.projection if fieldset else ACCOUNT_PROJECTION
+        accounts = await AccountModel.get_pymongo_collection().find(request.get_filter_query(), projection).to_list()
+        if fieldset:
+            return fieldset.validate(accounts)
+        return ACCOUNTS_ADAPTER.validate_python(accounts)
 
-    async def update_ledger_account(
+    async def get_ledger_accounts_by_ids(
         self,
         ledger_id: LedgerUUID,
-        account_id: AccountUUID,
-        updated_account: AccountUpdate,
-        updated_at: pendulum.DateTime | None = None,
-    ) -> Account:
-        account_query = AccountModel.find_one(
-            AccountModel.id == account_id,
+        ids: Iterable[AccountUUID],
+    ) -> list[Account]:
+        """Return the ledger accounts with the ids in one query, soft deleted ones included."""
+        ids = list(ids)
+        if not ids:
+            return []
+        accounts = (
+            await AccountModel.get_pymongo_collection()
+            .find({"_id": {"$in": ids}, "ledger_id": ledger_id}, ACCOUNT_PROJECTION)
+            .to_list()
+        )
+        return ACCOUNTS_ADAPTER.validate_python(accounts)
+
+    async def get_ledger_subtree_accounts(
+        self,
+        ledger_id: LedgerUUID,
+        path: AccountPath,
+    ) -> list[Account]:
+        """Return the account with the path and all the accounts under it, ordered by path."""
+        request = AccountModel.find(
             AccountModel.ledger_id == ledger_id,
+            AccountModel.paths == path,
             AccountModel.deleted_at == None,  # noqa E711
         )
-        account = await account_query
-        if not account:
-            raise ObjectNotFound
+        accounts = (
+            await AccountModel.get_pymongo_collection()
+            .find(request.get_filter_query(), ACCOUNT_PROJECTION, sort=[("path", 1)])
+            .to_list()
+        )
+        return ACCOUNTS_ADAPTER.validate_python(accounts)
 
-        if updated_at and pendulum.instance(account.updated_at) > updated_at:
-            raise PreconditionFailed("Account has been modified since the provided timestamp.")
+    async def get_ledger_accounts_index(
+        self,
+        ledger_id: LedgerUUID,
+    ) -> LedgerAccountsIndex:
+        """Return the ledger accounts index, from the cache if it is there."""
+        index = self.cache.get(ledger_id)
+        if index is None:
+            generation = self.cache.generation
+            index = LedgerAccountsIndex.build(await self.get_ledger_accounts(ledger_id))
+            self.cache.put(ledger_id, index, generation)
+        return index
 
+    async def update_ledger_account(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+        updated_account: AccountUpdate,
+        revision: int | None = None,
+    ) -> Account:
+        """Update the account with a single `find_one_and_update`.
+
+        If `revision` is given, the account is updated only if it is still at that revision.
+        """
         update_data = updated_account.model_dump(exclude_unset=True)
         update_data["updated_at"] = pendulum.now("UTC")
         if "path" in update_data:
             update_data["paths"] = AccountModel.parse_path(update_data["path"])
 
-        if updated_at is not None:
-            account_query = account_query.find_one(
-                AccountModel.updated_at == updated_at,
-            )
-
-        update_result: UpdateResult = await account_query.update(  # pyright: ignore[reportGeneralTypeIssues]
-            Set(update_data),
-            response_type=UpdateResponse.UPDATE_RESULT,
+        account_query = AccountModel.find_one(
+            AccountModel.id == account_id,
+            AccountModel.ledger_id == ledger_id,
+            AccountModel.deleted_at == None,  # noqa E711
         )
+        if revision is not None:
+            account_query = account_query.find_one(revision_match(revision))
 
-        if update_result.matched_count == 0:
-            raise PreconditionFailed("Account has been modified since the provided timestamp.")
+        try:
+            account: AccountModel | None = await account_query.update(  # pyright: ignore[reportGeneralTypeIssues]
+                Set(update_data),
+                Inc({AccountModel.revision: 1}),
+                response_type=UpdateResponse.NEW_DOCUMENT,
+            )
+        except DuplicateKeyError as e:
+            raise ConflictException("Duplicate account in the ledger already exists") from e
 
-        return await self.get_by_id(account_id)
+        if account is None:
+            await self._raise_not_written(ledger_id, account_id, revision)
+
+        self.cache.invalidate(ledger_id)
+        _ = await self.changes.record(ledger_id, ChangeEntity.ACCOUNT, ChangeOperation.UPDATED, [account_id])
+        if "path" in update_data:
+            transaction_ids = await set_account_path(ledger_id, account_id, account.path)
+            if transaction_ids:
+                _ = await self.changes.record(
+                    ledger_id, ChangeEntity.TRANSACTION, ChangeOperation.UPDATED, transaction_ids
+                )
+        return Account.model_validate(account)
 
     async def delete_ledger_account(
         self,
         ledger_id: LedgerUUID,
         account_id: AccountUUID,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ):
         account_query = AccountModel.find_one(
             AccountModel.id == account_id,
             AccountModel.ledger_id == ledger_id,
             AccountModel.deleted_at == None,  # noqa E711
         )
-        account = await account_query
-        if not account:
-            raise ObjectNotFound
+        if revision is not None:
+            account_query = account_query.find_one(revision_match(revision))
 
-        if updated_at and pendulum.instance(account.updated_at) > updated_at:
-            raise PreconditionFailed("Account has been modified since the provided timestamp.")
-
-        if updated_at is not None:
-            account_query = account_query.find_one(
-                AccountModel.updated_at == updated_at,
-            )
-
-        account_update_result: UpdateResult = await account_query.update(  # pyright: ignore[reportGeneralTypeIssues]
-            Set({"deleted_at": pendulum.now()}),
-            response_type=UpdateResponse.UPDATE_RESULT,
+        account: AccountModel | None = await account_query.update(  # pyright: ignore[reportGeneralTypeIssues]
+            Set({"deleted_at": pendulum.now("UTC")}),
+            Inc({AccountModel.revision: 1}),
+            response_type=UpdateResponse.NEW_DOCUMENT,
         )
+        if account is None:
+            await self._raise_not_written(ledger_id, account_id, revision)
 
-        if account_update_result.matched_count == 0:
-            raise PreconditionFailed("Account has been modified since the provided timestamp.")
+        self.cache.invalidate(ledger_id)
+        _ = await self.changes.record(ledger_id, ChangeEntity.ACCOUNT, ChangeOperation.DELETED, [account_id])
+
+    @staticmethod
+    async def _raise_not_written(
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+        revision: int | None,
+    ) -> NoReturn:
+        """Raise why a conditional write matched no account, only called on the failure path."""
+        if (
+            revision is not None
+            and await AccountModel.find(
+                AccountModel.id == account_id,
+                AccountModel.ledger_id == ledger_id,
+                AccountModel.deleted_at == None,  # noqa E711
+            ).exists()
+        ):
+            raise PreconditionFailed(f"Account has been modified since revision {revision}")
+        raise ObjectNotFound
 
 
 @add_service(scope="scoped")
@@ -230,25 +366,33 @@ class AccountsBL:
         ledger_id: LedgerUUID,
         account_id: AccountUUID,
         updated_account: AccountUpdate,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ) -> Account:
         return await self.dal.update_ledger_account(
             ledger_id,
             account_id,
             updated_account,
-            updated_at=updated_at,
+            revision=revision,
         )
 
     async def get_ledger_accounts(
         self,
         ledger_id: LedgerUUID,
         paths: list[AccountPath] | None = None,
+        fieldset: Fieldset[Account] | None = None,
     ) -> list[Account]:
         return await self.dal.get_ledger_accounts(
             ledger_id=ledger_id,
             paths=paths,
+            fieldset=fieldset,
         )
 
+    async def get_ledger_accounts_index(
+        self,
+        ledger_id: LedgerUUID,
+    ) -> LedgerAccountsIndex:
+        return await self.dal.get_ledger_accounts_index(ledger_id)
+
     async def get_ledger_account(
         self,
         ledger_id: LedgerUUID,
@@ -260,25 +404,40 @@ class AccountsBL:
         )
         return account
 
+    async def get_ledger_accounts_by_ids(
+        self,
+        ledger_id: LedgerUUID,
+        ids: Iterable[AccountUUID],
+    ) -> list[Account]:
+        return await self.dal.get_ledger_accounts_by_ids(ledger_id, ids)
+
     async def delete_ledger_account(
         self,
         ledger_id: LedgerUUID,
         account_id: AccountUUID,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ):
         await self.dal.delete_ledger_account(
             ledger_id=ledger_id,
             account_id=account_id,
-            updated_at=updated_at,
+            revision=revision,
         )
 
     async def get_ledger_accounts_tree(
         self,
         ledger_id: LedgerUUID,
+        path: AccountPath | None = None,
     ) -> dict[str, list[Account]]:
-        accounts = await self.get_ledger_accounts(
-            ledger_id=ledger_id,
-        )
+        """Group the ledger accounts by path, only the subtree under `path` if it is given."""
+        if path:
+            accounts = await self.dal.get_ledger_subtree_accounts(
+                ledger_id=ledger_id,
+                path=path.strip(":"),
+            )
+        else:
+            accounts = await self.get_ledger_accounts(
+                ledger_id=ledger_id,
+            )
         tree = defaultdict(list)
         for account in accounts:
             tree[account.path].append(account)
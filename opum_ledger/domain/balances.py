@@ -0,0 +1,197 @@
+"""Domain layer for materialized account balances.
+
+The balances are updated by a separate bulk write after each transactions write, the deployed
+MongoDB is a standalone server without multi-document transactions. A process stopped between the
+two writes leaves the balances of the written accounts off by the deltas of that write. The drift
+is found by `get_account_drift`, exposed by the account balance endpoint with `verify=true`, and
+repaired by rebuilding the balances from the transactions:
+
+    python -m opum_ledger.manage recompute-balances [--ledger-id LEDGER_ID]
+"""
+
+from collections import defaultdict
+from collections.abc import Iterable
+from typing import Any
+
+import pendulum
+from pymongo import UpdateOne
+
+from opum_ledger.core.services import add_service
+from opum_ledger.domain.types.account import AccountUUID
+from opum_ledger.domain.types.commodity import CommodityUUID
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.transaction import AccountBalance, Detail
+from opum_ledger.models.balances import BalanceModel
+from opum_ledger.models.base import bson_datetime
+from opum_ledger.models.transactions import TransactionModel
+
+BalanceKey = tuple[AccountUUID, CommodityUUID]
+
+
+def details_deltas(details: Iterable[Detail], sign: int = 1) -> dict[BalanceKey, int]:
+    """Sum transaction details into signed per account and commodity deltas.
+
+    Args:
+        details: The transaction details.
+        sign: 1 to add the details to the balances, -1 to subtract them.
+
+    """
+    deltas: dict[BalanceKey, int] = defaultdict(int)
+    for detail in details:
+        deltas[(detail.account_id, detail.amount.commodity_id)] += sign * detail.amount.amount
+    return deltas
+
+
+def merge_deltas(*deltas: dict[BalanceKey, int]) -> dict[BalanceKey, int]:
+    """Merge several deltas into one, dropping the keys that cancel out."""
+    merged: dict[BalanceKey, int] = defaultdict(int)
+    for delta in deltas:
+        for key, amount in delta.items():
+            merged[key] += amount
+    return {key: amount for key, amount in merged.items() if amount != 0}
+
+
+@add_service(scope="scoped")
+class BalancesDAL:
+    __model__ = BalanceModel
+
+    async def apply_deltas(
+        self,
+        ledger_id: LedgerUUID,
+        deltas: dict[BalanceKey, int],
+    ) -> None:
+        """Apply signed deltas to the materialized balances in one bulk write.
+
+        Every balance row is updated with an atomic `$inc`, rows are created on first use.
+        """
+        deltas = {key: amount for key, amount in deltas.items() if amount != 0}
+        if not deltas:
+            return
+
+        now = pendulum.now("UTC")
+        operations = [
+            UpdateOne(
+                {
+                    "ledger_id": ledger_id,
+                    "account_id": account_id,
+                    "commodity_id": commodity_id,
+                },
+                {
+                    "$inc": {"balance": amount},
+                    "$set": {"updated_at": now},
+                },
+                upsert=True,
+            )
+            for (account_id, commodity_id), amount in deltas.items()
+        ]
+        await BalanceModel.get_pymongo_collection().bulk_write(operations, ordered=False)
+
+    async def get_account_balance(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+    ) -> list[AccountBalance]:
+        balances = await BalanceModel.find(
+            BalanceModel.ledger_id == ledger_id,
+            BalanceModel.account_id == account_id,
+        ).to_list()
+        return [
+            AccountBalance.model_validate(
+                {
+                    "_id": balance.commodity_id,
+                    "balance": balance.balance,
+                }
+            )
+            for balance in balances
+        ]
+
+    async def get_account_drift(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+    ) -> dict[CommodityUUID, int]:
+        """Compare the materialized balances of the account with its transactions.
+
+        The balances are summed from the account details, over the whole account history.
+
+        Returns:
+            The materialized balance minus the sum of the details, for the commodities where they differ.
+
+        """
+        materialized = {
+            balance.id: balance.balance for balance in await self.get_account_balance(ledger_id, account_id)
+        }
+        documents: list[dict[str, Any]] = await TransactionModel.aggregate(  # pyright: ignore[reportExplicitAny]
+            [
+                {"$match": {"ledger_id": ledger_id, "details.account_id": account_id, "deleted_at": None}},
+                {"$unwind": "$details"},
+                {"$match": {"details.account_id": account_id}},
+                {"$group": {"_id": "$details.amount.commodity_id", "balance": {"$sum": "$details.amount.amount"}}},
+            ]
+        ).to_list()
+        computed = {document["_id"]: document["balance"] for document in documents}
+        drift = {
+            commodity_id: materialized.get(commodity_id, 0) - computed.get(commodity_id, 0)
+            for commodity_id in materialized.keys() | computed.keys()
+        }
+        return {commodity_id: amount for commodity_id, amount in drift.items() if amount != 0}
+
+    async def recompute(self, ledger_id: LedgerUUID | None = None) -> int:
+        """Rebuild the materialized balances from the transactions.
+
+        The balances are replaced in place by a `$merge` and only then the balances this run did not
+        write, older than its start, are deleted. Readers never see a ledger without balances and
+        the rows updated by the transaction writes during the rebuild are kept.
+
+        Args:
+            ledger_id: Rebuild only the balances of this ledger. All ledgers are rebuilt if omitted.
+
+        Returns:
+            The number of balance documents after the rebuild.
+
+        """
+        started = bson_datetime(pendulum.now("UTC"))
+        match: dict[str, Any] = {"deleted_at": None}  # pyright: ignore[reportExplicitAny]
+        balances: dict[str, Any] = {}  # pyright: ignore[reportExplicitAny]
+        if ledger_id is not None:
+            match["ledger_id"] = ledger_id
+            balances["ledger_id"] = ledger_id
+
+        await TransactionModel.aggregate(
+            [
+                {"$match": match},
+                {"$unwind": "$details"},
+                {
+                    "$group": {
+                        "_id": {
+                            "ledger_id": "$ledger_id",
+                            "account_id": "$details.account_id",
+                            "commodity_id": "$details.amount.commodity_id",
+                        },
+                        "balance": {"$sum": "$details.amount.amount"},
+                    }
+                },
+                {
+                    "$project": {
+                        "_id": 0,
+                        "ledger_id": "$_id.ledger_id",
+                        "account_id": "$_id.account_id",
+                        "commodity_id": "$_id.commodity_id",
+                        "balance": 1,
+                        "updated_at": {"$literal": started},
+                    }
+                },
+                {
+                    "$merge": {
+                        "into": BalanceModel.Settings.name,
+                        "on": ["ledger_id", "account_id", "commodity_id"],
+                        "whenMatched": "replace",
+                        "whenNotMatched": "insert",
+                    }
+                },
+            ]
+        ).to_list()
+
+        collection = BalanceModel.get_pymongo_collection()
+        await collection.delete_many({**balances, "updated_at": {"$lt": started}})
+        return await collection.count_documents(balances)
@@ -0,0 +1,126 @@
+"""Helpers shared by the data access layers."""
+
+import time
+from collections import OrderedDict
+from collections.abc import Iterable
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Any, Generic, Protocol, TypeVar
+
+from pydantic import BaseModel, TypeAdapter, create_model
+
+from opum_ledger.domain.types.ledger import LedgerUUID
+
+M = TypeVar("M", bound=BaseModel)
+
+# Number of fieldsets whose model and validator are kept, they are built on the first request of a fieldset.
+SPARSE_MODELS_CACHE_SIZE = 128
+
+
+def _projection(fields: Iterable[str]) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+    projection: dict[str, Any] = {name: 1 for name in fields if name != "id"}  # pyright: ignore[reportExplicitAny]
+    projection["_id"] = 0
+    projection["id"] = "$_id"
+    return projection
+
+
+def api_projection(model: type[BaseModel]) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+    """Return the projection of the documents on the fields of an API model, with `_id` as `id`.
+
+    Raw documents read with it are validated once into the API model, without building
+    the Beanie documents first.
+    """
+    return _projection(model.model_fields)
+
+
+@lru_cache(maxsize=SPARSE_MODELS_CACHE_SIZE)
+def _sparse_adapter(model: type[BaseModel], fields: frozenset[str]) -> TypeAdapter[list[BaseModel]]:
+    """Return the adapter of a list of a model with only the `fields` of the API model, in the same order."""
+    definitions: dict[str, Any] = {  # pyright: ignore[reportExplicitAny]
+        name: (info.annotation, info) for name, info in model.model_fields.items() if name in fields
+    }
+    sparse = create_model(model.__name__, __config__=model.model_config, **definitions)  # pyright: ignore
+    return TypeAdapter(list[sparse])
+
+
+@dataclass(frozen=True)
+class Fieldset(Generic[M]):
+    """Fields of an API model asked with the `fields` query parameter.
+
+    Documents are read projected on the fields and validated into a model with only these fields,
+    the other fields are neither read, decoded nor serialized. The validated models are not
+    instances of the API model, they are only meant to be serialized.
+    """
+
+    model: type[M]
+    fields: frozenset[str]
+
+    @classmethod
+    def parse(cls, model: type[M], value: str, required: Iterable[str] = ("id",)) -> "Fieldset[M]":
+        """Parse a comma separated list of fields, the `required` ones are always included.
+
+        Raises:
+            ValueError: If a field is not a field of the model.
+
+        """
+        fields = {name.strip() for name in value.split(",") if name.strip()}
+        unknown = fields - model.model_fields.keys()
+        if unknown:
+            raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+        return cls(model, frozenset(fields.union(required)))
+
+    @property
+    def projection(self) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+        return _projection(self.fields)
+
+    def validate(self, documents: list[dict[str, Any]]) -> list[Any]:  # pyright: ignore[reportExplicitAny]
+        """Validate the documents read with `projection`."""
+        return _sparse_adapter(self.model, self.fields).validate_python(documents)
+
+
+class LedgerValue(Protocol):
+    @property
+    def loaded_at(self) -> float: ...
+
+
+V = TypeVar("V", bound=LedgerValue)
+
+
+class LedgerCache(Generic[V]):
+    """In-process cache of a value per ledger, loaded from the database at `loaded_at`.
+
+    The least recently used ledgers are evicted above `max_size` ledgers and the values are
+    dropped `ttl` seconds after they were loaded.
+    """
+
+    def __init__(self, max_size: int, ttl: float):
+        self.max_size: int = max_size
+        self.ttl: float = ttl
+        self.generation: int = 0
+        self._ledgers: OrderedDict[LedgerUUID, V] = OrderedDict()
+
+    def get(self, ledger_id: LedgerUUID) -> V | None:
+        value = self._ledgers.get(ledger_id)
+        if value is None:
+            return None
+        if time.monotonic() - value.loaded_at > self.ttl:
+            del self._ledgers[ledger_id]
+            return None
+        self._ledgers.move_to_end(ledger_id)
+        return value
+
+    def put(self, ledger_id: LedgerUUID, value: V, generation: int) -> None:
+        """Cache the value loaded when the cache was at `generation`.
+
+        The value is dropped if any ledger was invalidated meanwhile, it may miss that write.
+        """
+        if generation != self.generation or self.max_size <= 0:
+            return
+        self._ledgers[ledger_id] = value
+        self._ledgers.move_to_end(ledger_id)
+        while len(self._ledgers) > self.max_size:
+            _ = self._ledgers.popitem(last=False)
+
+    def invalidate(self, ledger_id: LedgerUUID) -> None:
+        self.generation += 1
+        _ = self._ledgers.pop(ledger_id, None)
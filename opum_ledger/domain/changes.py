@@ -0,0 +1,189 @@
+"""Domain layer for the ledger changes.
+
+Every write to a ledger appends a change with the next number of the ledger sequence. The last
+number is the ledger change counter, read endpoints derive their ETags from it: a list can not
+have changed while the counter of its ledger has not.
+
+The numbers are allocated by an atomic `$inc` of the ledger counter document, then the change is
+inserted. A concurrent writer may insert its change before the one of a lower number, the readers
+of the sequence stop before such a gap until it is filled. A number allocated by a writer that
+failed before inserting its change is skipped after `SEQUENCE_GAP_TIMEOUT` seconds.
+"""
+
+import asyncio
+from collections.abc import Iterable
+from datetime import timedelta
+from typing import TypeVar
+from uuid import UUID, uuid7
+
+from pymongo import ReturnDocument
+from pymongo.errors import DuplicateKeyError
+
+from opum_ledger.core.services import add_service
+from opum_ledger.domain.balances import BalanceKey
+from opum_ledger.domain.types.change import BalanceDelta, ChangeEntity, ChangeOperation
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.models.base import BaseAppModel, utc_now
+from opum_ledger.models.changes import ChangeModel, LedgerSequenceModel
+
+M = TypeVar("M", bound=BaseAppModel)
+
+# Seconds after which the readers skip a change number allocated but never inserted.
+SEQUENCE_GAP_TIMEOUT = 10
+
+# Attempts to record a change, a conflict only happens while the counter is behind the recorded changes.
+RECORD_ATTEMPTS = 3
+
+
+@add_service(scope="singleton")
+class LedgerChangesSignal:
+    """Wake up the waiters for the changes of a ledger written by this process.
+
+    Changes written by other processes are only found by polling, `wait` returns after `timeout` anyway.
+    """
+
+    def __init__(self):
+        self._events: dict[LedgerUUID, asyncio.Event] = {}
+
+    def listen(self, ledger_id: LedgerUUID) -> None:
+        """Keep the notifications of the ledger from now on, the next `wait` returns at once if there was one."""
+        _ = self._events.setdefault(ledger_id, asyncio.Event())
+
+    def notify(self, ledger_id: LedgerUUID) -> None:
+        event = self._events.get(ledger_id)
+        if event is not None:
+            event.set()
+
+    async def wait(self, ledger_id: LedgerUUID, timeout: float) -> None:
+        event = self._events.setdefault(ledger_id, asyncio.Event())
+        try:
+            _ = await asyncio.wait_for(event.wait(), timeout)
+        except TimeoutError:
+            pass
+        finally:
+            event.clear()
+
+    def forget(self, ledger_id: LedgerUUID) -> None:
+        _ = self._events.pop(ledger_id, None)
+
+
+@add_service(scope="singleton")
+class ChangesDAL:
+    __model__ = ChangeModel
+
+    def __init__(self, signal: LedgerChangesSignal):
+        self.signal: LedgerChangesSignal = signal
+
+    async def get_ledger_sequence(self, ledger_id: LedgerUUID) -> int:
+        """Return the ledger change counter, 0 for a ledger never written to.
+
+        The counter is read by id. Ledgers not written since the counter documents were introduced
+        fall back to the last recorded change.
+        """
+        counter = await LedgerSequenceModel.get_pymongo_collection().find_one({"_id": ledger_id})
+        if counter is not None:
+            return counter["seq"]
+        return await self.get_recorded_sequence(ledger_id)
+
+    @staticmethod
+    async def get_recorded_sequence(ledger_id: LedgerUUID) -> int:
+        """Return the number of the last recorded change, covered by the `(ledger_id, seq)` index.
+
+        Unlike the counter, it does not count the numbers allocated for changes not inserted yet.
+        """
+        change = await ChangeModel.get_pymongo_collection().find_one(
+            {"ledger_id": ledger_id},
+            {"_id": 0, "seq": 1},
+            sort=[("seq", -1)],
+        )
+        return change["seq"] if change else 0
+
+    async def record(
+        self,
+        ledger_id: LedgerUUID,
+        entity: ChangeEntity,
+        operation: ChangeOperation,
+        ids: Iterable[UUID],
+        deltas: dict[BalanceKey, int] | None = None,
+    ) -> int:
+        """Append a change to the ledger sequence and return its number.
+
+        `deltas` are the changes of the balances made by a transactions write.
+
+        The number is allocated with a single `find_one_and_update` on the ledger counter. If the
+        counter is behind the changes recorded before it existed, the unique `(ledger_id, seq)` index
+        rejects the number, the counter is moved past them and the change recorded again.
+
+        Raises:
+            RuntimeError: If no number could be allocated in `RECORD_ATTEMPTS` attempts.
+
+        """
+        change = ChangeModel(
+            id=uuid7(),
+            ledger_id=ledger_id,
+            seq=0,
+            entity=entity,
+            operation=operation,
+            ids=list(ids),
+            deltas=[
+                BalanceDelta(account_id=account_id, commodity_id=commodity_id, amount=amount)
+                for (account_id, commodity_id), amount in (deltas or {}).items()
+                if amount != 0
+            ],
+        )
+        counters = LedgerSequenceModel.get_pymongo_collection()
+        for _ in range(RECORD_ATTEMPTS):
+            try:
+                counter = await counters.find_one_and_update(
+                    {"_id": ledger_id},
+                    {"$inc": {"seq": 1}},
+                    upsert=True,
+                    return_document=ReturnDocument.AFTER,
+                )
+                change.seq = counter["seq"]
+                _ = await change.insert()
+            except DuplicateKeyError:
+                last_recorded = await self.get_recorded_sequence(ledger_id)
+                _ = await counters.update_one({"_id": ledger_id}, {"$max": {"seq": last_recorded}})
+                continue
+            self.signal.notify(ledger_id)
+            return change.seq
+        raise RuntimeError(f"No change number could be allocated for ledger {ledger_id}")
+
+    async def get_ledger_changes(self, ledger_id: LedgerUUID, since: int, limit: int) -> list[ChangeModel]:
+        """Return the first `limit` changes of the ledger after the number `since`, in sequence order.
+
+        A change is recorded after its write. The changes read stop before a number not recorded yet,
+        they are the whole sequence up to the last one, the missing change is read the next time.
+        """
+        changes = (
+            await ChangeModel.find(
+                ChangeModel.ledger_id == ledger_id,
+                ChangeModel.seq > since,
+            )
+            .sort("+seq")
+            .limit(limit)
+            .to_list()
+        )
+        expected = since + 1
+        for position, change in enumerate(changes):
+            if change.seq != expected and utc_now() - change.created_at < timedelta(seconds=SEQUENCE_GAP_TIMEOUT):
+                return changes[:position]
+            expected = change.seq + 1
+        return changes
+
+    async def get_changed_documents(self, model: type[M], ledger_id: LedgerUUID, ids: Iterable[UUID]) -> list[M]:
+        """Return the current state of the ledger documents, soft deleted ones included."""
+        ids = list(ids)
+        if not ids:
+            return []
+        return await model.find({"_id": {"$in": ids}, "ledger_id": ledger_id}).to_list()
+
+
+@add_service(scope="scoped")
+class ChangesBL:
+    def __init__(self, dal: ChangesDAL):
+        self.dal: ChangesDAL = dal
+
+    async def get_ledger_sequence(self, ledger_id: LedgerUUID) -> int:
+        return await self.dal.get_ledger_sequence(ledger_id)
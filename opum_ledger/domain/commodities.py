@@ -1,16 +1,23 @@
-from typing import ClassVar
+import time
+from collections.abc import Iterable
+from dataclasses import dataclass
+from typing import ClassVar, NoReturn
 from uuid import uuid7
 
 import pendulum
 from beanie import UpdateResponse
-from beanie.odm.operators.update.general import Set
+from beanie.odm.operators.update.general import Inc, Set
 from essentials.exceptions import ConflictException, ObjectNotFound
-from pydantic import UUID7, BaseModel, ConfigDict, TypeAdapter
+from pydantic import UUID7, BaseModel, ConfigDict
 from pymongo.errors import DuplicateKeyError
-from pymongo.results import UpdateResult
 
+from opum_ledger.core.adapters import type_adapter
 from opum_ledger.core.exceptions import PreconditionFailed
 from opum_ledger.core.services import add_service
+from opum_ledger.domain.base import Fieldset, LedgerCache, api_projection
+from opum_ledger.domain.changes import ChangesDAL
+from opum_ledger.domain.details import set_commodity_code
+from opum_ledger.domain.types.change import ChangeEntity, ChangeOperation
 from opum_ledger.domain.types.commodity import (
     CommodityCode,
     CommodityCreatedAt,
@@ -22,7 +29,10 @@ from opum_ledger.domain.types.commodity import (
     CommodityUUID,
 )
 from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.revision import Revision
+from opum_ledger.models.base import bson_datetime, revision_match
 from opum_ledger.models.commodities import CommodityModel
+from opum_ledger.settings import Settings
 
 
 class CommodityBase(BaseModel):
@@ -45,6 +55,7 @@ class Commodity(NewCommodity):
     id: CommodityUUID
     created_at: CommodityCreatedAt
     updated_at: CommodityUpdatedAt
+    revision: Revision
 
 
 class UpdateCommodity(BaseModel):
@@ -55,8 +66,44 @@ class UpdateCommodity(BaseModel):
     no_market: CommodityIsOnMarket | None
 
 
+# Listed commodities are read as raw documents and validated once into `Commodity`.
+COMMODITY_PROJECTION = api_projection(Commodity)
+COMMODITIES_ADAPTER = type_adapter(list[Commodity])
+
+
+@dataclass(frozen=True)
+class LedgerCommodities:
+    """The ledger commodities by id."""
+
+    commodities: dict[CommodityUUID, Commodity]
+    loaded_at: float
+
+    @classmethod
+    def build(cls, commodities: Iterable[Commodity]) -> "LedgerCommodities":
+        return cls(
+            commodities={commodity.id: commodity for commodity in commodities},
+            loaded_at=time.monotonic(),
+        )
+
+
+@add_service(scope="singleton")
+class CommoditiesCache(LedgerCache[LedgerCommodities]):
+    """In-process cache of the ledger commodities.
+
+    Writes through `CommoditiesDAL` invalidate the ledger in this process, other processes
+    pick up the change after `app.commodities_cache_ttl` seconds.
+    """
+
+    def __init__(self, settings: Settings):
+        super().__init__(settings.app.commodities_cache_size, settings.app.commodities_cache_ttl)
+
+
 @add_service(scope="scoped")
 class CommoditiesDAL:
+    def __init__(self, cache: CommoditiesCache, changes: ChangesDAL):
+        self.cache: CommoditiesCache = cache
+        self.changes: ChangesDAL = changes
+
     async def create_commodity(
         self,
         new_commodity: NewCommodity,
@@ -76,6 +123,10 @@ class CommoditiesDAL:
         except DuplicateKeyError as e:
             raise ConflictException("Duplicate commodity with the same code for the ledger already exists") from e
 
+        self.cache.invalidate(new_commodity.ledger_id)
+        _ = await self.changes.record(
+            new_commodity.ledger_id, ChangeEntity.COMMODITY, ChangeOperation.CREATED, [commodity.id]
+        )
         return Commodity.model_validate(commodity)
 
     async def get_commodity(self, commodity_id: CommodityUUID) -> Commodity:
@@ -103,69 +154,146 @@ class CommoditiesDAL:
 
         return Commodity.model_validate(commodity)
 
-    async def get_ledger_commodities(self, ledger_id: LedgerUUID) -> list[Commodity]:
-        commodities = await CommodityModel.find(
+    async def get_ledger_commodities(
+        self,
+        ledger_id: LedgerUUID,
+        fieldset: Fieldset[Commodity] | None = None,
+    ) -> list[Commodity]:
+        """Return the ledger commodities, with only the fields of `fieldset` if it is given."""
+        request = CommodityModel.find(
             CommodityModel.ledger_id == ledger_id,
             CommodityModel.deleted_at == None,  # noqa E711
-        ).to_list()
-        return TypeAdapter(list[Commodity]).validate_python(commodities)
+        )
+        commodities = (
+            await CommodityModel.get_pymongo_collection()
+            .find(request.get_filter_query(), fieldset.projection if fieldset else COMMODITY_PROJECTION)
+            .to_list()
+        )
+        if fieldset:
+            return fieldset.validate(commodities)
+        return COMMODITIES_ADAPTER.validate_python(commodities)
+
+    async def get_ledger_commodities_index(
+        self,
+        ledger_id: LedgerUUID,
+    ) -> LedgerCommodities:
+        """Return the ledger commodities by id, from the cache if they are there."""
+        index = self.cache.get(ledger_id)
+        if index is None:
+            generation = self.cache.generation
+            index = LedgerCommodities.build(await self.get_ledger_commodities(ledger_id))
+            self.cache.put(ledger_id, index, generation)
+        return index
+
+    async def get_ledger_commodities_by_ids(
+        self,
+        ledger_id: LedgerUUID,
+        ids: Iterable[CommodityUUID],
+    ) -> list[Commodity]:
+        """Return the ledger commodities with the ids in one query, soft deleted ones included."""
+        ids = list(ids)
+        if not ids:
+            return []
+        commodities = (
+            await CommodityModel.get_pymongo_collection()
+            .find({"_id": {"$in": ids}, "ledger_id": ledger_id}, COMMODITY_PROJECTION)
+            .to_list()
+        )
+        return COMMODITIES_ADAPTER.validate_python(commodities)
 
     async def update_ledger_commodity(
         self,
         ledger_id: LedgerUUID,
         commodity_id: CommodityUUID,
         data: UpdateCommodity,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ) -> Commodity:
-        new_data = data.model_dump(exclude_unset=True)
-        if not new_data:
+        """Update the commodity with a single `find_one_and_update`.
+
+        If `revision` is given, the commodity is updated only if it is still at that revision.
+        The old document is returned by the update, so the transaction details are rewritten
+        only if the code or the subunit actually changed.
+        """
+        update_data = data.model_dump(exclude_unset=True)
+        if not update_data:
             raise ValueError("No data to update")
+        update_data["updated_at"] = bson_datetime(pendulum.now("UTC"))
 
         commodity_query = CommodityModel.find_one(
             CommodityModel.id == commodity_id,
             CommodityModel.ledger_id == ledger_id,
             CommodityModel.deleted_at == None,  # noqa E711
         )
-        commodity = await commodity_query
-        if commodity is None:
-            raise ObjectNotFound
-
-        if updated_at and pendulum.instance(commodity.updated_at) > updated_at:
-            raise PreconditionFailed(f"Commodity has been modified since {updated_at}")
-
-        update_data = data.model_dump(exclude_unset=True)
-        update_data["updated_at"] = pendulum.now("UTC")
-
-        if updated_at is not None:
-            commodity_query = commodity_query.find_one(CommodityModel.updated_at == updated_at)
+        if revision is not None:
+            commodity_query = commodity_query.find_one(revision_match(revision))
 
         try:
-            commodity_update_result: UpdateResult = await commodity_query.update(  # pyright: ignore[reportGeneralTypeIssues]
+            old_commodity: CommodityModel | None = await commodity_query.update(  # pyright: ignore[reportGeneralTypeIssues]
                 Set(update_data),
-                response_type=UpdateResponse.UPDATE_RESULT,
+                Inc({CommodityModel.revision: 1}),
+                response_type=UpdateResponse.OLD_DOCUMENT,
             )
         except DuplicateKeyError as e:
             raise ConflictException("Duplicate commodity with the same code for the ledger already exists") from e
 
-        if commodity_update_result.modified_count == 0:
-            raise PreconditionFailed(f"Commodity has been modified since {updated_at}")
+        if old_commodity is None:
+            await self._raise_not_written(ledger_id, commodity_id, revision)
 
-        return await self.get_commodity(commodity_id)
+        commodity = Commodity.model_validate(old_commodity).model_copy(
+            update={**update_data, "revision": old_commodity.revision + 1}
+        )
+        self.cache.invalidate(ledger_id)
+        _ = await self.changes.record(ledger_id, ChangeEntity.COMMODITY, ChangeOperation.UPDATED, [commodity_id])
+        if (commodity.code, commodity.subunit) != (old_commodity.code, old_commodity.subunit):
+            transaction_ids = await set_commodity_code(ledger_id, commodity_id, commodity.code, commodity.subunit)
+            if transaction_ids:
+                _ = await self.changes.record(
+                    ledger_id, ChangeEntity.TRANSACTION, ChangeOperation.UPDATED, transaction_ids
+                )
+        return commodity
 
     async def delete_ledger_commodity(
         self,
         ledger_id: LedgerUUID,
         commodity_id: CommodityUUID,
+        revision: int | None = None,
     ):
-        commodity = await CommodityModel.find_one(
+        commodity_query = CommodityModel.find_one(
             CommodityModel.id == commodity_id,
             CommodityModel.ledger_id == ledger_id,
             CommodityModel.deleted_at == None,  # noqa E711
-        ).update_one(
-            Set({"deleted_at": pendulum.now()}),
         )
-        if not commodity:
-            raise ObjectNotFound
+        if revision is not None:
+            commodity_query = commodity_query.find_one(revision_match(revision))
+
+        commodity: CommodityModel | None = await commodity_query.update(  # pyright: ignore[reportGeneralTypeIssues]
+            Set({"deleted_at": pendulum.now("UTC")}),
+            Inc({CommodityModel.revision: 1}),
+            response_type=UpdateResponse.NEW_DOCUMENT,
+        )
+        if commodity is None:
+            await self._raise_not_written(ledger_id, commodity_id, revision)
+
+        self.cache.invalidate(ledger_id)
+        _ = await self.changes.record(ledger_id, ChangeEntity.COMMODITY, ChangeOperation.DELETED, [commodity_id])
+
+    @staticmethod
+    async def _raise_not_written(
+        ledger_id: LedgerUUID,
+        commodity_id: CommodityUUID,
+        revision: int | None,
+    ) -> NoReturn:
+        """Raise why a conditional write matched no commodity, only called on the failure path."""
+        if (
+            revision is not None
+            and await CommodityModel.find(
+                CommodityModel.id == commodity_id,
+                CommodityModel.ledger_id == ledger_id,
+                CommodityModel.deleted_at == None,  # noqa E711
+            ).exists()
+        ):
+            raise PreconditionFailed(f"Commodity has been modified since revision {revision}")
+        raise ObjectNotFound
 
 
 @add_service(scope="scoped")
@@ -197,19 +325,35 @@ class CommoditiesBL:
         ledger_id: UUID7,
         commodity_id: UUID7,
         data: UpdateCommodity,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ) -> Commodity:
-        return await self.dal.update_ledger_commodity(ledger_id, commodity_id, data, updated_at)
+        return await self.dal.update_ledger_commodity(ledger_id, commodity_id, data, revision)
+
+    async def get_ledger_commodities(
+        self,
+        ledger_id: UUID7,
+        fieldset: Fieldset[Commodity] | None = None,
+    ) -> list[Commodity]:
+        return await self.dal.get_ledger_commodities(ledger_id=ledger_id, fieldset=fieldset)
+
+    async def get_ledger_commodities_by_ids(
+        self,
+        ledger_id: LedgerUUID,
+        ids: Iterable[CommodityUUID],
+    ) -> list[Commodity]:
+        return await self.dal.get_ledger_commodities_by_ids(ledger_id, ids)
 
-    async def get_ledger_commodities(self, ledger_id: UUID7) -> list[Commodity]:
-        return await self.dal.get_ledger_commodities(ledger_id=ledger_id)
+    async def get_ledger_commodities_index(self, ledger_id: UUID7) -> LedgerCommodities:
+        return await self.dal.get_ledger_commodities_index(ledger_id)
 
     async def delete_ledger_commodity(
         self,
         ledger_id: UUID7,
         commodity_id: UUID7,
+        revision: int | None = None,
     ):
         await self.dal.delete_ledger_commodity(
             ledger_id=ledger_id,
             commodity_id=commodity_id,
+            revision=revision,
         )
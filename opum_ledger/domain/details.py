@@ -0,0 +1,71 @@
+"""Copies of the account paths and the commodity codes in the transactions details.
+
+Each stored detail carries the path of its account and the code and subunit of its amount commodity,
+so transactions are rendered without reading the accounts and the commodities. The copies are
+written with the details and rewritten in place with a single `update_many` when an account path
+or a commodity code or subunit changes, the array filters update only the matching details.
+
+Only the transactions holding an outdated copy are rewritten. Their revision is incremented, the
+body of the transaction changed, and the callers record a transactions change with their ids, so
+the clients of the changes feed and of the events stream read them again.
+
+The copies are taken from the cached ledger accounts and commodities. Another process may still
+write the old path or code until its cache expires, `app.accounts_cache_ttl` and
+`app.commodities_cache_ttl` seconds after the change, the `denormalize-details` maintenance
+command rewrites them.
+"""
+
+from typing import Any
+
+from opum_ledger.domain.types.account import AccountPath, AccountUUID
+from opum_ledger.domain.types.commodity import CommodityCode, CommoditySubunit, CommodityUUID
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.transaction import TransactionUUID
+from opum_ledger.models.base import LIVE_DOCUMENTS
+from opum_ledger.models.transactions import TransactionModel
+
+
+async def set_account_path(ledger_id: LedgerUUID, account_id: AccountUUID, path: AccountPath) -> list[TransactionUUID]:
+    """Copy the account path into the details of the account, return the ids of the transactions updated."""
+    return await _update_details(
+        {"ledger_id": ledger_id, "details": {"$elemMatch": {"account_id": account_id, "account_path": {"$ne": path}}}},
+        {"details.$[detail].account_path": path},
+        {"detail.account_id": account_id},
+    )
+
+
+async def set_commodity_code(
+    ledger_id: LedgerUUID,
+    commodity_id: CommodityUUID,
+    code: CommodityCode,
+    subunit: CommoditySubunit,
+) -> list[TransactionUUID]:
+    """Copy the commodity code and subunit into the details with amounts of the commodity.
+
+    Returns:
+        The ids of the transactions updated.
+
+    """
+    outdated = {"$or": [{"commodity_code": {"$ne": code}}, {"commodity_subunit": {"$ne": subunit}}]}
+    return await _update_details(
+        {"ledger_id": ledger_id, "details": {"$elemMatch": {"amount.commodity_id": commodity_id, **outdated}}},
+        {"details.$[detail].commodity_code": code, "details.$[detail].commodity_subunit": subunit},
+        {"detail.amount.commodity_id": commodity_id},
+    )
+
+
+async def _update_details(
+    query: dict[str, Any],  # pyright: ignore[reportExplicitAny]
+    values: dict[str, Any],  # pyright: ignore[reportExplicitAny]
+    detail_filter: dict[str, Any],  # pyright: ignore[reportExplicitAny]
+) -> list[TransactionUUID]:
+    collection = TransactionModel.get_pymongo_collection()
+    query = {**query, **LIVE_DOCUMENTS}
+    ids: list[TransactionUUID] = [document["_id"] async for document in collection.find(query, {"_id": 1})]
+    if ids:
+        _ = await collection.update_many(
+            {**query, "_id": {"$in": ids}},
+            {"$set": values, "$inc": {"revision": 1}},
+            array_filters=[detail_filter],
+        )
+    return ids
@@ -0,0 +1,216 @@
+"""Server-Sent Events of the ledger changes.
+
+Each process reads the changes of a ledger once for all the subscribers of that ledger: a single
+task per ledger follows the ledger changes sequence and copies every change to the queues of the
+subscribers. The task is woken up by the writes of the process, and polls for the writes of other
+processes every `app.events.poll_interval` seconds. It stops with the last subscriber of the ledger.
+
+Events carry the number of the change as the SSE id, a client reconnecting with `Last-Event-ID`
+gets the changes it missed from the sequence before the live ones.
+"""
+
+import asyncio
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from uuid import UUID
+
+from pydantic import BaseModel, ConfigDict, Field
+
+from opum_ledger.core.logging import logger
+from opum_ledger.core.services import add_service
+from opum_ledger.domain.changes import ChangesDAL, LedgerChangesSignal
+from opum_ledger.domain.types.change import BalanceDelta, ChangeEntity, ChangeOperation, ChangeSequence
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.models.changes import ChangeModel
+from opum_ledger.settings import EventsSettings, Settings
+
+# Number of changes read from the sequence at once.
+EVENTS_BATCH_SIZE = 500
+
+
+class ChangeEvent(BaseModel):
+    model_config = ConfigDict(
+        from_attributes=True,
+    )
+
+    seq: ChangeSequence
+    entity: ChangeEntity
+    operation: ChangeOperation
+    ids: list[UUID]
+    deltas: list[BalanceDelta] = Field(default_factory=list)
+
+    @property
+    def name(self) -> str:
+        return f"{self.entity.value}.{self.operation.value}"
+
+    def encode(self) -> bytes:
+        """Encode the event as an SSE message, the data is the JSON of the ids and the balance deltas."""
+        data = self.model_dump_json(include={"ids", "deltas"}, exclude_defaults=True)
+        return f"id: {self.seq}\nevent: {self.name}\ndata: {data}\n\n".encode()
+
+
+class Subscription:
+    """Events of a ledger for a subscriber, the changes after `position`.
+
+    `position` is `None` until the ledger task has read the position it starts from.
+    """
+
+    def __init__(self, queue_size: int, position: int | None = None):
+        self.position: int | None = position
+        self._queue: asyncio.Queue[ChangeEvent | None] = asyncio.Queue(queue_size)
+
+    def push(self, event: ChangeEvent) -> bool:
+        """Queue the event, tell whether there was room for it."""
+        try:
+            self._queue.put_nowait(event)
+        except asyncio.QueueFull:
+            return False
+        return True
+
+    def close(self) -> None:
+        """Drop the queued events and stop the subscriber, it has fallen too far behind."""
+        while not self._queue.empty():
+            _ = self._queue.get_nowait()
+        self._queue.put_nowait(None)
+
+    async def next(self, timeout: float) -> ChangeEvent | None:
+        """Return the next event, `None` once the subscription is closed.
+
+        Raises:
+            TimeoutError: If no event came for `timeout` seconds.
+
+        """
+        return await asyncio.wait_for(self._queue.get(), timeout)
+
+
+@add_service(scope="singleton")
+class LedgerEventsHub:
+    def __init__(self, settings: Settings, signal: LedgerChangesSignal, changes: ChangesDAL):
+        self.settings: EventsSettings = settings.app.events
+        self.signal: LedgerChangesSignal = signal
+        self.changes: ChangesDAL = changes
+        self._subscriptions: dict[LedgerUUID, set[Subscription]] = {}
+        self._positions: dict[LedgerUUID, int] = {}
+        self._started: dict[LedgerUUID, asyncio.Event] = {}
+        self._tails: dict[LedgerUUID, asyncio.Task[None]] = {}
+
+    def subscribers(self, ledger_id: LedgerUUID) -> int:
+        return len(self._subscriptions.get(ledger_id, ()))
+
+    @asynccontextmanager
+    async def subscribe(self, ledger_id: LedgerUUID) -> AsyncIterator[Subscription]:
+        """Subscribe to the ledger changes written from now on.
+
+        The subscription is registered before anything is awaited: it gets every change the ledger task
+        reads after the subscription `position`, the one the task was at or the one it starts from.
+        """
+        subscription = Subscription(self.settings.queue_size, self._positions.get(ledger_id))
+        self._subscriptions.setdefault(ledger_id, set()).add(subscription)
+        if ledger_id not in self._tails:
+            self._started[ledger_id] = asyncio.Event()
+            self._tails[ledger_id] = asyncio.create_task(self._tail(ledger_id))
+        try:
+            if subscription.position is None:
+                _ = await self._started[ledger_id].wait()
+            yield subscription
+        finally:
+            self._subscriptions[ledger_id].discard(subscription)
+            if not self._subscriptions[ledger_id]:
+                _ = self._tails.pop(ledger_id).cancel()
+                del self._subscriptions[ledger_id]
+                del self._started[ledger_id]
+                _ = self._positions.pop(ledger_id, None)
+                self.signal.forget(ledger_id)
+
+    async def stream(self, ledger_id: LedgerUUID, since: int | None = None) -> AsyncIterator[bytes]:
+        """Stream the SSE messages of the ledger changes after `since`, or from now on if it is not given.
+
+        A comment is sent after `app.events.heartbeat` idle seconds to keep the connection open. The stream
+        ends if the subscriber falls behind, the client reconnects with `Last-Event-ID` to catch up.
+        """
+        async with self.subscribe(ledger_id) as subscription:
+            last_seq = -1
+            if since is not None and subscription.position is not None:
+                async for event in self.replay(ledger_id, since, subscription.position):
+                    last_seq = event.seq
+                    yield event.encode()
+            while True:
+                try:
+                    event = await subscription.next(self.settings.heartbeat)
+                except TimeoutError:
+                    yield b": heartbeat\n\n"
+                    continue
+                if event is None:
+                    return
+                # sent by the replay already
+                if event.seq <= last_seq:
+                    continue
+                last_seq = event.seq
+                yield event.encode()
+
+    async def replay(self, ledger_id: LedgerUUID, since: int, until: int) -> AsyncIterator[ChangeEvent]:
+        """Iterate over the events of the changes after `since` up to `until` from the sequence."""
+        while since < until:
+            changes = await self.changes.get_ledger_changes(ledger_id, since, EVENTS_BATCH_SIZE)
+            for change in changes:
+                if change.seq > until:
+                    return
+                yield ChangeEvent.model_validate(change)
+                since = change.seq
+            if len(changes) < EVENTS_BATCH_SIZE:
+                return
+
+    async def _tail(self, ledger_id: LedgerUUID) -> None:
+        """Follow the ledger changes and copy them to the ledger subscribers."""
+        await self._start(ledger_id)
+
+        caught_up = True
+        while True:
+            if caught_up:
+                await self.signal.wait(ledger_id, self.settings.poll_interval)
+            try:
+                changes = await self.changes.get_ledger_changes(
+                    ledger_id, self._positions[ledger_id], EVENTS_BATCH_SIZE
+                )
+            except Exception:
+                logger.exception("Reading the changes of ledger %s failed", ledger_id)
+                caught_up = True
+                continue
+
+            self._publish(ledger_id, changes)
+            caught_up = len(changes) < EVENTS_BATCH_SIZE
+
+    async def _start(self, ledger_id: LedgerUUID) -> None:
+        """Set the start position of the ledger task and of its waiting subscribers.
+
+        The start position is the last recorded change, read once the notifications of the ledger
+        are kept, a change recorded meanwhile wakes the task up right away.
+        """
+        self.signal.listen(ledger_id)
+        while ledger_id not in self._positions:
+            try:
+                position = await self.changes.get_recorded_sequence(ledger_id)
+            except Exception:
+                logger.exception("Reading the changes sequence of ledger %s failed", ledger_id)
+                await asyncio.sleep(self.settings.poll_interval)
+                continue
+            self._positions[ledger_id] = position
+            for subscription in self._subscriptions[ledger_id]:
+                if subscription.position is None:
+                    subscription.position = position
+            self._started[ledger_id].set()
+
+    def _publish(self, ledger_id: LedgerUUID, changes: list[ChangeModel]) -> None:
+        """Copy the changes to the ledger subscribers, disconnecting the ones that fell behind.
+
+        Not a coroutine, the subscribers of the ledger can not change while the changes are copied.
+        """
+        subscriptions = self._subscriptions[ledger_id]
+        for change in changes:
+            event = ChangeEvent.model_validate(change)
+            for subscription in list(subscriptions):
+                if not subscription.push(event):
+                    logger.warning("Ledger %s events subscriber fell behind, disconnecting it", ledger_id)
+                    subscription.close()
+                    subscriptions.discard(subscription)
+            self._positions[ledger_id] = change.seq
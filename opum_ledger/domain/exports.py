@@ -0,0 +1,82 @@
+"""Serialization of ledger transactions for export."""
+
+import csv
+import io
+from collections.abc import AsyncIterable, AsyncIterator
+from enum import Enum
+
+from opum_ledger.domain.types.transaction import Transaction
+
+
+class ExportFormat(Enum):
+    NDJSON = "ndjson"
+    CSV = "csv"
+
+    @property
+    def content_type(self) -> bytes:
+        match self:
+            case ExportFormat.NDJSON:
+                return b"application/x-ndjson"
+            case ExportFormat.CSV:
+                return b"text/csv; charset=utf-8"
+
+
+# CSV export has a row per transaction detail (posting).
+CSV_COLUMNS = [
+    "transaction_id",
+    "date_time",
+    "description",
+    "state",
+    "tags",
+    "account_id",
+    "commodity_id",
+    "amount",
+    "price_commodity_id",
+    "price_numerator",
+    "price_denominator",
+]
+
+
+async def ndjson_chunks(batches: AsyncIterable[list[Transaction]]) -> AsyncIterator[bytes]:
+    """Serialize batches of transactions into NDJSON, one chunk per batch."""
+    async for batch in batches:
+        yield b"".join(transaction.model_dump_json().encode("utf-8") + b"\n" for transaction in batch)
+
+
+async def csv_chunks(batches: AsyncIterable[list[Transaction]]) -> AsyncIterator[bytes]:
+    """Serialize batches of transactions into CSV, one chunk per batch after the header."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+
+    writer.writerow(CSV_COLUMNS)
+    yield buffer.getvalue().encode("utf-8")
+
+    async for batch in batches:
+        buffer.seek(0)
+        buffer.truncate()
+        for transaction in batch:
+            for detail in transaction.details:
+                writer.writerow(
+                    [
+                        transaction.id,
+                        transaction.date_time.isoformat(),
+                        transaction.description,
+                        transaction.state.value,
+                        ";".join(transaction.tags),
+                        detail.account_id,
+                        detail.amount.commodity_id,
+                        detail.amount.amount,
+                        detail.price.commodity_id if detail.price else "",
+                        detail.price.price.numerator if detail.price else "",
+                        detail.price.price.denominator if detail.price else "",
+                    ]
+                )
+        yield buffer.getvalue().encode("utf-8")
+
+
+def export_chunks(batches: AsyncIterable[list[Transaction]], export_format: ExportFormat) -> AsyncIterator[bytes]:
+    match export_format:
+        case ExportFormat.NDJSON:
+            return ndjson_chunks(batches)
+        case ExportFormat.CSV:
+            return csv_chunks(batches)
@@ -0,0 +1,103 @@
+"""Feed of the ledger changes for the clients delta sync.
+
+A client keeps the `token` of the last feed page and asks for the changes since it. The page has
+the current state of the documents written since the token, not every intermediate state, and the
+ids of the soft deleted ones, so its size follows the number of changed documents.
+"""
+
+from collections import defaultdict
+from uuid import UUID
+
+from pydantic import BaseModel, Field
+
+from opum_ledger.core.services import add_service
+from opum_ledger.domain.accounts import Account
+from opum_ledger.domain.changes import ChangesDAL
+from opum_ledger.domain.commodities import Commodity
+from opum_ledger.domain.ledgers import Ledger, LedgersDAL
+from opum_ledger.domain.types.change import ChangeEntity, ChangeSequence
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.transaction import Transaction
+from opum_ledger.models.accounts import AccountModel
+from opum_ledger.models.commodities import CommodityModel
+from opum_ledger.models.transactions import TransactionModel
+
+# Maximum number of changes read for a feed page, a bulk write is a single change.
+MAX_FEED_CHANGES = 1000
+
+
+class DeletedIds(BaseModel):
+    transactions: list[UUID] = Field(default_factory=list)
+    accounts: list[UUID] = Field(default_factory=list)
+    commodities: list[UUID] = Field(default_factory=list)
+
+
+class LedgerChanges(BaseModel):
+    """Documents changed in the ledger since a token."""
+
+    since: ChangeSequence
+    token: ChangeSequence = Field(..., description="The token to pass as `since` for the next changes")
+    has_more: bool = Field(False, description="More changes follow the token, ask for them right away")
+    ledger: Ledger | None = None
+    transactions: list[Transaction] = Field(default_factory=list)
+    accounts: list[Account] = Field(default_factory=list)
+    commodities: list[Commodity] = Field(default_factory=list)
+    deleted: DeletedIds = Field(default_factory=DeletedIds)
+
+
+@add_service(scope="scoped")
+class ChangesFeedBL:
+    def __init__(self, changes: ChangesDAL, ledgers: LedgersDAL):
+        self.changes: ChangesDAL = changes
+        self.ledgers: LedgersDAL = ledgers
+
+    async def get_ledger_token(self, ledger_id: LedgerUUID) -> int:
+        return await self.changes.get_ledger_sequence(ledger_id)
+
+    async def get_ledger_changes(
+        self,
+        ledger_id: LedgerUUID,
+        since: int,
+        limit: int = MAX_FEED_CHANGES,
+    ) -> LedgerChanges:
+        """Return the documents changed after the change `since`, at most `limit` changes at once.
+
+        Documents are read after the changes, a document may already be in a state of a later change,
+        which is sent again with the next page. Applying a page twice is harmless.
+        """
+        changes = await self.changes.get_ledger_changes(ledger_id, since, limit)
+        if not changes:
+            return LedgerChanges(since=since, token=since)
+
+        ids: dict[ChangeEntity, dict[UUID, None]] = defaultdict(dict)
+        for change in changes:
+            ids[change.entity].update(dict.fromkeys(change.ids))
+
+        feed = LedgerChanges(since=since, token=changes[-1].seq, has_more=len(changes) == limit)
+        if ChangeEntity.LEDGER in ids:
+            feed.ledger = await self.ledgers.get_ledger(ledger_id)
+
+        for transaction in await self.changes.get_changed_documents(
+            TransactionModel, ledger_id, ids[ChangeEntity.TRANSACTION]
+        ):
+            if transaction.deleted_at is None:
+                del ids[ChangeEntity.TRANSACTION][transaction.id]
+                feed.transactions.append(Transaction.model_validate(transaction, from_attributes=True))
+        for account in await self.changes.get_changed_documents(AccountModel, ledger_id, ids[ChangeEntity.ACCOUNT]):
+            if account.deleted_at is None:
+                del ids[ChangeEntity.ACCOUNT][account.id]
+                feed.accounts.append(Account.model_validate(account))
+        for commodity in await self.changes.get_changed_documents(
+            CommodityModel, ledger_id, ids[ChangeEntity.COMMODITY]
+        ):
+            if commodity.deleted_at is None:
+                del ids[ChangeEntity.COMMODITY][commodity.id]
+                feed.commodities.append(Commodity.model_validate(commodity))
+
+        # what is left is either soft deleted or already purged
+        feed.deleted = DeletedIds(
+            transactions=list(ids[ChangeEntity.TRANSACTION]),
+            accounts=list(ids[ChangeEntity.ACCOUNT]),
+            commodities=list(ids[ChangeEntity.COMMODITY]),
+        )
+        return feed
@@ -0,0 +1,480 @@
+"""Import of transactions from CSV and hledger/ledger-cli journal files.
+
+Files are read line by line from the request stream, transactions are validated against
+the ledger accounts and commodities, and written in batches, so memory use is bounded
+by the batch size and not by the file size.
+"""
+
+import codecs
+import csv
+import re
+from collections import defaultdict
+from collections.abc import AsyncIterable, AsyncIterator, Callable
+from dataclasses import dataclass, field
+from datetime import datetime, timezone
+from decimal import Decimal, InvalidOperation
+from enum import Enum
+from fractions import Fraction
+from typing import Any
+from uuid import UUID
+
+from pydantic import BaseModel, Field, ValidationError
+
+from opum_ledger.core.exceptions import InvalidContent, PayloadTooLarge
+from opum_ledger.core.services import add_service
+from opum_ledger.core.utils import format_validation_error
+from opum_ledger.domain.accounts import Account, AccountsBL
+from opum_ledger.domain.commodities import CommoditiesBL, Commodity
+from opum_ledger.domain.transactions import DetailsReferences, TransactionsDAL
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.transaction import Detail, NewTransaction, TransactionState
+
+# Number of transactions written to the database at once.
+IMPORT_BATCH_SIZE = 500
+
+# Maximum number of errors reported back, the remaining ones are only counted.
+MAX_IMPORT_ERRORS = 100
+
+
+class ImportFormat(Enum):
+    CSV = "csv"
+    JOURNAL = "journal"
+
+
+class ImportFailure(BaseModel):
+    line: int = Field(
+        ...,
+        description="The line of the transaction in the imported file",
+    )
+    error: str = Field(
+        ...,
+        description="Why the transaction was not imported",
+    )
+
+
+class ImportResult(BaseModel):
+    created: int = Field(
+        0,
+        description="The number of imported transactions",
+    )
+    failed: int = Field(
+        0,
+        description="The number of transactions that were not imported",
+    )
+    errors: list[ImportFailure] = Field(
+        default_factory=list,
+        description=f"The first {MAX_IMPORT_ERRORS} errors",
+    )
+
+    def add_error(self, line: int, error: str) -> None:
+        self.failed += 1
+        if len(self.errors) < MAX_IMPORT_ERRORS:
+            self.errors.append(ImportFailure(line=line, error=error))
+
+
+class ImportLineError(ValueError):
+    """A transaction of the imported file is invalid."""
+
+
+@dataclass
+class LedgerContext:
+    """Accounts and commodities of the ledger the transactions are imported into."""
+
+    accounts: dict[str, Account] = field(default_factory=dict)
+    commodities: dict[str, Commodity] = field(default_factory=dict)
+
+    @classmethod
+    def build(cls, accounts: list[Account], commodities: list[Commodity]) -> "LedgerContext":
+        context = cls()
+        for account in accounts:
+            context.accounts[account.path] = account
+            context.accounts[str(account.id)] = account
+        for commodity in commodities:
+            if commodity.symbol:
+                context.commodities[commodity.symbol] = commodity
+            context.commodities[commodity.code] = commodity
+            context.commodities[str(commodity.id)] = commodity
+        return context
+
+    def account(self, key: str) -> Account:
+        """Find the account by path or id."""
+        account = self.accounts.get(key.strip())
+        if account is None:
+            raise ImportLineError(f"Unknown account {key!r}")
+        return account
+
+    def commodity(self, key: str) -> Commodity:
+        """Find the commodity by code, symbol or id."""
+        commodity = self.commodities.get(key.strip())
+        if commodity is None:
+            raise ImportLineError(f"Unknown commodity {key!r}")
+        return commodity
+
+
+async def iter_lines(chunks: AsyncIterable[bytes], size_limit: int) -> AsyncIterator[tuple[int, str]]:
+    """Split a stream of bytes into numbered text lines.
+
+    Raises:
+        PayloadTooLarge: If the stream is longer than `size_limit` bytes.
+        InvalidContent: If the stream is not valid UTF-8.
+
+    """
+    decoder = codecs.getincrementaldecoder("utf-8-sig")()
+    size = 0
+    number = 0
+    pending = ""
+    try:
+        async for chunk in chunks:
+            size += len(chunk)
+            if size > size_limit:
+                raise PayloadTooLarge(f"Import file is larger than {size_limit} bytes")
+            # only the new text is split, a long line is not scanned again for every chunk
+            first, *lines = decoder.decode(chunk).split("\n")
+            pending += first
+            if not lines:
+                continue
+            *lines, tail = lines
+            for line in [pending, *lines]:
+                number += 1
+                yield number, line.rstrip("\r")
+            pending = tail
+        pending += decoder.decode(b"", final=True)
+    except UnicodeDecodeError as e:
+        raise InvalidContent("Import file is not a valid UTF-8 text") from e
+    if pending:
+        yield number + 1, pending.rstrip("\r")
+
+
+def to_minor_units(amount: Decimal, commodity: Commodity) -> int:
+    """Convert an amount in commodity units to the minimal units, like dollars to cents."""
+    value = amount * commodity.subunit
+    if value != value.to_integral_value():
+        raise ImportLineError(f"Amount {amount} is more precise than {commodity.code} allows")
+    return int(value)
+
+
+# CSV import has a row per transaction detail, consecutive rows with the same transaction_id
+# are details of the same transaction. It reads the files written by the CSV export.
+# Accounts may be given by `account_id` or `account` path, commodities by `commodity_id`
+# or `commodity` code, amounts are in minimal units.
+CSV_REQUIRED_COLUMNS = {"transaction_id", "date_time", "description", "amount"}
+
+
+def csv_row(columns: list[str], line: int, values: list[str]) -> dict[str, str]:
+    if len(values) != len(columns):
+        raise ImportLineError(f"Line {line} has {len(values)} values, the header has {len(columns)} columns")
+    return dict(zip(columns, values, strict=True))
+
+
+def csv_transaction(columns: list[str], records: list[tuple[int, list[str]]], context: LedgerContext) -> NewTransaction:
+    rows = [csv_row(columns, line, values) for line, values in records]
+    first = rows[0]
+    details: list[dict[str, Any]] = []
+    for row in rows:
+        commodity = context.commodity(row.get("commodity_id") or row.get("commodity") or "")
+        detail: dict[str, Any] = {
+            "account_id": context.account(row.get("account_id") or row.get("account") or "").id,
+            "amount": {"commodity_id": commodity.id, "amount": row["amount"]},
+        }
+        price_commodity = row.get("price_commodity_id") or row.get("price_commodity")
+        if price_commodity:
+            detail["price"] = {
+                "commodity_id": context.commodity(price_commodity).id,
+                "price": {
+                    "numerator": row.get("price_numerator"),
+                    "denominator": row.get("price_denominator"),
+                },
+            }
+        details.append(detail)
+
+    return NewTransaction.model_validate(
+        {
+            "description": first["description"],
+            "date_time": first["date_time"],
+            "state": first.get("state") or TransactionState.UNCLEARED.value,
+            "tags": [tag for tag in (first.get("tags") or "").split(";") if tag],
+            "details": details,
+        }
+    )
+
+
+async def parse_csv(
+    lines: AsyncIterator[tuple[int, str]],
+    context: LedgerContext,
+) -> AsyncIterator[tuple[int, NewTransaction | str]]:
+    """Parse CSV lines into transactions.
+
+    Yields:
+        The line number of the first row of a transaction and the transaction or the error.
+
+    """
+    columns: list[str] | None = None
+    id_index = 0
+    group: list[tuple[int, list[str]]] = []
+    group_id: str | None = None
+    group_line = 0
+    record = ""
+    record_line = 0
+
+    async for number, line in lines:
+        # a quoted field may span several lines
+        record = f"{record}\n{line}" if record else line
+        record_line = record_line or number
+        if record.count('"') % 2:
+            continue
+        values = next(csv.reader([record]), [])
+        line_number, record, record_line = record_line, "", 0
+        if not any(values):
+            continue
+
+        if columns is None:
+            columns = [column.strip() for column in values]
+            missing = CSV_REQUIRED_COLUMNS - set(columns)
+            if missing:
+                raise InvalidContent(f"CSV header misses columns: {', '.join(sorted(missing))}")
+            id_index = columns.index("transaction_id")
+            continue
+
+        # a row with a wrong number of values fails the transaction it belongs to
+        transaction_id = values[id_index] if id_index < len(values) else None
+        if group and transaction_id != group_id:
+            yield group_line, _build(csv_transaction, columns, group, context)
+            group = []
+        if not group:
+            group_id, group_line = transaction_id, line_number
+        group.append((line_number, values))
+
+    if group and columns is not None:
+        yield group_line, _build(csv_transaction, columns, group, context)
+
+
+# Journal import supports the common subset of the hledger and ledger-cli format:
+#
+#   2024-01-15 * (code) Grocery shopping  ; comment
+#       Expenses:Food         $50.00
+#       Assets:Cash:EUR       -46.00 EUR @@ $50.00
+#       Assets:Cash
+#
+# Dates may use -, / or . separators. `*` marks a cleared and `!` a pending transaction.
+# Amounts are in commodity units with the commodity code or symbol before or after the number,
+# one posting per transaction may omit the amount to balance the others. Prices use `@` for a unit
+# price and `@@` for a total price, balance assertions are ignored. Directives, comments, virtual
+# postings, automated and periodic transactions are not supported and skipped or rejected.
+JOURNAL_HEADER = re.compile(
+    r"^(?P<date>\d{4}[-/.]\d{1,2}[-/.]\d{1,2})(?:=\S+)?"
+    r"(?:\s+(?P<status>[*!]))?"
+    r"(?:\s+\((?P<code>[^)]*)\))?"
+    r"\s*(?P<description>.*)$"
+)
+JOURNAL_AMOUNT = re.compile(
+    r"^(?P<sign>-)?\s*(?P<prefix>[^\d\s.,+-]+)?\s*(?P<inner_sign>[-+])?\s*"
+    r"(?P<number>\d[\d,]*(?:\.\d*)?|\.\d+)\s*(?P<suffix>[^\d\s.,+-]+)?$"
+)
+JOURNAL_SEPARATOR = re.compile(r"\t|\s{2,}")
+JOURNAL_STATES = {
+    "*": TransactionState.CLEARED,
+    "!": TransactionState.PENDING,
+    None: TransactionState.UNCLEARED,
+}
+
+
+def journal_amount(text: str, context: LedgerContext) -> tuple[Decimal, Commodity]:
+    match = JOURNAL_AMOUNT.match(text.strip())
+    if match is None or not (match["prefix"] or match["suffix"]):
+        raise ImportLineError(f"Invalid amount {text.strip()!r}")
+    try:
+        number = Decimal(match["number"].replace(",", ""))
+    except InvalidOperation as e:
+        raise ImportLineError(f"Invalid amount {text.strip()!r}") from e
+    if match["sign"] or match["inner_sign"] == "-":
+        number = -number
+    return number, context.commodity(match["prefix"] or match["suffix"])
+
+
+def journal_posting(text: str, context: LedgerContext) -> dict[str, Any]:
+    text = text.split(";", 1)[0].strip()
+    if text[:1] in ("*", "!"):
+        text = text[1:].strip()
+
+    account_path, *rest = JOURNAL_SEPARATOR.split(text, maxsplit=1)
+    if account_path[:1] in ("(", "["):
+        raise ImportLineError(f"Virtual posting {account_path!r} is not supported")
+    posting: dict[str, Any] = {"account_id": context.account(account_path).id}
+
+    # balance assertions do not change the transaction
+    amount_text = rest[0].split("=", 1)[0].strip() if rest else ""
+    if not amount_text:
+        return posting
+
+    price_text = ""
+    total_price = "@@" in amount_text
+    if total_price:
+        amount_text, price_text = amount_text.split("@@", 1)
+    elif "@" in amount_text:
+        amount_text, price_text = amount_text.split("@", 1)
+
+    number, commodity = journal_amount(amount_text, context)
+    amount = to_minor_units(number, commodity)
+    posting["amount"] = {"commodity_id": commodity.id, "amount": amount}
+
+    if price_text:
+        price_number, price_commodity = journal_amount(price_text, context)
+        if total_price:
+            if amount == 0:
+                raise ImportLineError("Total price of a zero amount")
+            price = Fraction(to_minor_units(abs(price_number), price_commodity), abs(amount))
+        else:
+            price = Fraction(abs(price_number)) * price_commodity.subunit / commodity.subunit
+        posting["price"] = {
+            "commodity_id": price_commodity.id,
+            "price": {"numerator": price.numerator, "denominator": price.denominator},
+        }
+    return posting
+
+
+def journal_transaction(header: re.Match[str], postings: list[str], context: LedgerContext) -> NewTransaction:
+    details = [journal_posting(posting, context) for posting in postings]
+
+    missing = [detail for detail in details if "amount" not in detail]
+    if len(missing) > 1:
+        raise ImportLineError("Only one posting may omit the amount")
+    if missing:
+        totals: dict[UUID, int] = defaultdict(int)
+        for detail in details:
+            if "amount" in detail:
+                total = Detail.model_validate(detail).total
+                totals[total.commodity_id] += total.amount
+        remainders = [(commodity_id, amount) for commodity_id, amount in totals.items() if amount]
+        if len(remainders) != 1:
+            raise ImportLineError("Can not infer the missing amount")
+        [(commodity_id, amount)] = remainders
+        missing[0]["amount"] = {"commodity_id": commodity_id, "amount": -amount}
+
+    date = datetime.strptime(re.sub(r"[/.]", "-", header["date"]), "%Y-%m-%d").replace(tzinfo=timezone.utc)
+    return NewTransaction.model_validate(
+        {
+            "description": header["description"].split(";", 1)[0].strip(),
+            "date_time": date,
+            "state": JOURNAL_STATES[header["status"]],
+            "details": details,
+        }
+    )
+
+
+async def parse_journal(
+    lines: AsyncIterator[tuple[int, str]],
+    context: LedgerContext,
+) -> AsyncIterator[tuple[int, NewTransaction | str]]:
+    """Parse journal lines into transactions.
+
+    Yields:
+        The line number of a transaction header and the transaction or the error.
+
+    """
+    header: re.Match[str] | None = None
+    header_line = 0
+    postings: list[str] = []
+
+    async for number, line in lines:
+        if line[:1] in (" ", "\t"):
+            posting = line.strip()
+            if header is not None and posting and posting[0] not in (";", "#"):
+                postings.append(posting)
+            continue
+
+        # any non indented line ends the current transaction
+        if header is not None:
+            yield header_line, _build(journal_transaction, header, postings, context)
+            header, postings = None, []
+
+        # blank lines, comments, directives, automated and periodic transactions are skipped
+        header = JOURNAL_HEADER.match(line)
+        header_line = number
+
+    if header is not None:
+        yield header_line, _build(journal_transaction, header, postings, context)
+
+
+def _build(factory: Callable[..., NewTransaction], *args: Any) -> NewTransaction | str:
+    try:
+        return factory(*args)
+    except ValidationError as e:
+        return format_validation_error(e)
+    except ValueError as e:
+        return str(e)
+
+
+Parser = Callable[[AsyncIterator[tuple[int, str]], LedgerContext], AsyncIterator[tuple[int, NewTransaction | str]]]
+
+PARSERS: dict[ImportFormat, Parser] = {
+    ImportFormat.CSV: parse_csv,
+    ImportFormat.JOURNAL: parse_journal,
+}
+
+
+@add_service(scope="scoped")
+class ImportsBL:
+    def __init__(
+        self,
+        accounts: AccountsBL,
+        commodities: CommoditiesBL,
+        transactions: TransactionsDAL,
+    ):
+        self.accounts: AccountsBL = accounts
+        self.commodities: CommoditiesBL = commodities
+        self.transactions: TransactionsDAL = transactions
+
+    async def import_transactions(
+        self,
+        ledger_id: LedgerUUID,
+        chunks: AsyncIterable[bytes],
+        import_format: ImportFormat,
+        size_limit: int,
+        batch_size: int = IMPORT_BATCH_SIZE,
+    ) -> ImportResult:
+        """Import transactions from a stream of file chunks.
+
+        Invalid transactions are reported in the result and do not stop the import.
+        Valid transactions are written in batches of `batch_size` while the file is being read,
+        so the transactions read before a `PayloadTooLarge` or `InvalidContent` error stay imported.
+        """
+        accounts = await self.accounts.get_ledger_accounts(ledger_id)
+        commodities = await self.commodities.get_ledger_commodities(ledger_id)
+        context = LedgerContext.build(accounts=accounts, commodities=commodities)
+        references = DetailsReferences(
+            accounts={account.id: account for account in accounts},
+            commodities={commodity.id: commodity for commodity in commodities},
+        )
+        result = ImportResult()
+        batch: list[tuple[int, NewTransaction]] = []
+        async for line, transaction in PARSERS[import_format](iter_lines(chunks, size_limit), context):
+            if isinstance(transaction, str):
+                result.add_error(line, transaction)
+                continue
+            batch.append((line, transaction))
+            if len(batch) == batch_size:
+                await self._write(ledger_id, batch, references, result)
+                batch = []
+        if batch:
+            await self._write(ledger_id, batch, references, result)
+
+        return result
+
+    async def _write(
+        self,
+        ledger_id: LedgerUUID,
+        batch: list[tuple[int, NewTransaction]],
+        references: DetailsReferences,
+        result: ImportResult,
+    ) -> None:
+        ids, errors = await self.transactions.create_transactions(
+            ledger_id=ledger_id,
+            new_transactions=[transaction for _, transaction in batch],
+            references=references,
+            ordered=False,
+        )
+        for position, ((line, _), id_) in enumerate(zip(batch, ids, strict=True)):
+            if id_ is None:
+                result.add_error(line, errors.get(position, "Not processed"))
+            else:
+                result.created += 1
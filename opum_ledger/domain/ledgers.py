@@ -3,17 +3,18 @@ from uuid import uuid7
 
 import pendulum
 from beanie import UpdateResponse
-from beanie.odm.operators.update.general import Set
-from beanie.odm.queries.find import FindOne
+from beanie.odm.operators.update.general import Inc, Set
 from essentials.exceptions import ConflictException, ObjectNotFound
-from pendulum import DateTime
 from pydantic import UUID7, BaseModel, ConfigDict
 from pymongo.errors import DuplicateKeyError
-from pymongo.results import UpdateResult
 
 from opum_ledger.core.exceptions import PreconditionFailed
 from opum_ledger.core.services import add_service
+from opum_ledger.domain.changes import ChangesDAL
+from opum_ledger.domain.types.change import ChangeEntity, ChangeOperation
 from opum_ledger.domain.types.ledger import LedgerCreatedAt, LedgerDescription, LedgerName, LedgerUpdatedAt, LedgerUUID
+from opum_ledger.domain.types.revision import Revision
+from opum_ledger.models.base import revision_match
 from opum_ledger.models.ledger import LedgerModel
 
 
@@ -30,6 +31,7 @@ class Ledger(NewLedger):
     id: LedgerUUID
     created_at: LedgerCreatedAt
     updated_at: LedgerUpdatedAt
+    revision: Revision
 
 
 class UpdateLedger(BaseModel):
@@ -39,6 +41,9 @@ class UpdateLedger(BaseModel):
 
 @add_service(scope="scoped")
 class LedgersDAL:
+    def __init__(self, changes: ChangesDAL):
+        self.changes: ChangesDAL = changes
+
     async def create_ledger(
         self,
         new_ledger: NewLedger,
@@ -53,6 +58,7 @@ class LedgersDAL:
         except DuplicateKeyError as e:
             raise ConflictException("Duplicate ledger name already exists") from e
 
+        _ = await self.changes.record(ledger.id, ChangeEntity.LEDGER, ChangeOperation.CREATED, [ledger.id])
         return Ledger.model_validate(ledger)
 
     async def get_ledgers(self) -> list[Ledger]:
@@ -75,39 +81,40 @@ class LedgersDAL:
         self,
         ledger_id: UUID7,
         data: UpdateLedger,
-        updated_at: DateTime | None = None,
+        revision: int | None = None,
     ) -> Ledger:
-        new_data = data.model_dump(exclude_unset=True)
-        if not new_data:
+        """Update the ledger with a single `find_one_and_update`.
+
+        If `revision` is given, the ledger is updated only if it is still at that revision.
+        """
+        update_data = data.model_dump(exclude_unset=True)
+        if not update_data:
             raise ValueError("No data to update")
+        update_data["updated_at"] = pendulum.now("UTC")
 
-        ledger_query: FindOne = LedgerModel.find_one(  # pyright: ignore[reportUnusedCallResult]
+        ledger_query = LedgerModel.find_one(
             LedgerModel.id == ledger_id,
             LedgerModel.deleted_at == None,  # noqa E711
         )
-        ledger = await ledger_query
+        if revision is not None:
+            ledger_query = ledger_query.find_one(revision_match(revision))
+
+        try:
+            ledger: LedgerModel | None = await ledger_query.update(  # pyright: ignore[reportGeneralTypeIssues]
+                Set(update_data),
+                Inc({LedgerModel.revision: 1}),
+                response_type=UpdateResponse.NEW_DOCUMENT,
+            )
+        except DuplicateKeyError as e:
+            raise ConflictException("Duplicate ledger name already exists") from e
 
         if ledger is None:
+            if revision is not None and await self.exists(ledger_id):
+                raise PreconditionFailed(f"Ledger has been modified since revision {revision}")
             raise ObjectNotFound("Ledger not found")
 
-        if updated_at and pendulum.instance(ledger.updated_at) > updated_at:
-            raise PreconditionFailed(f"Ledger has been modified since {updated_at}")
-
-        update_data = data.model_dump(exclude_unset=True)
-        update_data["updated_at"] = pendulum.now("UTC")
-
-        if updated_at is not None:
-            ledger_query = ledger_query.find_one(LedgerModel.updated_at == updated_at)
-
-        update_result: UpdateResult = await ledger_query.update(  # pyright: ignore[reportGeneralTypeIssues]
-            Set(update_data),
-            response_type=UpdateResponse.UPDATE_RESULT,
-        )
-
-        if update_result.matched_count == 0:
-            raise PreconditionFailed(f"Ledger has been modified since {updated_at}")
-
-        return await self.get_ledger(ledger_id)
+        _ = await self.changes.record(ledger_id, ChangeEntity.LEDGER, ChangeOperation.UPDATED, [ledger_id])
+        return Ledger.model_validate(ledger)
 
     async def exists(self, ledger_id: UUID7) -> bool:
         return await LedgerModel.find(LedgerModel.id == ledger_id).exists()
@@ -144,10 +151,10 @@ class LedgersBL:
         self,
         ledger_id: UUID7,
         data: UpdateLedger,
-        updated_at: DateTime | None = None,
+        revision: int | None = None,
     ) -> Ledger:
         return await self.dal.update_ledger(
             ledger_id,
             data,
-            updated_at,
+            revision,
         )
@@ -1,58 +1,178 @@
+import asyncio
+from collections.abc import AsyncIterator, Collection, Iterable, Mapping, Sequence
+from dataclasses import dataclass, field
 from datetime import datetime
-from typing import Any, Literal
+from typing import Any, Literal, NoReturn
 from uuid import uuid7
 
 import pendulum
 from beanie import UpdateResponse
 from beanie.odm.operators.find.array import All, ElemMatch
 from beanie.odm.operators.find.logical import Not
-from beanie.odm.operators.update.general import Set
-from beanie.odm.queries.find import FindMany
+from beanie.odm.operators.update.general import Inc, Set
+from beanie.odm.queries.find import FindMany, FindOne
 from essentials.exceptions import ObjectNotFound
-from pydantic import (
-    UUID7,
-    TypeAdapter,
-)
-from pymongo.results import UpdateResult
+from pydantic import UUID7
+from pymongo.errors import BulkWriteError
 
+from opum_ledger.core.adapters import type_adapter
 from opum_ledger.core.exceptions import PreconditionFailed
 from opum_ledger.core.services import add_service
-from opum_ledger.domain.accounts import AccountsBL
+from opum_ledger.domain.accounts import Account, AccountsBL
+from opum_ledger.domain.balances import BalanceKey, BalancesDAL, details_deltas, merge_deltas
+from opum_ledger.domain.base import Fieldset, api_projection
+from opum_ledger.domain.changes import ChangesDAL
+from opum_ledger.domain.commodities import CommoditiesBL, Commodity
 from opum_ledger.domain.types.account import AccountUUID
+from opum_ledger.domain.types.change import ChangeEntity, ChangeOperation
+from opum_ledger.domain.types.commodity import CommodityUUID
 from opum_ledger.domain.types.ledger import LedgerUUID
 from opum_ledger.domain.types.transaction import (
     AccountBalance,
+    AccountRegisterEntry,
+    BulkTransactionResult,
+    Detail,
+    InvalidNewTransaction,
     NewTransaction,
+    RegisterCursor,
     Transaction,
+    TransactionDetail,
     TransactionOrdering,
+    TransactionsCount,
+    TransactionsCursor,
+    TransactionsExpand,
     TransactionState,
     TransactionUUID,
     UpdateTransaction,
 )
+from opum_ledger.models.base import LIVE_DOCUMENTS, bson_datetime, revision_match
 from opum_ledger.models.transactions import TransactionModel
 
+# Maximum number of matching transactions counted for `TransactionsCount.ESTIMATE`.
+COUNT_ESTIMATE_LIMIT = 10_000
+
+# Number of transactions fetched from the database at once when iterating over a ledger.
+ITER_BATCH_SIZE = 500
+
+# Listed transactions are read as raw documents and validated once into `Transaction`.
+TRANSACTION_PROJECTION = api_projection(Transaction)
+TRANSACTIONS_ADAPTER = type_adapter(list[Transaction])
+REGISTER_ADAPTER = type_adapter(list[AccountRegisterEntry])
+
+# Register entries follow the transactions order, then the order of the details in the transaction.
+REGISTER_SORT = {"date_time": 1, "_id": 1, "index": 1}
+
+
+@dataclass(frozen=True)
+class DetailsReferences:
+    """Accounts and commodities referenced by transactions details, by id."""
+
+    accounts: dict[AccountUUID, Account] = field(default_factory=dict)
+    commodities: dict[CommodityUUID, Commodity] = field(default_factory=dict)
+
+    def denormalize(self, details: Iterable[Detail]) -> list[TransactionDetail]:
+        """Return the details to store, with the account path and the commodity code and subunit copied in."""
+        stored: list[TransactionDetail] = []
+        for detail in details:
+            account = self.accounts.get(detail.account_id)
+            commodity = self.commodities.get(detail.amount.commodity_id)
+            stored.append(
+                TransactionDetail(
+                    account_id=detail.account_id,
+                    amount=detail.amount,
+                    price=detail.price,
+                    account_path=account.path if account else None,
+                    commodity_code=commodity.code if commodity else None,
+                    commodity_subunit=commodity.subunit if commodity else None,
+                )
+            )
+        return stored
+
 
 @add_service(scope="scoped")
 class TransactionsDAL:
     __model__ = TransactionModel
 
+    def __init__(self, balances: BalancesDAL, changes: ChangesDAL):
+        self.balances: BalancesDAL = balances
+        self.changes: ChangesDAL = changes
+
     async def create_transaction(
         self,
         ledger_id: LedgerUUID,
         new_transaction: NewTransaction,
+        references: DetailsReferences,
     ) -> Transaction:
         transaction = TransactionModel(
             id=uuid7(),
             ledger_id=ledger_id,
             date_time=new_transaction.date_time,
             description=new_transaction.description,
-            details=new_transaction.details,
+            details=references.denormalize(new_transaction.details),
             tags=new_transaction.tags,
             state=new_transaction.state,
         )
 
         await transaction.create()
-        return await self.get_transaction(transaction.id)
+        deltas = details_deltas(new_transaction.details)
+        await self.balances.apply_deltas(ledger_id, deltas)
+        _ = await self.changes.record(
+            ledger_id, ChangeEntity.TRANSACTION, ChangeOperation.CREATED, [transaction.id], deltas
+        )
+        return Transaction.model_validate(transaction)
+
+    async def create_transactions(
+        self,
+        ledger_id: LedgerUUID,
+        new_transactions: list[NewTransaction],
+        references: DetailsReferences,
+        ordered: bool = True,
+    ) -> tuple[list[TransactionUUID | None], dict[int, str]]:
+        """Create transactions with a single `insert_many`.
+
+        Returns:
+            The ids of the created transactions in the input order, `None` for the ones not written,
+            and the write errors by input index. If `ordered`, writing stops at the first failure.
+
+        """
+        transactions = [
+            TransactionModel(
+                id=uuid7(),
+                ledger_id=ledger_id,
+                date_time=new_transaction.date_time,
+                description=new_transaction.description,
+                details=references.denormalize(new_transaction.details),
+                tags=new_transaction.tags,
+                state=new_transaction.state,
+            )
+            for new_transaction in new_transactions
+        ]
+        if not transactions:
+            return [], {}
+
+        errors: dict[int, str] = {}
+        try:
+            await TransactionModel.insert_many(transactions, ordered=ordered)
+        except BulkWriteError as e:
+            errors = {error["index"]: error["errmsg"] for error in e.details.get("writeErrors", [])}
+
+        first_error = min(errors, default=len(transactions))
+        ids: list[TransactionUUID | None] = [
+            None if index in errors or (ordered and index > first_error) else transaction.id
+            for index, transaction in enumerate(transactions)
+        ]
+        deltas = merge_deltas(
+            *(
+                details_deltas(transaction.details)
+                for transaction, id_ in zip(transactions, ids, strict=True)
+                if id_ is not None
+            )
+        )
+        await self.balances.apply_deltas(ledger_id, deltas)
+        created = [id_ for id_ in ids if id_ is not None]
+        if created:
+            _ = await self.changes.record(ledger_id, ChangeEntity.TRANSACTION, ChangeOperation.CREATED, created, deltas)
+        return ids, errors
 
     async def get_transaction(
         self,
@@ -82,24 +202,21 @@ class TransactionsDAL:
 
         return Transaction.model_validate(transaction, from_attributes=True)
 
-    async def find_ledger_transactions(  # noqa: C901
+    def _find_query(  # noqa: C901
         self,
         ledger_id: LedgerUUID,
-        # accounts_ids: list[UUID4] | None = None,
         accounts_ids: list[tuple[Literal["=", "-", "+"], UUID7]] | None = None,
         tags: list[str] | None = None,
         state: TransactionState | None = None,
         after: datetime | None = None,
         before: datetime | None = None,
         exchange: bool | None = None,
-        limit: int = 20,
-        skip: int = 0,
-        order_by: TransactionOrdering = TransactionOrdering.DATE_TIME_DESC,
-    ) -> tuple[list[Transaction], int]:
+    ) -> FindMany[TransactionModel]:
+        """Build the query for the ledger transactions matching the filters."""
         request: FindMany[TransactionModel] = TransactionModel.find(
             TransactionModel.ledger_id == ledger_id,
             TransactionModel.deleted_at == None,  # noqa E711
-        ).sort(order_by.value)
+        )
         if after:
             request = request.find(
                 TransactionModel.date_time >= after,
@@ -193,112 +310,411 @@ class TransactionsDAL:
             )
         if compiled_filters["$and"]:
             request = request.find(compiled_filters)
-        count = await request.count()
-        request = request.skip(skip).limit(limit)
-        transactions: list[TransactionModel] = await request.to_list()
+        return request
+
+    async def find_ledger_transactions(
+        self,
+        ledger_id: LedgerUUID,
+        # accounts_ids: list[UUID4] | None = None,
+        accounts_ids: list[tuple[Literal["=", "-", "+"], UUID7]] | None = None,
+        tags: list[str] | None = None,
+        state: TransactionState | None = None,
+        after: datetime | None = None,
+        before: datetime | None = None,
+        exchange: bool | None = None,
+        limit: int = 20,
+        skip: int = 0,
+        order_by: TransactionOrdering = TransactionOrdering.DATE_TIME_DESC,
+        cursor: TransactionsCursor | None = None,
+        count_mode: TransactionsCount = TransactionsCount.EXACT,
+        fieldset: Fieldset[Transaction] | None = None,
+    ) -> tuple[list[Transaction], int | None, bool]:
+        """Find a page of the ledger transactions, with only the fields of `fieldset` if it is given.
+
+        Returns:
+            The transactions, the total number of matching transactions, and whether there is a next page.
+            The total is `None` if `count_mode` is `NONE`, and capped by `COUNT_ESTIMATE_LIMIT` for `ESTIMATE`.
+
+        """
+        request = self._find_query(
+            ledger_id=ledger_id,
+            accounts_ids=accounts_ids,
+            tags=tags,
+            state=state,
+            after=after,
+            before=before,
+            exchange=exchange,
+        )
+
+        # One extra document tells whether there is a next page without counting.
+        page_size = limit + 1
+        sort = {
+            "date_time": order_by.direction,
+            "_id": order_by.direction,
+        }
+        match = request.get_filter_query()
+        cursor_match: dict[str, Any] | None = None
+        if cursor is not None:
+            operator = "$gt" if order_by == TransactionOrdering.DATE_TIME_ASC else "$lt"
+            # The `date_time` bound starts the index scan at the cursor, the `$or` skips its ties.
+            cursor_match = {
+                "date_time": {f"{operator}e": cursor.date_time},
+                "$or": [
+                    {"date_time": {operator: cursor.date_time}},
+                    {"date_time": cursor.date_time, "_id": {operator: cursor.id}},
+                ],
+            }
 
-        return TypeAdapter(list[Transaction]).validate_python(transactions, from_attributes=True), count
+        projection = fieldset.projection if fieldset else TRANSACTION_PROJECTION
+        page: list[dict[str, Any]] = [
+            {"$skip": skip},
+            {"$limit": page_size},
+            {"$project": projection},
+        ]
+        count: int | None = None
+        if count_mode == TransactionsCount.NONE or cursor_match:
+            # A cursor page reads only the documents after the cursor, the total is counted apart.
+            page_pipeline = [
+                {"$match": {"$and": [match, cursor_match]} if cursor_match else match},
+                {"$sort": sort},
+                *page,
+            ]
+            if count_mode == TransactionsCount.NONE:
+                documents = await TransactionModel.aggregate(page_pipeline).to_list()
+            else:
+                documents, count = await asyncio.gather(
+                    TransactionModel.aggregate(page_pipeline).to_list(),
+                    self._count_transactions(match, count_mode),
+                )
+        else:
+            # The first page and the total come from one `$facet` so the filters are evaluated once.
+            counting: list[dict[str, Any]] = [{"$count": "count"}]
+            if count_mode == TransactionsCount.ESTIMATE:
+                counting.insert(0, {"$limit": COUNT_ESTIMATE_LIMIT})
+            pipeline = [
+                {"$match": match},
+                {"$sort": sort},
+                {
+                    "$facet": {
+                        "transactions": page,
+                        "count": counting,
+                    }
+                },
+            ]
+            [facet] = await TransactionModel.aggregate(pipeline).to_list()
+            documents = facet["transactions"]
+            count = facet["count"][0]["count"] if facet["count"] else 0
+
+        if fieldset:
+            return fieldset.validate(documents[:limit]), count, len(documents) > limit
+        return self._validate_documents(documents[:limit]), count, len(documents) > limit
+
+    @staticmethod
+    async def _count_transactions(match: Mapping[str, Any], count_mode: TransactionsCount) -> int:
+        """Count the transactions matching the filters, up to `COUNT_ESTIMATE_LIMIT` for `ESTIMATE`."""
+        collection = TransactionModel.get_pymongo_collection()
+        if count_mode == TransactionsCount.ESTIMATE:
+            return await collection.count_documents(match, limit=COUNT_ESTIMATE_LIMIT)
+        return await collection.count_documents(match)
+
+    async def iter_ledger_transactions(
+        self,
+        ledger_id: LedgerUUID,
+        accounts_ids: list[tuple[Literal["=", "-", "+"], UUID7]] | None = None,
+        tags: list[str] | None = None,
+        state: TransactionState | None = None,
+        after: datetime | None = None,
+        before: datetime | None = None,
+        exchange: bool | None = None,
+        order_by: TransactionOrdering = TransactionOrdering.DATE_TIME_ASC,
+        batch_size: int = ITER_BATCH_SIZE,
+    ) -> AsyncIterator[list[Transaction]]:
+        """Iterate over all the matching transactions in batches.
+
+        A single database cursor is used and only one batch is held in memory at a time.
+        """
+        request = self._find_query(
+            ledger_id=ledger_id,
+            accounts_ids=accounts_ids,
+            tags=tags,
+            state=state,
+            after=after,
+            before=before,
+            exchange=exchange,
+        )
+        cursor = TransactionModel.get_pymongo_collection().find(
+            request.get_filter_query(),
+            TRANSACTION_PROJECTION,
+            sort=[("date_time", order_by.direction), ("_id", order_by.direction)],
+            batch_size=batch_size,
+        )
+        try:
+            documents: list[dict[str, Any]] = []
+            async for document in cursor:
+                documents.append(document)
+                if len(documents) == batch_size:
+                    yield self._validate_documents(documents)
+                    documents = []
+            if documents:
+                yield self._validate_documents(documents)
+        finally:
+            await cursor.close()
+
+    @staticmethod
+    def _validate_documents(documents: list[dict[str, Any]]) -> list[Transaction]:
+        """Validate the documents read with `TRANSACTION_PROJECTION`, once, into `Transaction`."""
+        return TRANSACTIONS_ADAPTER.validate_python(documents)
 
     async def update_ledger_transaction(
         self,
         ledger_id: LedgerUUID,
         transaction_id: TransactionUUID,
         data: UpdateTransaction,
-        updated_at: pendulum.DateTime | None = None,
+        references: DetailsReferences,
+        revision: int | None = None,
     ) -> Transaction:
-        transaction_query = TransactionModel.find_one(
-            TransactionModel.id == transaction_id,
-            TransactionModel.ledger_id == ledger_id,
-            TransactionModel.deleted_at == None,  # noqa E711
-        )
-        transaction = await transaction_query
-        if not transaction:
-            raise ObjectNotFound("Transaction not found.")
-
-        if updated_at and pendulum.instance(transaction.updated_at) > updated_at:
-            raise PreconditionFailed("Transaction has been modified since the provided timestamp.")
+        """Update the transaction with a single `find_one_and_update`.
 
+        If `revision` is given, the transaction is updated only if it is still at that revision.
+        The old document is returned by the update, for the balance deltas, and the update is applied
+        to it to build the updated transaction without reading it again.
+        """
+        details = references.denormalize(data.details) if data.details is not None else None
         update_data = data.model_dump(exclude_unset=True)
-        update_data["updated_at"] = pendulum.now("UTC")
-
-        if updated_at is not None:
-            transaction_query = transaction_query.find_one(
-                TransactionModel.updated_at == updated_at,
-            )
+        if details is not None:
+            update_data["details"] = [detail.model_dump() for detail in details]
+        update_data["updated_at"] = bson_datetime(pendulum.now("UTC"))
 
-        update_result: UpdateResult = await transaction_query.update(  # pyright: ignore[reportGeneralTypeIssues]
+        old_transaction: TransactionModel | None = await self._write_query(  # pyright: ignore[reportGeneralTypeIssues]
+            ledger_id, transaction_id, revision
+        ).update(
             Set(update_data),
-            response_type=UpdateResponse.UPDATE_RESULT,
+            Inc({TransactionModel.revision: 1}),
+            response_type=UpdateResponse.OLD_DOCUMENT,
         )
+        if old_transaction is None:
+            await self._raise_not_written(ledger_id, transaction_id, revision)
 
-        if update_result.matched_count == 0:
-            raise PreconditionFailed("Transaction has been modified since the provided timestamp.")
+        deltas: dict[BalanceKey, int] = {}
+        if data.details is not None:
+            deltas = merge_deltas(
+                details_deltas(data.details),
+                details_deltas(old_transaction.details, sign=-1),
+            )
+            await self.balances.apply_deltas(ledger_id, deltas)
+        _ = await self.changes.record(
+            ledger_id, ChangeEntity.TRANSACTION, ChangeOperation.UPDATED, [transaction_id], deltas
+        )
 
-        return await self.get_transaction(transaction_id)
+        updated_fields = {name: getattr(data, name) for name in data.model_fields_set}
+        if details is not None:
+            updated_fields["details"] = details
+        if data.date_time is not None:
+            updated_fields["date_time"] = bson_datetime(data.date_time)
+        return Transaction.model_validate(old_transaction).model_copy(
+            update={
+                **updated_fields,
+                "updated_at": update_data["updated_at"],
+                "revision": old_transaction.revision + 1,
+            }
+        )
 
     async def delete_ledger_transaction(
         self,
         ledger_id: LedgerUUID,
         transaction_id: TransactionUUID,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ):
-        transaction_query = TransactionModel.find_one(
+        old_transaction: TransactionModel | None = await self._write_query(  # pyright: ignore[reportGeneralTypeIssues]
+            ledger_id, transaction_id, revision
+        ).update(
+            Set({"deleted_at": pendulum.now("UTC")}),
+            Inc({TransactionModel.revision: 1}),
+            response_type=UpdateResponse.OLD_DOCUMENT,
+        )
+        if old_transaction is None:
+            await self._raise_not_written(ledger_id, transaction_id, revision)
+
+        deltas = details_deltas(old_transaction.details, sign=-1)
+        await self.balances.apply_deltas(ledger_id, deltas)
+        _ = await self.changes.record(
+            ledger_id, ChangeEntity.TRANSACTION, ChangeOperation.DELETED, [transaction_id], deltas
+        )
+
+    @staticmethod
+    def _write_query(
+        ledger_id: LedgerUUID,
+        transaction_id: TransactionUUID,
+        revision: int | None,
+    ) -> FindOne[TransactionModel]:
+        query = TransactionModel.find_one(
             TransactionModel.id == transaction_id,
             TransactionModel.ledger_id == ledger_id,
             TransactionModel.deleted_at == None,  # noqa E711
         )
-        transaction = await transaction_query
-        if not transaction:
-            raise ObjectNotFound("Transaction not found.")
+        if revision is not None:
+            query = query.find_one(revision_match(revision))
+        return query
 
-        if updated_at and pendulum.instance(transaction.updated_at) > updated_at:
-            raise PreconditionFailed("Transaction has been modified since the provided timestamp.")
-
-        if updated_at is not None:
-            transaction_query = transaction_query.find_one(
-                TransactionModel.updated_at == updated_at,
-            )
+    @staticmethod
+    async def _raise_not_written(
+        ledger_id: LedgerUUID,
+        transaction_id: TransactionUUID,
+        revision: int | None,
+    ) -> NoReturn:
+        """Raise why a conditional write matched no transaction, only called on the failure path."""
+        if (
+            revision is not None
+            and await TransactionModel.find(
+                TransactionModel.id == transaction_id,
+                TransactionModel.ledger_id == ledger_id,
+                TransactionModel.deleted_at == None,  # noqa E711
+            ).exists()
+        ):
+            raise PreconditionFailed(f"Transaction has been modified since revision {revision}")
+        raise ObjectNotFound("Transaction not found.")
 
-        update_result: UpdateResult = await transaction_query.update(  # pyright: ignore[reportGeneralTypeIssues]
-            Set({"deleted_at": pendulum.now("UTC")}),
-            response_type=UpdateResponse.UPDATE_RESULT,
+    async def get_ledger_account_balance(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+    ) -> list[AccountBalance]:
+        return await self.balances.get_account_balance(
+            ledger_id=ledger_id,
+            account_id=account_id,
         )
 
-        if update_result.matched_count == 0:
-            raise PreconditionFailed("Transaction has been modified since the provided timestamp.")
+    async def get_ledger_account_balance_drift(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+    ) -> dict[CommodityUUID, int]:
+        return await self.balances.get_account_drift(
+            ledger_id=ledger_id,
+            account_id=account_id,
+        )
 
-    async def get_ledger_account_balance(
+    async def get_account_register(
         self,
         ledger_id: LedgerUUID,
         account_id: AccountUUID,
-    ) -> list[AccountBalance]:
-        aggregation = TransactionModel.aggregate(
-            projection_model=AccountBalance,
-            aggregation_pipeline=[
+        after: datetime | None = None,
+        before: datetime | None = None,
+        limit: int = 20,
+        cursor: RegisterCursor | None = None,
+    ) -> tuple[list[AccountRegisterEntry], dict[CommodityUUID, int], bool]:
+        """Find a page of the account register, the details of the account in date order with running balances.
+
+        The running balances of a page are computed by `$setWindowFields` over the page only and start
+        from the balances of `cursor`, or from the balances before `after` for the first page, so the
+        cost of a page does not grow with the account history. The transactions are read in the order of
+        the `(ledger_id, details.account_id, date_time, _id)` index.
+
+        Returns:
+            The entries, the balances per commodity after the last entry, and whether there is a next page.
+
+        """
+        match: dict[str, Any] = {"ledger_id": ledger_id, "details.account_id": account_id, **LIVE_DOCUMENTS}
+        date_time: dict[str, datetime] = {}
+        if after is not None:
+            date_time["$gte"] = bson_datetime(after)
+        if before is not None:
+            date_time["$lt"] = bson_datetime(before)
+        entry_match: dict[str, Any] = {"details.account_id": account_id}
+        if cursor is not None:
+            date_time["$gte"] = cursor.date_time
+            entry_match["$or"] = [
+                {"date_time": {"$gt": cursor.date_time}},
+                {"date_time": cursor.date_time, "_id": {"$gt": cursor.id}},
+                {"date_time": cursor.date_time, "_id": cursor.id, "index": {"$gt": cursor.index}},
+            ]
+        if date_time:
+            match["date_time"] = date_time
+
+        if cursor is not None:
+            balances = dict(cursor.balances)
+        elif after is not None:
+            balances = await self._get_account_balances_before(ledger_id, account_id, bson_datetime(after))
+        else:
+            balances = {}
+
+        documents: list[dict[str, Any]] = await TransactionModel.aggregate(
+            [
+                {"$match": match},
+                {"$sort": {"date_time": 1, "_id": 1}},
+                {"$unwind": {"path": "$details", "includeArrayIndex": "index"}},
+                {"$match": entry_match},
+                # One extra entry tells whether there is a next page.
+                {"$limit": limit + 1},
                 {
-                    "$match": {
-                        "ledger_id": ledger_id,
-                        "details.account_id": account_id,
+                    "$setWindowFields": {
+                        "partitionBy": "$details.amount.commodity_id",
+                        "sortBy": REGISTER_SORT,
+                        "output": {
+                            "balance": {
+                                "$sum": "$details.amount.amount",
+                                "window": {"documents": ["unbounded", "current"]},
+                            },
+                        },
                     }
                 },
+                {"$sort": REGISTER_SORT},
                 {
-                    "$unwind": "$details",
+                    "$project": {
+                        "_id": 0,
+                        "transaction_id": "$_id",
+                        "date_time": 1,
+                        "description": 1,
+                        "state": 1,
+                        "index": 1,
+                        "amount": "$details.amount",
+                        "price": "$details.price",
+                        "balance": 1,
+                    }
                 },
+            ]
+        ).to_list()
+
+        entries = REGISTER_ADAPTER.validate_python(documents[:limit])
+        opening = dict(balances)
+        for entry in entries:
+            entry.balance += opening.get(entry.amount.commodity_id, 0)
+            balances[entry.amount.commodity_id] = entry.balance
+        return entries, balances, len(documents) > limit
+
+    async def _get_account_balances_before(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+        before: datetime,
+    ) -> dict[CommodityUUID, int]:
+        """Return the balances of the account before `before`, per commodity.
+
+        They are the materialized balances minus the details from `before` on, the cost follows the
+        details after `before`, usually the recent ones, instead of the whole account history.
+        """
+        balances = {
+            balance.id: balance.balance
+            for balance in await self.balances.get_account_balance(ledger_id=ledger_id, account_id=account_id)
+        }
+        documents: list[dict[str, Any]] = await TransactionModel.aggregate(
+            [
                 {
                     "$match": {
+                        "ledger_id": ledger_id,
                         "details.account_id": account_id,
+                        "date_time": {"$gte": before},
+                        **LIVE_DOCUMENTS,
                     }
                 },
-                {
-                    "$group": {
-                        "_id": "$details.amount.commodity_id",
-                        "balance": {"$sum": "$details.amount.amount"},
-                    }
-                },
-            ],
-        )
-        total: list[AccountBalance] = await aggregation.to_list()
-        return total
+                {"$unwind": "$details"},
+                {"$match": {"details.account_id": account_id}},
+                {"$group": {"_id": "$details.amount.commodity_id", "balance": {"$sum": "$details.amount.amount"}}},
+            ]
+        ).to_list()
+        for document in documents:
+            balances[document["_id"]] = balances.get(document["_id"], 0) - document["balance"]
+        return balances
 
 
 @add_service(scope="scoped")
@@ -307,9 +723,11 @@ class TransactionsBL:
         self,
         dal: TransactionsDAL,
         accounts: AccountsBL,
+        commodities: CommoditiesBL,
     ):
         self.dal: TransactionsDAL = dal
         self.accounts: AccountsBL = accounts
+        self.commodities: CommoditiesBL = commodities
 
     @staticmethod
     def group_accounts(accounts: list[str] | None) -> dict[Literal["+", "-", "="], list[str]]:
@@ -344,6 +762,30 @@ class TransactionsBL:
 
         return grouped_accounts
 
+    async def resolve_accounts(
+        self,
+        ledger_id: LedgerUUID,
+        accounts: list[str] | None,
+    ) -> list[tuple[Literal["=", "-", "+"], UUID7]]:
+        """Resolve signed account paths filters into signed account ids.
+
+        Args:
+            ledger_id: The ledger ID.
+            accounts: List of account paths, optionally prefixed with a sign, see `group_accounts`.
+
+        """
+        grouped_accounts = self.group_accounts(accounts)
+        accounts_ids: list[tuple[Literal["=", "-", "+"], UUID7]] = []
+        if not any(grouped_accounts.values()):
+            return accounts_ids
+
+        index = await self.accounts.get_ledger_accounts_index(ledger_id)
+        accounts_ids.extend(("+", account_id) for account_id in index.resolve(grouped_accounts["+"]))
+        accounts_ids.extend(("-", account_id) for account_id in index.resolve(grouped_accounts["-"]))
+        accounts_ids.extend(("=", account_id) for account_id in index.resolve(grouped_accounts["="]))
+
+        return accounts_ids
+
     async def create_transaction(
         self,
         ledger_id: LedgerUUID,
@@ -352,20 +794,62 @@ class TransactionsBL:
         return await self.dal.create_transaction(
             ledger_id=ledger_id,
             new_transaction=new_transaction,
+            references=await self.get_stored_references(ledger_id),
+        )
+
+    async def create_transactions(
+        self,
+        ledger_id: LedgerUUID,
+        items: Sequence[NewTransaction | InvalidNewTransaction],
+        ordered: bool = True,
+    ) -> list[BulkTransactionResult]:
+        """Create transactions in bulk.
+
+        The items are validated with the request body, see `BulkNewTransaction`, and all the valid ones
+        are written at once. If `ordered`, processing stops at the first invalid or failed item,
+        like an ordered `insert_many`.
+        """
+        results: dict[int, BulkTransactionResult] = {}
+        valid: list[tuple[int, NewTransaction]] = []
+        for index, item in enumerate(items):
+            if ordered and results:
+                results[index] = BulkTransactionResult(index=index, error="Not processed")
+            elif isinstance(item, InvalidNewTransaction):
+                results[index] = BulkTransactionResult(index=index, error=item.error)
+            else:
+                valid.append((index, item))
+
+        ids, errors = await self.dal.create_transactions(
+            ledger_id=ledger_id,
+            new_transactions=[new_transaction for _, new_transaction in valid],
+            references=await self.get_stored_references(ledger_id),
+            ordered=ordered,
         )
+        for position, ((index, _), id_) in enumerate(zip(valid, ids, strict=True)):
+            results[index] = BulkTransactionResult(
+                index=index,
+                id=id_,
+                error=None if id_ is not None else errors.get(position, "Not processed"),
+            )
+
+        return [results[index] for index in range(len(items))]
 
     async def update_ledger_transaction(
         self,
         ledger_id: LedgerUUID,
         transaction_id: TransactionUUID,
         data: UpdateTransaction,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ) -> Transaction:
+        references = DetailsReferences()
+        if data.details is not None:
+            references = await self.get_stored_references(ledger_id)
         transaction = await self.dal.update_ledger_transaction(
             ledger_id=ledger_id,
             transaction_id=transaction_id,
             data=data,
-            updated_at=updated_at,
+            references=references,
+            revision=revision,
         )
 
         return transaction
@@ -382,31 +866,13 @@ class TransactionsBL:
         skip: int = 0,
         limit: int = 20,
         order_by: TransactionOrdering = TransactionOrdering.DATE_TIME_DESC,
-    ) -> tuple[list[Transaction], int]:
-        grouped_accounts = self.group_accounts(accounts)
-        ledger_accounts = {
-            "-": (
-                await self.accounts.get_ledger_accounts(ledger_id=ledger_id, paths=grouped_accounts["-"])
-                if grouped_accounts["-"]
-                else []
-            ),
-            "+": (
-                await self.accounts.get_ledger_accounts(ledger_id=ledger_id, paths=grouped_accounts["+"])
-                if grouped_accounts["+"]
-                else []
-            ),
-            "=": (
-                await self.accounts.get_ledger_accounts(ledger_id=ledger_id, paths=grouped_accounts["="])
-                if grouped_accounts["="]
-                else []
-            ),
-        }
-        accounts_ids: list[tuple[Literal["=", "-", "+"], UUID7]] = []
-        accounts_ids.extend(("+", account.id) for account in ledger_accounts["+"])
-        accounts_ids.extend(("-", account.id) for account in ledger_accounts["-"])
-        accounts_ids.extend(("=", account.id) for account in ledger_accounts["="])
+        cursor: TransactionsCursor | None = None,
+        count_mode: TransactionsCount = TransactionsCount.EXACT,
+        fieldset: Fieldset[Transaction] | None = None,
+    ) -> tuple[list[Transaction], int | None, bool]:
+        accounts_ids = await self.resolve_accounts(ledger_id, accounts)
 
-        transactions, count = await self.dal.find_ledger_transactions(
+        return await self.dal.find_ledger_transactions(
             ledger_id=ledger_id,
             accounts_ids=accounts_ids,
             tags=tags,
@@ -417,8 +883,74 @@ class TransactionsBL:
             skip=skip,
             limit=limit,
             order_by=order_by,
+            cursor=cursor,
+            count_mode=count_mode,
+            fieldset=fieldset,
         )
-        return transactions, count
+
+    async def get_stored_references(self, ledger_id: LedgerUUID) -> DetailsReferences:
+        """Return the references copied into the details of the written transactions.
+
+        They come from the cached ledger accounts index and commodities, a write makes no extra
+        round trips while the ledger is cached.
+        """
+        accounts, commodities = await asyncio.gather(
+            self.accounts.get_ledger_accounts_index(ledger_id),
+            self.commodities.get_ledger_commodities_index(ledger_id),
+        )
+        return DetailsReferences(accounts=accounts.accounts, commodities=commodities.commodities)
+
+    async def get_details_references(
+        self,
+        ledger_id: LedgerUUID,
+        details: Iterable[Detail],
+        expand: Collection[TransactionsExpand] = tuple(TransactionsExpand),
+    ) -> DetailsReferences:
+        """Return the accounts and the commodities referenced by the details.
+
+        Each kind selected by `expand` is read with a single query for all the details.
+        """
+        account_ids: dict[AccountUUID, None] = {}
+        commodity_ids: dict[CommodityUUID, None] = {}
+        for detail in details:
+            account_ids[detail.account_id] = None
+            commodity_ids[detail.amount.commodity_id] = None
+            if detail.price is not None:
+                commodity_ids[detail.price.commodity_id] = None
+
+        references = DetailsReferences()
+        if TransactionsExpand.ACCOUNTS in expand:
+            for account in await self.accounts.get_ledger_accounts_by_ids(ledger_id, account_ids):
+                references.accounts[account.id] = account
+        if TransactionsExpand.COMMODITIES in expand:
+            for commodity in await self.commodities.get_ledger_commodities_by_ids(ledger_id, commodity_ids):
+                references.commodities[commodity.id] = commodity
+        return references
+
+    async def export_ledger_transactions(
+        self,
+        ledger_id: LedgerUUID,
+        accounts: list[str] | None = None,
+        tags: list[str] | None = None,
+        state: TransactionState | None = None,
+        after: datetime | None = None,
+        before: datetime | None = None,
+        exchange: bool | None = None,
+        order_by: TransactionOrdering = TransactionOrdering.DATE_TIME_ASC,
+    ) -> AsyncIterator[list[Transaction]]:
+        """Iterate over all the ledger transactions matching the filters in batches."""
+        accounts_ids = await self.resolve_accounts(ledger_id, accounts)
+        async for batch in self.dal.iter_ledger_transactions(
+            ledger_id=ledger_id,
+            accounts_ids=accounts_ids,
+            tags=tags,
+            state=state,
+            after=after,
+            before=before,
+            exchange=exchange,
+            order_by=order_by,
+        ):
+            yield batch
 
     async def get_ledger_transaction(
         self,
@@ -434,12 +966,12 @@ class TransactionsBL:
         self,
         ledger_id: LedgerUUID,
         transaction_id: TransactionUUID,
-        updated_at: pendulum.DateTime | None = None,
+        revision: int | None = None,
     ):
         await self.dal.delete_ledger_transaction(
             ledger_id=ledger_id,
             transaction_id=transaction_id,
-            updated_at=updated_at,
+            revision=revision,
         )
 
     async def get_ledger_account_balance(
@@ -453,6 +985,35 @@ class TransactionsBL:
         )
         return balance
 
+    async def get_ledger_account_balance_drift(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+    ) -> dict[CommodityUUID, int]:
+        """Return the drift of the materialized account balances from the transactions, per commodity."""
+        return await self.dal.get_ledger_account_balance_drift(
+            ledger_id=ledger_id,
+            account_id=account_id,
+        )
+
+    async def get_account_register(
+        self,
+        ledger_id: LedgerUUID,
+        account_id: AccountUUID,
+        after: datetime | None = None,
+        before: datetime | None = None,
+        limit: int = 20,
+        cursor: RegisterCursor | None = None,
+    ) -> tuple[list[AccountRegisterEntry], dict[CommodityUUID, int], bool]:
+        return await self.dal.get_account_register(
+            ledger_id=ledger_id,
+            account_id=account_id,
+            after=after,
+            before=before,
+            limit=limit,
+            cursor=cursor,
+        )
+
     async def find_ledger_account_transactions(
         self,
         ledger_id: LedgerUUID,
@@ -462,8 +1023,8 @@ class TransactionsBL:
         skip: int = 0,
         limit: int = 20,
         order_by: TransactionOrdering = TransactionOrdering.DATE_TIME_DESC,
-    ) -> tuple[list[Transaction], int]:
-        transactions, count = await self.dal.find_ledger_transactions(
+    ) -> tuple[list[Transaction], int | None, bool]:
+        return await self.dal.find_ledger_transactions(
             ledger_id=ledger_id,
             accounts_ids=[("=", account_id)],
             after=after,
@@ -472,4 +1033,3 @@ class TransactionsBL:
             limit=limit,
             order_by=order_by,
         )
-        return transactions, count
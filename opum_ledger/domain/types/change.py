@@ -0,0 +1,38 @@
+from enum import Enum
+from typing import Annotated, TypeAlias
+
+from pydantic import BaseModel, Field
+
+from opum_ledger.domain.types.account import AccountUUID
+from opum_ledger.domain.types.commodity import CommodityUUID
+
+
+class ChangeEntity(Enum):
+    LEDGER = "ledger"
+    ACCOUNT = "account"
+    COMMODITY = "commodity"
+    TRANSACTION = "transaction"
+
+
+class ChangeOperation(Enum):
+    CREATED = "created"
+    UPDATED = "updated"
+    DELETED = "deleted"
+
+
+ChangeSequence: TypeAlias = Annotated[
+    int,
+    Field(
+        ...,
+        ge=0,
+        description="The ledger change counter, incremented by every write to the ledger",
+    ),
+]
+
+
+class BalanceDelta(BaseModel):
+    """Change of an account balance in a commodity made by a transaction write."""
+
+    account_id: AccountUUID
+    commodity_id: CommodityUUID
+    amount: int
@@ -0,0 +1,12 @@
+from typing import Annotated, TypeAlias
+
+from pydantic import Field
+
+Revision: TypeAlias = Annotated[
+    int,
+    Field(
+        0,
+        ge=0,
+        description="The revision of the document, incremented on every change and used as the ETag",
+    ),
+]
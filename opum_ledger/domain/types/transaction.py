@@ -1,13 +1,26 @@
+import base64
+from dataclasses import dataclass
 from datetime import datetime
 from enum import Enum
 from fractions import Fraction
-from typing import Annotated, TypeAlias
-
-from pydantic import UUID7, BaseModel, ConfigDict, Field, field_validator
+from typing import Annotated, Self, TypeAlias
 
+from pydantic import (
+    UUID7,
+    BaseModel,
+    ConfigDict,
+    Field,
+    ValidationError,
+    ValidatorFunctionWrapHandler,
+    WrapValidator,
+    field_validator,
+)
+
+from opum_ledger.core.utils import format_validation_error
 from opum_ledger.domain.types.account import AccountUUID
 from opum_ledger.domain.types.commodity import CommodityUUID
 from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.domain.types.revision import Revision
 
 
 class TransactionState(Enum):
@@ -81,6 +94,61 @@ class TransactionOrdering(Enum):
     DATE_TIME_ASC = "+date_time"
     DATE_TIME_DESC = "-date_time"
 
+    @property
+    def direction(self) -> int:
+        """Return the MongoDB sort direction."""
+        return 1 if self == TransactionOrdering.DATE_TIME_ASC else -1
+
+
+class TransactionsCount(Enum):
+    """How to count the transactions matching a listing."""
+
+    EXACT = "exact"
+    ESTIMATE = "estimate"
+    NONE = "none"
+
+
+class TransactionsExpand(Enum):
+    """References of the transactions returned with a page, each referenced document once."""
+
+    ACCOUNTS = "accounts"
+    COMMODITIES = "commodities"
+
+
+class TransactionsCursor(BaseModel):
+    """Keyset pagination position: the sort key of the last transaction of a page."""
+
+    date_time: TransactionDateTime
+    id: TransactionUUID
+
+    def encode(self) -> str:
+        """Encode the cursor into an opaque URL safe token."""
+        return base64.urlsafe_b64encode(self.model_dump_json().encode("utf-8")).rstrip(b"=").decode("ascii")
+
+    @classmethod
+    def decode(cls, token: str) -> Self:
+        """Decode the cursor from the token returned by `encode`.
+
+        Raises:
+            ValueError: If the token is not a valid cursor.
+
+        """
+        try:
+            raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        except ValueError as e:
+            raise ValueError("Invalid cursor") from e
+        return cls.model_validate_json(raw)
+
+
+class RegisterCursor(TransactionsCursor):
+    """Keyset pagination position of an account register: the last detail of a page and the balances after it.
+
+    The next page starts its running balances from `balances` instead of summing the history again.
+    """
+
+    index: int = Field(..., ge=0)
+    balances: dict[CommodityUUID, int] = Field(default_factory=dict)
+
 
 class AccountBalance(BaseModel):
     id: UUID7 = Field(
@@ -157,6 +225,31 @@ class Detail(BaseModel):
         )
 
 
+class TransactionDetail(Detail):
+    """A detail as stored, with copies of the account path and the amount commodity code and subunit.
+
+    The copies are `None` in the details written before they were introduced, until the
+    `denormalize-details` maintenance command fills them in.
+    """
+
+    account_path: str | None = Field(None, description="The account path")
+    commodity_code: str | None = Field(None, description="The code of the amount commodity")
+    commodity_subunit: int | None = Field(None, description="The subunit of the amount commodity")
+
+
+class AccountRegisterEntry(BaseModel):
+    """A detail of the account in its register, with the account balance after it."""
+
+    transaction_id: TransactionUUID
+    date_time: TransactionDateTime
+    description: TransactionDescription
+    state: TransactionState
+    index: int = Field(..., description="The position of the detail in the transaction details")
+    amount: Amount = Field(..., description="The commodity amount")
+    price: Price | None = Field(None, description="The price of the amount")
+    balance: int = Field(..., description="The account balance in the amount commodity after the detail")
+
+
 class TransactionBase(BaseModel):
     description: TransactionDescription
     date_time: TransactionDateTime
@@ -193,9 +286,14 @@ class Transaction(NewTransaction):
     )
     id: TransactionUUID
     ledger_id: LedgerUUID
+    details: list[TransactionDetail] = Field(  # pyright: ignore[reportIncompatibleVariableOverride]
+        ...,
+        description="The transaction details",
+    )
 
     updated_at: TransactionUpdatedAt
     created_at: TransactionCreatedAt
+    revision: Revision
 
 
 class UpdateTransaction(BaseModel):
@@ -207,3 +305,39 @@ class UpdateTransaction(BaseModel):
         None,
         description="The transaction state",
     )
+
+
+class BulkTransactionResult(BaseModel):
+    """Outcome of a single transaction of a bulk request."""
+
+    index: int = Field(
+        ...,
+        description="The position of the transaction in the request",
+    )
+    id: TransactionUUID | None = Field(
+        None,
+        description="The id of the created transaction",
+    )
+    error: str | None = Field(
+        None,
+        description="Why the transaction was not created",
+    )
+
+
+@dataclass(frozen=True)
+class InvalidNewTransaction:
+    """An item of a bulk request that is not a valid `NewTransaction`."""
+
+    error: str
+
+
+def _keep_item_error(value: object, handler: ValidatorFunctionWrapHandler) -> "NewTransaction | InvalidNewTransaction":
+    try:
+        return handler(value)  # pyright: ignore[reportAny]
+    except ValidationError as e:
+        return InvalidNewTransaction(error=format_validation_error(e))
+
+
+# A bulk item is validated as a `NewTransaction` in the same pass as the whole request body,
+# an invalid item becomes an `InvalidNewTransaction` holding its error instead of failing the body.
+BulkNewTransaction: TypeAlias = Annotated[NewTransaction, WrapValidator(_keep_item_error)]
@@ -0,0 +1,145 @@
+#!/usr/bin/env python3
+"""Maintenance commands for the Ledger Service.
+
+Usage:
+    python -m opum_ledger.manage recompute-balances [--ledger-id LEDGER_ID]
+    python -m opum_ledger.manage migrate-indexes [--dry-run]
+    python -m opum_ledger.manage purge-deleted [--retention-days DAYS] [--compact]
+    python -m opum_ledger.manage denormalize-details [--ledger-id LEDGER_ID]
+"""
+
+import argparse
+import asyncio
+from collections.abc import Awaitable, Callable
+from typing import Any
+from uuid import UUID
+
+from opum_ledger.core.logging import config_logger, logger
+from opum_ledger.db import DOCUMENT_MODELS, init_db
+from opum_ledger.domain.balances import BalancesDAL
+from opum_ledger.domain.changes import ChangesDAL, LedgerChangesSignal
+from opum_ledger.domain.details import set_account_path, set_commodity_code
+from opum_ledger.domain.types.change import ChangeEntity, ChangeOperation
+from opum_ledger.models.accounts import AccountModel
+from opum_ledger.models.commodities import CommodityModel
+from opum_ledger.purge import Purger
+from opum_ledger.settings import Settings, load_settings
+
+CommandHandler = Callable[[argparse.Namespace], Awaitable[None]]
+
+
+async def recompute_balances(args: argparse.Namespace) -> None:
+    """Rebuild the materialized account balances from the transactions."""
+    ledger_id: UUID | None = args.ledger_id
+    count = await BalancesDAL().recompute(ledger_id)
+    logger.info("Recomputed %d balances for %s", count, f"ledger {ledger_id}" if ledger_id else "all ledgers")
+
+
+async def migrate_indexes(args: argparse.Namespace) -> None:
+    """Build the indexes declared by the models and drop the ones no longer declared."""
+    dry_run: bool = args.dry_run
+    for model in DOCUMENT_MODELS:
+        collection = model.get_pymongo_collection()
+        declared = model.get_settings().indexes or []
+        # MongoDB builds indexes without blocking reads and writes for the duration of the build,
+        # the new indexes are in place before the old ones are dropped.
+        names = set(await collection.create_indexes(declared)) if declared and not dry_run else set()
+        names.update(index.document["name"] for index in declared)
+        for name in await collection.index_information():
+            if name == "_id_" or name in names:
+                continue
+            if dry_run:
+                logger.info("Would drop index %s.%s", collection.name, name)
+            else:
+                await collection.drop_index(name)
+                logger.info("Dropped index %s.%s", collection.name, name)
+
+
+async def purge_deleted(args: argparse.Namespace) -> None:
+    """Hard delete the documents soft deleted before the retention period."""
+    settings: Settings = args.settings
+    purge_settings = settings.app.purge
+    if args.retention_days is not None:
+        purge_settings = purge_settings.model_copy(update={"retention_days": args.retention_days})
+
+    purger = Purger(purge_settings)
+    for report in await purger.purge():
+        logger.info("Purge %s", report)
+    if args.compact:
+        for collection, freed in (await purger.compact()).items():
+            logger.info("Compacted %s, %d bytes freed", collection, freed)
+
+
+async def denormalize_details(args: argparse.Namespace) -> None:
+    """Copy the account paths and the commodity codes into the transactions details."""
+    ledger_id: UUID | None = args.ledger_id
+    query: dict[str, Any] = {"ledger_id": ledger_id} if ledger_id else {}  # pyright: ignore[reportExplicitAny]
+    changes = ChangesDAL(LedgerChangesSignal())
+
+    accounts = AccountModel.get_pymongo_collection().find(query, {"ledger_id": 1, "path": 1})
+    updated = 0
+    async for account in accounts:
+        transaction_ids = await set_account_path(account["ledger_id"], account["_id"], account["path"])
+        if transaction_ids:
+            _ = await changes.record(
+                account["ledger_id"], ChangeEntity.TRANSACTION, ChangeOperation.UPDATED, transaction_ids
+            )
+        updated += len(transaction_ids)
+    logger.info("Updated the account paths of %d transactions", updated)
+
+    commodities = CommodityModel.get_pymongo_collection().find(query, {"ledger_id": 1, "code": 1, "subunit": 1})
+    updated = 0
+    async for commodity in commodities:
+        transaction_ids = await set_commodity_code(
+            commodity["ledger_id"], commodity["_id"], commodity["code"], commodity["subunit"]
+        )
+        if transaction_ids:
+            _ = await changes.record(
+                commodity["ledger_id"], ChangeEntity.TRANSACTION, ChangeOperation.UPDATED, transaction_ids
+            )
+        updated += len(transaction_ids)
+    logger.info("Updated the commodity codes of %d transactions", updated)
+
+
+def build_parser() -> argparse.ArgumentParser:
+    parser = argparse.ArgumentParser(prog="opum_ledger.manage", description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    recompute = commands.add_parser("recompute-balances", help=recompute_balances.__doc__)
+    recompute.add_argument("--ledger-id", type=UUID, default=None, help="Rebuild only this ledger")
+    recompute.set_defaults(handler=recompute_balances)
+
+    migrate = commands.add_parser("migrate-indexes", help=migrate_indexes.__doc__)
+    migrate.add_argument("--dry-run", action="store_true", help="Only list the indexes to drop")
+    migrate.set_defaults(handler=migrate_indexes)
+
+    purge = commands.add_parser("purge-deleted", help=purge_deleted.__doc__)
+    purge.add_argument("--retention-days", type=int, default=None, help="Override app.purge.retention_days")
+    purge.add_argument("--compact", action="store_true", help="Compact the collections to release the disk space")
+    purge.set_defaults(handler=purge_deleted)
+
+    denormalize = commands.add_parser("denormalize-details", help=denormalize_details.__doc__)
+    denormalize.add_argument("--ledger-id", type=UUID, default=None, help="Update only this ledger")
+    denormalize.set_defaults(handler=denormalize_details)
+
+    return parser
+
+
+async def run(settings: Settings, handler: CommandHandler, args: argparse.Namespace) -> None:
+    client = await init_db(settings)
+    try:
+        await handler(args)
+    finally:
+        await client.close()
+
+
+def main(argv: list[str] | None = None) -> None:
+    args = build_parser().parse_args(argv)
+    settings = load_settings()
+    args.settings = settings
+    config_logger(settings)
+    asyncio.run(run(settings, args.handler, args))
+
+
+if __name__ == "__main__":
+    main()
@@ -3,7 +3,7 @@ from pymongo import IndexModel
 from opum_ledger.core.utils import split_path
 from opum_ledger.domain.types.account import AccountName, AccountPath, AccountPaths, AccountUUID
 from opum_ledger.domain.types.ledger import LedgerUUID
-from opum_ledger.models.base import BaseAppModel
+from opum_ledger.models.base import LIVE_DOCUMENTS, TOMBSTONES, BaseAppModel
 
 
 class AccountModel(BaseAppModel):
@@ -15,7 +15,21 @@ class AccountModel(BaseAppModel):
 
     class Settings:
         name = "accounts"
-        indexes: list[IndexModel] = [IndexModel(["ledger_id", "path", "name"], unique=True)]
+        indexes: list[IndexModel] = [
+            IndexModel(
+                ["ledger_id", "path", "name"],
+                name="ledger_id_path_name_live",
+                unique=True,
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+            # multikey index for the hierarchical lookups, `paths` holds every prefix of the account path
+            IndexModel(
+                ["ledger_id", "paths"],
+                name="ledger_id_paths_live",
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+            IndexModel(["deleted_at"], name="deleted_at_tombstones", partialFilterExpression=TOMBSTONES),
+        ]
 
     @classmethod
     def parse_path(cls, path: AccountPath) -> list[AccountPath]:
@@ -0,0 +1,30 @@
+from datetime import datetime
+
+from beanie import Document
+from pydantic import Field
+from pymongo import IndexModel
+
+from opum_ledger.domain.types.account import AccountUUID
+from opum_ledger.domain.types.commodity import CommodityUUID
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.models.base import utc_now
+
+
+class BalanceModel(Document):
+    """Materialized balance of an account in a single commodity.
+
+    The document is maintained by applying signed deltas on every transaction write,
+    so reading a balance is a single indexed lookup instead of an aggregation over history.
+    """
+
+    ledger_id: LedgerUUID
+    account_id: AccountUUID
+    commodity_id: CommodityUUID
+    balance: int = 0
+    updated_at: datetime = Field(default_factory=utc_now)
+
+    class Settings:
+        name = "balances"
+        indexes: list[IndexModel] = [
+            IndexModel(["ledger_id", "account_id", "commodity_id"], unique=True),
+        ]
@@ -1,9 +1,25 @@
 """Base model for all application models."""
 
 from datetime import datetime, timezone
+from typing import Any
 
 from beanie import Document
-from pydantic import Field
+from pydantic import Field, field_validator
+
+# Partial filter of the indexes over live documents, soft deleted ones are left out of the indexes.
+# Queries must filter `deleted_at == None` for MongoDB to use these indexes.
+LIVE_DOCUMENTS = {"deleted_at": None}
+
+# Partial filter of the index over soft deleted documents, used by the purge job.
+TOMBSTONES = {"deleted_at": {"$gt": datetime(1970, 1, 1, tzinfo=timezone.utc)}}
+
+
+def bson_datetime(value: datetime) -> datetime:
+    """Truncate a datetime to milliseconds, the precision of the datetimes stored in MongoDB.
+
+    A document returned right after a write has the same datetimes as the document read back.
+    """
+    return value.replace(microsecond=value.microsecond // 1000 * 1000)
 
 
 def utc_now() -> datetime:
@@ -17,3 +33,19 @@ class BaseAppModel(Document):
     updated_at: datetime = Field(default_factory=utc_now)
     created_at: datetime = Field(default_factory=utc_now)
     deleted_at: datetime | None = None
+    revision: int = 0
+
+    @field_validator("updated_at", "created_at", "deleted_at", mode="after")
+    @classmethod
+    def truncate_datetime(cls, value: datetime | None) -> datetime | None:
+        return bson_datetime(value) if value is not None else None
+
+
+def revision_match(revision: int) -> dict[str, Any]:  # pyright: ignore[reportExplicitAny]
+    """Return the filter of the documents at the revision.
+
+    Documents written before the revisions were introduced have no `revision` and are at revision 0.
+    """
+    if revision == 0:
+        return {"revision": {"$in": [0, None]}}
+    return {"revision": revision}
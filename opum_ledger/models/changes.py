@@ -0,0 +1,45 @@
+from datetime import datetime
+from uuid import UUID
+
+from beanie import Document
+from pydantic import Field, field_validator
+from pymongo import IndexModel
+
+from opum_ledger.domain.types.change import BalanceDelta, ChangeEntity, ChangeOperation, ChangeSequence
+from opum_ledger.domain.types.ledger import LedgerUUID
+from opum_ledger.models.base import bson_datetime, utc_now
+
+
+class ChangeModel(Document):
+    """A write to a ledger, the sequence of a ledger changes is only appended to."""
+
+    id: UUID  # pyright: ignore[reportIncompatibleVariableOverride,reportGeneralTypeIssues]
+    ledger_id: LedgerUUID
+    seq: ChangeSequence
+    entity: ChangeEntity
+    operation: ChangeOperation
+    ids: list[UUID] = Field(default_factory=list)
+    deltas: list[BalanceDelta] = Field(default_factory=list)
+    created_at: datetime = Field(default_factory=utc_now)
+
+    @field_validator("created_at", mode="after")
+    @classmethod
+    def truncate_created_at(cls, value: datetime) -> datetime:
+        return bson_datetime(value)
+
+    class Settings:
+        name = "changes"
+        indexes: list[IndexModel] = [
+            # the unique sequence per ledger serializes the concurrent writers of a ledger
+            IndexModel(["ledger_id", "seq"], name="ledger_id_seq", unique=True),
+        ]
+
+
+class LedgerSequenceModel(Document):
+    """The last change number allocated for a ledger, incremented to number the next change."""
+
+    id: LedgerUUID  # pyright: ignore[reportIncompatibleVariableOverride,reportGeneralTypeIssues]
+    seq: ChangeSequence
+
+    class Settings:
+        name = "ledger_sequences"
@@ -9,7 +9,7 @@ from opum_ledger.domain.types.commodity import (
     CommodityUUID,
 )
 from opum_ledger.domain.types.ledger import LedgerUUID
-from opum_ledger.models.base import BaseAppModel
+from opum_ledger.models.base import LIVE_DOCUMENTS, TOMBSTONES, BaseAppModel
 
 
 class CommodityModel(BaseAppModel):
@@ -25,4 +25,12 @@ class CommodityModel(BaseAppModel):
 
     class Settings:
         name: str = "commodities"
-        indexes: list[IndexModel] = [IndexModel(["ledger_id", "code"], unique=True)]
+        indexes: list[IndexModel] = [
+            IndexModel(
+                ["ledger_id", "code"],
+                name="ledger_id_code_live",
+                unique=True,
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+            IndexModel(["deleted_at"], name="deleted_at_tombstones", partialFilterExpression=TOMBSTONES),
+        ]
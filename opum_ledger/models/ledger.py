@@ -1,7 +1,7 @@
 from pymongo import IndexModel
 
 from opum_ledger.domain.types.ledger import LedgerDescription, LedgerName, LedgerUUID
-from opum_ledger.models.base import BaseAppModel
+from opum_ledger.models.base import LIVE_DOCUMENTS, BaseAppModel
 
 
 class LedgerModel(BaseAppModel):
@@ -13,4 +13,11 @@ class LedgerModel(BaseAppModel):
 
     class Settings:
         name: str = "ledgers"
-        indexes: list[IndexModel] = [IndexModel(["name"], unique=True)]
+        indexes: list[IndexModel] = [
+            IndexModel(
+                ["name"],
+                name="name_live",
+                unique=True,
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+        ]
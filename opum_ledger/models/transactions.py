@@ -1,31 +1,52 @@
-from pydantic import Field
+from datetime import datetime
+
+from pydantic import Field, field_validator
 from pymongo import IndexModel
 
 from opum_ledger.domain.types.ledger import LedgerUUID
 from opum_ledger.domain.types.transaction import (
-    Detail,
     TransactionDateTime,
     TransactionDescription,
+    TransactionDetail,
     TransactionState,
     TransactionUUID,
 )
-from opum_ledger.models.base import BaseAppModel
+from opum_ledger.models.base import LIVE_DOCUMENTS, TOMBSTONES, BaseAppModel, bson_datetime
 
 
 class TransactionModel(BaseAppModel):
     id: TransactionUUID  #  pyright: ignore[reportGeneralTypeIssues,reportIncompatibleVariableOverride]
     date_time: TransactionDateTime
     description: TransactionDescription
-    details: list[Detail] = Field(default_factory=list)
+    details: list[TransactionDetail] = Field(default_factory=list)
     # TODO: make tags as a list of UUID4
     tags: list[str] = Field(default_factory=list)
     state: TransactionState = Field(TransactionState.UNCLEARED)
     ledger_id: LedgerUUID
 
+    @field_validator("date_time", mode="after")
+    @classmethod
+    def truncate_date_time(cls, value: datetime) -> datetime:
+        return bson_datetime(value)
+
     class Settings:
         name = "transactions"
         indexes: list[IndexModel] = [
-            IndexModel(["ledger_id", "date_time"]),
-            IndexModel(["ledger_id", "tags"]),
-            IndexModel(["ledger_id", "details.account_id"]),
+            IndexModel(
+                ["ledger_id", "date_time", "_id"],
+                name="ledger_id_date_time_id_live",
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+            IndexModel(
+                ["ledger_id", "tags"],
+                name="ledger_id_tags_live",
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+            # multikey index, also serves the account register in date order
+            IndexModel(
+                ["ledger_id", "details.account_id", "date_time", "_id"],
+                name="ledger_id_details_account_id_date_time_id_live",
+                partialFilterExpression=LIVE_DOCUMENTS,
+            ),
+            IndexModel(["deleted_at"], name="deleted_at_tombstones", partialFilterExpression=TOMBSTONES),
         ]
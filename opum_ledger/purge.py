@@ -0,0 +1,190 @@
+"""Purge of the soft deleted documents.
+
+Deletes only set `deleted_at`, the purge removes the documents deleted longer than the retention
+period ago, optionally copying them to `<collection>_archive` collections first. Documents are
+read from the tombstones index and removed in throttled batches, so the job runs next to the
+request handling without starving it.
+"""
+
+import asyncio
+from collections import defaultdict
+from collections.abc import Awaitable, Callable
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Any
+from uuid import UUID
+
+import bson
+import pendulum
+from beanie import Document
+from blacksheep.server.application import Application
+from pymongo.errors import BulkWriteError
+
+from opum_ledger.core.logging import logger
+from opum_ledger.models.accounts import AccountModel
+from opum_ledger.models.balances import BalanceModel
+from opum_ledger.models.base import TOMBSTONES
+from opum_ledger.models.commodities import CommodityModel
+from opum_ledger.models.transactions import TransactionModel
+from opum_ledger.settings import PurgeSettings, Settings
+
+RawDocument = dict[str, Any]  # pyright: ignore[reportExplicitAny]
+
+# MongoDB error code of a duplicate key, an archived document is archived again after a retry.
+DUPLICATE_KEY = 11000
+
+
+@dataclass
+class PurgeReport:
+    collection: str
+    purged: int = 0
+    kept: int = 0
+    size: int = 0
+
+    def __str__(self) -> str:
+        return f"{self.collection}: purged {self.purged} ({self.size} bytes), kept {self.kept} still referenced"
+
+
+class Purger:
+    def __init__(self, settings: PurgeSettings):
+        self.settings: PurgeSettings = settings
+
+    async def purge(self, now: datetime | None = None) -> list[PurgeReport]:
+        """Purge the transactions, accounts and commodities deleted before the retention period.
+
+        Accounts and commodities still referenced by live transactions are kept.
+        """
+        cutoff = (now or pendulum.now("UTC")) - timedelta(days=self.settings.retention_days)
+        return [
+            await self._purge(TransactionModel, cutoff),
+            await self._purge(AccountModel, cutoff, self._referenced_accounts),
+            await self._purge(CommodityModel, cutoff, self._referenced_commodities),
+        ]
+
+    @staticmethod
+    async def compact() -> dict[str, int]:
+        """Compact the purged collections to release the space of the purged documents to the disk.
+
+        Returns:
+            The bytes freed by collection.
+
+        """
+        freed: dict[str, int] = {}
+        for model in (TransactionModel, AccountModel, CommodityModel):
+            collection = model.get_pymongo_collection()
+            result = await collection.database.command({"compact": collection.name})
+            freed[collection.name] = result.get("bytesFreed", 0)
+        return freed
+
+    async def _purge(
+        self,
+        model: type[Document],
+        cutoff: datetime,
+        referenced: Callable[[UUID, list[UUID]], Awaitable[set[UUID]]] | None = None,
+    ) -> PurgeReport:
+        collection = model.get_pymongo_collection()
+        report = PurgeReport(collection=collection.name)
+        query = {"deleted_at": {**TOMBSTONES["deleted_at"], "$lt": cutoff}}
+
+        batch: list[RawDocument] = []
+        cursor = collection.find(query).sort("deleted_at", 1).batch_size(self.settings.batch_size)
+        try:
+            async for document in cursor:
+                batch.append(document)
+                if len(batch) == self.settings.batch_size:
+                    await self._purge_batch(model, batch, cutoff, referenced, report)
+                    batch = []
+                    await asyncio.sleep(self.settings.batch_delay)
+        finally:
+            await cursor.close()
+        if batch:
+            await self._purge_batch(model, batch, cutoff, referenced, report)
+
+        return report
+
+    async def _purge_batch(
+        self,
+        model: type[Document],
+        documents: list[RawDocument],
+        cutoff: datetime,
+        referenced: Callable[[UUID, list[UUID]], Awaitable[set[UUID]]] | None,
+        report: PurgeReport,
+    ) -> None:
+        if referenced is not None:
+            by_ledger: dict[UUID, list[UUID]] = defaultdict(list)
+            for document in documents:
+                by_ledger[document["ledger_id"]].append(document["_id"])
+            kept: set[UUID] = set()
+            for ledger_id, ids in by_ledger.items():
+                kept |= await referenced(ledger_id, ids)
+            report.kept += len(kept)
+            documents = [document for document in documents if document["_id"] not in kept]
+        if not documents:
+            return
+
+        collection = model.get_pymongo_collection()
+        if self.settings.archive:
+            archive = collection.database[f"{collection.name}_archive"]
+            try:
+                _ = await archive.insert_many(documents, ordered=False)
+            except BulkWriteError as e:
+                if any(error["code"] != DUPLICATE_KEY for error in e.details["writeErrors"]):
+                    raise
+
+        # the documents hold native UUIDs, encoded with the UUID representation of the collection
+        size = sum(len(bson.encode(document, codec_options=collection.codec_options)) for document in documents)
+        ids = [document["_id"] for document in documents]
+        result = await collection.delete_many({"_id": {"$in": ids}, "deleted_at": {"$lt": cutoff}})
+        report.purged += result.deleted_count
+        report.size += size
+
+        # balances of the purged accounts and commodities are zero, they have no live transactions
+        if model is AccountModel:
+            _ = await BalanceModel.find({"account_id": {"$in": ids}, "balance": 0}).delete()
+        elif model is CommodityModel:
+            _ = await BalanceModel.find({"commodity_id": {"$in": ids}, "balance": 0}).delete()
+
+    @staticmethod
+    async def _referenced_accounts(ledger_id: UUID, ids: list[UUID]) -> set[UUID]:
+        used = await TransactionModel.get_pymongo_collection().distinct(
+            "details.account_id",
+            {"ledger_id": ledger_id, "deleted_at": None, "details.account_id": {"$in": ids}},
+        )
+        return set(ids) & set(used)
+
+    @staticmethod
+    async def _referenced_commodities(ledger_id: UUID, ids: list[UUID]) -> set[UUID]:
+        collection = TransactionModel.get_pymongo_collection()
+        used: set[UUID] = set()
+        for field in ("details.amount.commodity_id", "details.price.commodity_id"):
+            used.update(
+                await collection.distinct(field, {"ledger_id": ledger_id, "deleted_at": None, field: {"$in": ids}})
+            )
+        return set(ids) & used
+
+
+def use_purge(app: Application, settings: Settings):
+    """Run the purge job every `app.purge.interval` seconds while the application is running.
+
+    Every application process runs its own job if enabled, enable it on a single one.
+    """
+    if not settings.app.purge.enabled:
+        return
+
+    async def purge_job() -> None:
+        purger = Purger(settings.app.purge)
+        while True:
+            await asyncio.sleep(settings.app.purge.interval)
+            try:
+                for report in await purger.purge():
+                    logger.info("Purge %s", report)
+            except Exception:
+                logger.exception("Purge of the deleted documents failed")
+
+    @app.lifespan
+    async def purge_lifespan_hook():  # pyright: ignore[reportUnusedFunction]
+        task = asyncio.create_task(purge_job())
+
+        yield
+
+        _ = task.cancel()
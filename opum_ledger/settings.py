@@ -35,12 +35,43 @@ class StaticSettings(BaseModel):
     static_path: str = "static"
 
 
+class PurgeSettings(BaseModel):
+    enabled: bool = False
+    retention_days: int = 30
+    interval: int = 3600  # seconds between runs
+    batch_size: int = 500
+    batch_delay: float = 0.5  # seconds between batches
+    archive: bool = False
+
+
+class EventsSettings(BaseModel):
+    poll_interval: float = 1.0  # seconds between the reads of the changes written by other processes
+    queue_size: int = 1000  # events, a subscriber falling further behind is disconnected
+    heartbeat: int = 15  # seconds between the keep-alive comments of an idle stream
+
+
+class CompressionSettings(BaseModel):
+    enabled: bool = True
+    minimum_size: int = 1024  # bytes, smaller bodies are sent as they are
+    thread_size: int = 262144  # bytes, larger bodies are compressed in a worker thread
+    zstd_level: int = 3
+    brotli_quality: int = 4
+    gzip_level: int = 6
+
+
 class App(BaseModel):
     debug: bool = True
     show_error_details: bool = True
     cors_origins: str = "http://localhost:8000,http://localhost:5173"
     import_file_size_limit: int = 5242880  # bytes
+    accounts_cache_size: int = 1024  # ledgers
+    accounts_cache_ttl: int = 60  # seconds
+    commodities_cache_size: int = 1024  # ledgers
+    commodities_cache_ttl: int = 60  # seconds
     static: StaticSettings = StaticSettings()
+    purge: PurgeSettings = PurgeSettings()
+    events: EventsSettings = EventsSettings()
+    compression: CompressionSettings = CompressionSettings()
 
 
 class Settings(BaseModel):
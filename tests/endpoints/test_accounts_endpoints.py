@@ -1,10 +1,19 @@
 # ruff: noqa: S101, D100, D101, D102, D103
 import asyncio
+import json
+from datetime import datetime
 from typing import Any
+from uuid import UUID, uuid7
 
-from blacksheep import JSONContent
+import msgpack
+from blacksheep import Content, JSONContent
 from blacksheep.testing import TestClient
 
+from opum_ledger.core.content import dump_msgpack
+from opum_ledger.core.json import dump_json
+from opum_ledger.domain.accounts import AccountsCache, LedgerAccountsIndex
+from opum_ledger.domain.types.transaction import AccountBalance
+from opum_ledger.settings import App, Settings
 from tests.base import BaseTestEndpoints
 
 
@@ -26,6 +35,41 @@ class TestAccountsEndpoints(BaseTestEndpoints):
         assert response.status == 200
         return await response.json()
 
+    async def test_accounts_msgpack(self, api_client: TestClient) -> None:
+        """Accounts are created and listed in MessagePack, with binary UUIDs and timestamps."""
+        ledger = await self._create_ledger(api_client)
+        path = self._endpoint(f"/{ledger['id']}")
+
+        response = await api_client.post(
+            path,
+            headers={"Accept": "application/msgpack"},
+            content=Content(b"application/msgpack", msgpack.packb({"name": "Cash", "path": "Assets:Cash"})),
+        )
+        assert response.status == 200
+        assert response.content_type() == b"application/msgpack"
+        created = msgpack.unpackb(await response.read(), timestamp=3)
+        assert created["path"] == "Assets:Cash"
+        assert isinstance(created["created_at"], datetime)
+        account_id = UUID(bytes=created["id"])
+
+        response = await api_client.get(path, headers={"Accept": "application/msgpack, application/json;q=0.5"})
+        assert response.status == 200
+        accounts = msgpack.unpackb(await response.read(), timestamp=3)["accounts"]
+        assert [UUID(bytes=account["id"]) for account in accounts] == [account_id]
+
+        response = await api_client.get(path, headers={"Accept": "application/json, application/msgpack"})
+        assert response.content_type() == b"application/json"
+        assert (await response.json())["accounts"][0]["id"] == str(account_id)
+
+    async def test_msgpack_and_json_field_names(self) -> None:
+        """A model has the same fields in MessagePack and in JSON, aliases are not used by either."""
+        balance = AccountBalance.model_validate({"_id": uuid7(), "balance": 1500})
+
+        from_json = json.loads(dump_json([balance]))
+        from_msgpack = msgpack.unpackb(dump_msgpack([balance]), timestamp=3)
+        assert from_json == [{"id": str(balance.id), "balance": 1500}]
+        assert from_msgpack == [{"id": balance.id.bytes, "balance": 1500}]
+
     async def test_create_and_list_accounts(self, api_client: TestClient) -> None:
         """Create accounts for a ledger and list them."""
         ledger = await self._create_ledger(api_client)
@@ -198,3 +242,111 @@ class TestAccountsEndpoints(BaseTestEndpoints):
         )
 
         assert conflict_resp.status == 412
+
+    async def test_accounts_subtree(self, api_client: TestClient) -> None:
+        """The subtree has the account and the accounts under it, but not the ones sharing a name prefix."""
+        ledger = await self._create_ledger(api_client, name="Accounts Subtree Ledger")
+        ledger_id = ledger["id"]
+        for name, path in (
+            ("Travel", "Expenses:Travel"),
+            ("Hotel", "Expenses:Travel:Hotel"),
+            ("Flights", "Expenses:Travel:Flights"),
+            ("Travel Insurance", "Expenses:TravelInsurance"),
+            ("Food", "Expenses:Food"),
+        ):
+            resp = await api_client.post(
+                self._endpoint(f"/{ledger_id}"),
+                content=JSONContent(data={"name": name, "path": path}),
+            )
+            assert resp.status == 200
+
+        resp = await api_client.get(self._endpoint(f"/tree/{ledger_id}/Expenses:Travel"))
+        assert resp.status == 200
+        tree = await resp.json()
+        assert list(tree) == ["Expenses:Travel", "Expenses:Travel:Flights", "Expenses:Travel:Hotel"]
+
+        resp = await api_client.get(self._endpoint(f"/tree/{ledger_id}/Expenses:Unknown"))
+        assert resp.status == 200
+        assert await resp.json() == {}
+
+    async def test_recreate_deleted_account(self, api_client: TestClient) -> None:
+        """Deleted accounts do not take part in the uniqueness of the account path."""
+        ledger = await self._create_ledger(api_client, name="Recreate Account Ledger")
+        base_path = self._endpoint(f"/{ledger['id']}")
+        payload = {"name": "Wallet", "path": "Assets:Wallet"}
+
+        resp = await api_client.post(base_path, content=JSONContent(data=payload))
+        assert resp.status == 200
+        account = await resp.json()
+
+        resp = await api_client.post(base_path, content=JSONContent(data=payload))
+        assert resp.status == 409
+
+        resp = await api_client.delete(self._endpoint(f"/{ledger['id']}/{account['id']}"))
+        assert resp.status in (200, 204)
+
+        resp = await api_client.post(base_path, content=JSONContent(data=payload))
+        assert resp.status == 200
+        assert (await resp.json())["id"] != account["id"]
+
+    async def test_accounts_not_modified(self, api_client: TestClient) -> None:
+        """The lists ETag follows the ledger changes, an unchanged ledger answers `If-None-Match` with 304."""
+        ledger = await self._create_ledger(api_client, name="Not Modified Ledger")
+        base_path = self._endpoint(f"/{ledger['id']}")
+        resp = await api_client.post(base_path, content=JSONContent(data={"name": "Cash", "path": "Assets:Cash"}))
+        assert resp.status == 200
+        account = await resp.json()
+
+        for path in (
+            base_path,
+            self._endpoint(f"/tree/{ledger['id']}"),
+            self._endpoint(f"/tree/{ledger['id']}/Assets"),
+        ):
+            resp = await api_client.get(path)
+            assert resp.status == 200
+            etag = resp.headers.get(b"ETag")[0]  # type: ignore
+            assert etag.startswith(b'W/"')
+
+            resp = await api_client.get(path, headers={"If-None-Match": etag.decode()})
+            assert resp.status == 304
+            assert resp.headers.get(b"ETag")[0] == etag  # type: ignore
+            assert await resp.read() in (None, b"")
+
+        resp = await api_client.put(
+            self._endpoint(f"/{ledger['id']}/{account['id']}"),
+            content=JSONContent(data={"name": "Wallet"}),
+        )
+        assert resp.status == 200
+
+        resp = await api_client.get(base_path, headers={"If-None-Match": etag.decode()})
+        assert resp.status == 200
+        assert resp.headers.get(b"ETag")[0] != etag  # type: ignore
+        assert [item["name"] for item in (await resp.json())["accounts"]] == ["Wallet"]
+
+        # a single account follows its revision
+        account_path = self._endpoint(f"/{ledger['id']}/{account['id']}")
+        resp = await api_client.get(account_path, headers={"If-None-Match": '"1"'})
+        assert resp.status == 304
+        assert resp.headers.get(b"ETag")[0] == b'"1"'  # type: ignore
+        resp = await api_client.get(account_path, headers={"If-None-Match": '"0"'})
+        assert resp.status == 200
+        assert (await resp.json())["name"] == "Wallet"
+
+    async def test_accounts_cache_eviction_and_invalidation(self) -> None:
+        """The cache keeps the most recently used ledgers and drops indexes loaded before a write."""
+        cache = AccountsCache(Settings(app=App(accounts_cache_size=2)))
+        ledgers = [uuid7() for _ in range(3)]
+        index = LedgerAccountsIndex.build([])
+
+        for ledger_id in ledgers[:2]:
+            cache.put(ledger_id, index, cache.generation)
+        assert cache.get(ledgers[0]) is index
+        cache.put(ledgers[2], index, cache.generation)
+        assert cache.get(ledgers[1]) is None
+        assert cache.get(ledgers[0]) is index
+
+        generation = cache.generation
+        cache.invalidate(ledgers[0])
+        assert cache.get(ledgers[0]) is None
+        cache.put(ledgers[0], index, generation)
+        assert cache.get(ledgers[0]) is None
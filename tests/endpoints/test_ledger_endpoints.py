@@ -1,10 +1,16 @@
 # ruff: noqa: S101, D100, D101, D102, D103
 import asyncio
+from uuid import UUID
 
 import pytest
 from blacksheep import JSONContent
 from blacksheep.testing import TestClient
 
+from opum_ledger.domain.changes import ChangesDAL, LedgerChangesSignal
+from opum_ledger.domain.events import LedgerEventsHub
+from opum_ledger.domain.types.change import ChangeEntity, ChangeOperation
+from opum_ledger.models.changes import LedgerSequenceModel
+from opum_ledger.settings import App, EventsSettings, Settings
 from tests.base import BaseTestEndpoints
 
 
@@ -475,3 +481,240 @@ class TestLedgerEndpoints(BaseTestEndpoints):
         )
 
         assert conflict_update_response.status == 412
+
+    async def test_get_ledger_not_modified(self, api_client: TestClient) -> None:
+        """A ledger read with its revision ETag in `If-None-Match` answers 304 until it changes."""
+        create_response = await api_client.post(
+            self._endpoint("/"),
+            content=JSONContent(data={"name": "Not Modified Ledger"}),
+        )
+        ledger_path = self._endpoint(f"/{(await create_response.json())['id']}")
+
+        response = await api_client.get(ledger_path, headers={"If-None-Match": '"0"'})
+        assert response.status == 304
+        assert response.headers.get_first(b"ETag") == b'"0"'
+
+        _ = await api_client.put(ledger_path, content=JSONContent(data={"description": "Changed"}))
+        response = await api_client.get(ledger_path, headers={"If-None-Match": '"0"'})
+        assert response.status == 200
+        assert response.headers.get_first(b"ETag") == b'"1"'
+
+    async def test_ledger_revision_etag(self, api_client: TestClient) -> None:
+        """The ETag is the quoted revision, incremented on every update."""
+        create_response = await api_client.post(
+            self._endpoint("/"),
+            content=JSONContent(data={"name": "Revision Ledger"}),
+        )
+        assert create_response.status == 200
+        ledger = await create_response.json()
+        assert ledger["revision"] == 0
+        assert create_response.headers.get(b"ETag")[0] == b'"0"'  # type: ignore
+
+        update_path = self._endpoint(f"/{ledger['id']}")
+        for if_match, revision in (('"0"', 1), ("*", 2)):
+            update_response = await api_client.put(
+                update_path,
+                headers={"If-Match": if_match},
+                content=JSONContent(data={"description": f"Revision {revision}"}),
+            )
+            assert update_response.status == 200
+            assert (await update_response.json())["revision"] == revision
+            assert update_response.headers.get(b"ETag")[0] == f'"{revision}"'.encode()  # type: ignore
+
+        # an ETag that is not a revision can not match
+        update_response = await api_client.put(
+            update_path,
+            headers={"If-Match": "1712345678.123456"},
+            content=JSONContent(data={"description": "Should Fail"}),
+        )
+        assert update_response.status == 412
+
+        # a missing ledger is not found, whatever the revision
+        update_response = await api_client.put(
+            self._endpoint("/01936d3c-6e4b-7c3a-8e1f-2b5d9a7c4e60"),
+            headers={"If-Match": '"2"'},
+            content=JSONContent(data={"description": "Should Fail"}),
+        )
+        assert update_response.status == 404
+
+    async def test_ledger_changes_feed(self, api_client: TestClient) -> None:
+        """The feed returns what changed since a token, and only that."""
+        create_response = await api_client.post(
+            self._endpoint("/"),
+            content=JSONContent(data={"name": "Changes Feed Ledger"}),
+        )
+        assert create_response.status == 200
+        ledger_id = (await create_response.json())["id"]
+        changes_path = self._endpoint(f"/{ledger_id}/changes")
+
+        response = await api_client.get(changes_path)
+        assert response.status == 200
+        feed = await response.json()
+        assert feed["transactions"] == [] and feed["ledger"] is None
+        token = feed["token"]
+
+        response = await api_client.post(
+            f"/api/v1/commodities/{ledger_id}",
+            content=JSONContent(data={"name": "US Dollar", "code": "USD", "symbol": "$", "ledger_id": ledger_id}),
+        )
+        assert response.status == 200
+        commodity = await response.json()
+        accounts = []
+        for name, path in (("Cash", "Assets:Cash"), ("Food", "Expenses:Food")):
+            response = await api_client.post(
+                f"/api/v1/accounts/{ledger_id}",
+                content=JSONContent(data={"name": name, "path": path}),
+            )
+            assert response.status == 200
+            accounts.append(await response.json())
+        response = await api_client.post(
+            f"/api/v1/transactions/{ledger_id}",
+            content=JSONContent(
+                data={
+                    "description": "Lunch",
+                    "date_time": "2024-01-15T10:30:00Z",
+                    "details": [
+                        {"account_id": accounts[0]["id"], "amount": {"commodity_id": commodity["id"], "amount": -1000}},
+                        {"account_id": accounts[1]["id"], "amount": {"commodity_id": commodity["id"], "amount": 1000}},
+                    ],
+                }
+            ),
+        )
+        assert response.status == 200
+        transaction = await response.json()
+
+        response = await api_client.get(changes_path, query={"since": token})
+        assert response.status == 200
+        feed = await response.json()
+        assert feed["since"] == token
+        assert feed["token"] == token + 4
+        assert feed["has_more"] is False
+        assert [item["id"] for item in feed["commodities"]] == [commodity["id"]]
+        assert {item["id"] for item in feed["accounts"]} == {account["id"] for account in accounts}
+        assert feed["transactions"] == [transaction]
+        token = feed["token"]
+
+        # pages follow the sequence of the changes
+        response = await api_client.get(changes_path, query={"since": token - 4, "limit": 1})
+        feed = await response.json()
+        assert feed["token"] == token - 3
+        assert feed["has_more"] is True
+        assert len(feed["commodities"]) == 1 and feed["accounts"] == [] and feed["transactions"] == []
+
+        response = await api_client.delete(f"/api/v1/transactions/{ledger_id}/{transaction['id']}")
+        assert response.status in (200, 204)
+        response = await api_client.put(
+            f"/api/v1/accounts/{ledger_id}/{accounts[0]['id']}",
+            content=JSONContent(data={"name": "Wallet"}),
+        )
+        assert response.status == 200
+
+        response = await api_client.get(changes_path, query={"since": token})
+        feed = await response.json()
+        assert feed["token"] == token + 2
+        assert feed["transactions"] == []
+        assert feed["deleted"]["transactions"] == [transaction["id"]]
+        assert [item["name"] for item in feed["accounts"]] == ["Wallet"]
+
+        # nothing changed since the last token
+        response = await api_client.get(changes_path, query={"since": feed["token"]})
+        feed = await response.json()
+        assert feed["token"] == token + 2 and feed["accounts"] == [] and feed["deleted"]["transactions"] == []
+
+        response = await api_client.get(changes_path, query={"since": 0, "limit": 0})
+        assert response.status == 400
+        response = await api_client.get("/api/v1/ledgers/01936d3c-6e4b-7c3a-8e1f-2b5d9a7c4e60/changes")
+        assert response.status == 404
+
+    async def test_ledger_changes_sequence(self, api_client: TestClient) -> None:
+        """Concurrent writes get consecutive numbers, a ledger without a counter continues its sequence."""
+        create_response = await api_client.post(
+            self._endpoint("/"),
+            content=JSONContent(data={"name": "Sequence Ledger"}),
+        )
+        ledger_id = UUID((await create_response.json())["id"])
+        changes = ChangesDAL(LedgerChangesSignal())
+        start = await changes.get_ledger_sequence(ledger_id)
+
+        numbers = await asyncio.gather(
+            *(changes.record(ledger_id, ChangeEntity.LEDGER, ChangeOperation.UPDATED, [ledger_id]) for _ in range(10))
+        )
+        assert sorted(numbers) == list(range(start + 1, start + 11))
+        recorded = await changes.get_ledger_changes(ledger_id, 0, 100)
+        assert [change.seq for change in recorded] == list(range(1, start + 11))
+
+        # ledgers last written before the counters existed
+        _ = await LedgerSequenceModel.get_pymongo_collection().delete_one({"_id": ledger_id})
+        assert await changes.get_ledger_sequence(ledger_id) == start + 10
+        number = await changes.record(ledger_id, ChangeEntity.LEDGER, ChangeOperation.UPDATED, [ledger_id])
+        assert number == start + 11
+
+    async def test_ledger_events_fan_out(self, api_client: TestClient) -> None:
+        """Every subscriber of a ledger gets every change, read once for all of them."""
+        create_response = await api_client.post(
+            self._endpoint("/"),
+            content=JSONContent(data={"name": "Events Ledger"}),
+        )
+        assert create_response.status == 200
+        ledger_id = UUID((await create_response.json())["id"])
+        signal = LedgerChangesSignal()
+        hub = LedgerEventsHub(Settings(app=App(events=EventsSettings(poll_interval=0.05))), signal, ChangesDAL(signal))
+
+        async with hub.subscribe(ledger_id) as first, hub.subscribe(ledger_id) as second:
+            assert hub.subscribers(ledger_id) == 2
+
+            response = await api_client.post(
+                f"/api/v1/commodities/{ledger_id}",
+                content=JSONContent(data={"name": "Euro", "code": "EUR", "symbol": "€", "ledger_id": str(ledger_id)}),
+            )
+            commodity_id = (await response.json())["id"]
+            account_ids = []
+            for name, path in (("Cash", "Assets:Cash"), ("Food", "Expenses:Food")):
+                response = await api_client.post(
+                    f"/api/v1/accounts/{ledger_id}",
+                    content=JSONContent(data={"name": name, "path": path}),
+                )
+                account_ids.append((await response.json())["id"])
+            response = await api_client.post(
+                f"/api/v1/transactions/{ledger_id}",
+                content=JSONContent(
+                    data={
+                        "description": "Lunch",
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {"account_id": account_ids[0], "amount": {"commodity_id": commodity_id, "amount": -500}},
+                            {"account_id": account_ids[1], "amount": {"commodity_id": commodity_id, "amount": 500}},
+                        ],
+                    }
+                ),
+            )
+            transaction_id = (await response.json())["id"]
+
+            events = [await first.next(5) for _ in range(4)]
+            assert [await second.next(5) for _ in range(4)] == events
+            assert [event.name for event in events if event] == [
+                "commodity.created",
+                "account.created",
+                "account.created",
+                "transaction.created",
+            ]
+            transaction_event = events[-1]
+            assert transaction_event
+            assert [str(id_) for id_ in transaction_event.ids] == [transaction_id]
+            assert {(str(delta.account_id), delta.amount) for delta in transaction_event.deltas} == {
+                (account_ids[0], -500),
+                (account_ids[1], 500),
+            }
+
+        assert hub.subscribers(ledger_id) == 0
+
+        # a client reconnecting with the id of the first event gets the following ones first
+        assert events[0] and events[1]
+        stream = hub.stream(ledger_id, since=events[0].seq)
+        message = await anext(stream)
+        await stream.aclose()
+        assert message == events[1].encode()
+        assert message.startswith(f"id: {events[1].seq}\nevent: account.created\ndata: ".encode())
+
+        response = await api_client.get("/api/v1/ledgers/01936d3c-6e4b-7c3a-8e1f-2b5d9a7c4e60/events")
+        assert response.status == 404
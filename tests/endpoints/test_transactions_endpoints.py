@@ -1,14 +1,28 @@
 # ruff: noqa: S101, D100, D101, D102, D103
 import asyncio
-from datetime import datetime, timezone
+import csv
+import gzip
+import io
+import json
+from datetime import datetime, timedelta, timezone
+from typing import Any
 from urllib.parse import quote
+from uuid import uuid7
 
-from blacksheep import JSONContent
+import pytest
+from blacksheep import Content, JSONContent
 from blacksheep.testing import TestClient
 
+from opum_ledger.domain import commodities
 from opum_ledger.domain.accounts import Account
+from opum_ledger.domain.balances import BalancesDAL
 from opum_ledger.domain.commodities import Commodity
 from opum_ledger.domain.ledgers import Ledger
+from opum_ledger.models.accounts import AccountModel
+from opum_ledger.models.balances import BalanceModel
+from opum_ledger.models.transactions import TransactionModel
+from opum_ledger.purge import Purger
+from opum_ledger.settings import PurgeSettings
 from tests.base import BaseTestEndpoints
 
 
@@ -96,6 +110,19 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
         response = await api_client.post(path, content=JSONContent(data=unbalanced_data))
         assert response.status == 400
 
+    async def test_create_transaction_invalid_body(self, api_client: TestClient, ledger_one: Ledger) -> None:
+        """A body that is not JSON, or not sent as JSON, should return 400."""
+        path = self._endpoint(f"/{ledger_one.id}")
+
+        response = await api_client.post(path, content=Content(b"application/json", b'{"description": "Broken'))
+        assert response.status == 400
+
+        response = await api_client.post(path, content=Content(b"text/plain", b'{"description": "Plain"}'))
+        assert response.status == 400
+
+        response = await api_client.post(path, content=Content(b"application/json", b""))
+        assert response.status == 400
+
     async def test_create_transaction_with_exchange(
         self,
         api_client: TestClient,
@@ -163,7 +190,7 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
         create_path = self._endpoint(f"/{ledger_id}")
         transaction_data = {
             "description": "Test transaction",
-            "date_time": "2024-01-15T10:30:00Z",
+            "date_time": "2024-01-15T10:30:00.123456Z",
             "details": [
                 {
                     "account_id": account1_id,
@@ -191,6 +218,10 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
         assert transaction["description"] == "Test transaction"
         assert b"ETag" in get_response.headers
 
+        # the created transaction is returned without reading it back, as it is stored
+        assert transaction == created
+        assert get_response.headers.get(b"ETag") == create_response.headers.get(b"ETag")
+
     async def test_get_nonexistent_transaction_returns_404(
         self,
         api_client: TestClient,
@@ -286,26 +317,519 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
             response = await api_client.post(create_path, content=JSONContent(data=transaction_data))
             assert response.status == 200
 
-        # Get first page
-        list_path = self._endpoint(f"/{ledger_id}?skip=0&limit=2")
-        response = await api_client.get(list_path)
+        # Get first page
+        list_path = self._endpoint(f"/{ledger_id}?skip=0&limit=2")
+        response = await api_client.get(list_path)
+        assert response.status == 200
+
+        result = await response.json()
+        assert result["count"] == 5
+        assert len(result["transactions"]) == 2
+        assert result["skip"] == 0
+        assert result["limit"] == 2
+
+        # Get second page
+        list_path = self._endpoint(f"/{ledger_id}?skip=2&limit=2")
+        response = await api_client.get(list_path)
+        assert response.status == 200
+
+        result = await response.json()
+        assert result["count"] == 5
+        assert len(result["transactions"]) == 2
+        assert result["skip"] == 2
+
+    async def test_list_transactions_with_cursor(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """List transactions page by page with a keyset cursor."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        account1_id = str(account_assets_cash_ledger_one.id)
+        account2_id = str(account_expenses_food_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        # two transactions share the same date and time to check the tie break
+        for i, date in enumerate(
+            [
+                "2024-01-10T10:00:00Z",
+                "2024-01-11T10:00:00Z",
+                "2024-01-11T10:00:00Z",
+                "2024-01-12T10:00:00Z",
+                "2024-01-13T10:00:00Z",
+            ]
+        ):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {i}",
+                        "date_time": date,
+                        "details": [
+                            {
+                                "account_id": account1_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": account2_id,
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?limit=5"))
+        expected_ids = [item["id"] for item in (await response.json())["transactions"]]
+
+        ids: list[str] = []
+        cursor = None
+        pages = 0
+        while True:
+            query = f"?limit=2&cursor={cursor}" if cursor else "?limit=2"
+            response = await api_client.get(self._endpoint(f"/{ledger_id}{query}"))
+            assert response.status == 200
+            result = await response.json()
+            assert result["count"] == 5
+            ids.extend(item["id"] for item in result["transactions"])
+            pages += 1
+            cursor = result["next_cursor"]
+            if cursor is None:
+                break
+
+        assert pages == 3
+        assert ids == expected_ids
+
+    async def test_list_transactions_cursor_page_reads_one_page(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """A cursor page examines the documents of the page only, not all the matching transactions."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        create_path = self._endpoint(f"/{ledger_id}")
+        for day in range(1, 21):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {day}",
+                        "date_time": f"2024-01-{day:02d}T10:00:00Z",
+                        "details": [
+                            {
+                                "account_id": str(account_assets_cash_ledger_one.id),
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": str(account_expenses_food_ledger_one.id),
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?limit=2"))
+        cursor = (await response.json())["next_cursor"]
+
+        database = TransactionModel.get_pymongo_collection().database
+        await database.command("profile", 2)
+        try:
+            response = await api_client.get(self._endpoint(f"/{ledger_id}?limit=2&cursor={cursor}"))
+        finally:
+            await database.command("profile", 0)
+        result = await response.json()
+        assert result["count"] == 20
+        assert [item["description"] for item in result["transactions"]] == ["Transaction 18", "Transaction 17"]
+
+        profile = await database["system.profile"].find({"command.aggregate": "transactions"}).to_list()
+        [page_read] = [entry for entry in profile if any("$sort" in stage for stage in entry["command"]["pipeline"])]
+        # the page, the extra document telling whether there is a next one, and the cursor document
+        assert page_read["docsExamined"] <= 4
+
+    async def test_list_transactions_count_modes(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """List transactions with exact, estimated and no count."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        account1_id = str(account_assets_cash_ledger_one.id)
+        account2_id = str(account_expenses_food_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        for i in range(3):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {i}",
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {
+                                "account_id": account1_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": account2_id,
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+
+        for mode in ("exact", "estimate"):
+            response = await api_client.get(self._endpoint(f"/{ledger_id}?limit=2&count={mode}"))
+            assert response.status == 200
+            result = await response.json()
+            assert result["count"] == 3
+            assert result["has_more"] is True
+            assert len(result["transactions"]) == 2
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?limit=2&count=none"))
+        assert response.status == 200
+        result = await response.json()
+        assert result["count"] is None
+        assert result["has_more"] is True
+        assert len(result["transactions"]) == 2
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?skip=2&limit=2&count=none"))
+        result = await response.json()
+        assert result["has_more"] is False
+        assert len(result["transactions"]) == 1
+
+    async def test_list_transactions_with_fields(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """List transactions with only the selected fields."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        for i in range(3):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {i}",
+                        "date_time": f"2024-01-1{i}T10:30:00Z",
+                        "tags": ["food"],
+                        "details": [
+                            {
+                                "account_id": str(account_assets_cash_ledger_one.id),
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": str(account_expenses_food_ledger_one.id),
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?limit=2&fields=description"))
+        assert response.status == 200
+        result = await response.json()
+        assert [set(item) for item in result["transactions"]] == [{"id", "date_time", "description"}] * 2
+        assert [item["description"] for item in result["transactions"]] == ["Transaction 2", "Transaction 1"]
+
+        response = await api_client.get(
+            self._endpoint(f"/{ledger_id}?limit=2&fields=description&cursor={result['next_cursor']}")
+        )
+        result = await response.json()
+        assert [item["description"] for item in result["transactions"]] == ["Transaction 0"]
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?fields=description,unknown"))
+        assert response.status == 400
+
+    async def test_list_transactions_compressed(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Large responses are compressed with the encoding accepted by the client."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        for i in range(10):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {i}",
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {
+                                "account_id": str(account_assets_cash_ledger_one.id),
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": str(account_expenses_food_ledger_one.id),
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+
+        response = await api_client.get(create_path)
+        assert response.get_first_header(b"Content-Encoding") is None
+        plain = await response.read()
+
+        response = await api_client.get(create_path, headers={"Accept-Encoding": "br;q=0.5, gzip;q=0.8"})
+        assert response.status == 200
+        assert response.get_first_header(b"Content-Encoding") == b"gzip"
+        assert b"Accept-Encoding" in response.get_headers(b"Vary")
+        assert json.loads(gzip.decompress(await response.read())) == json.loads(plain)
+
+        # the strong revision ETag names the encoding of the compressed body, and still matches the revision
+        transaction = json.loads(plain)["transactions"][0]
+        transaction_path = self._endpoint(f"/{ledger_id}/{transaction['id']}")
+        response = await api_client.put(transaction_path, content=JSONContent(data={"description": "x" * 1024}))
+        assert response.status == 200
+        etag = response.get_first_header(b"ETag")
+
+        response = await api_client.get(transaction_path, headers={"Accept-Encoding": "gzip"})
+        assert response.get_first_header(b"Content-Encoding") == b"gzip"
+        assert b"Accept-Encoding" in response.get_headers(b"Vary")
+        gzip_etag = response.get_first_header(b"ETag")
+        assert gzip_etag == etag[:-1] + b'-gzip"'
+
+        response = await api_client.get(transaction_path, headers={"If-None-Match": gzip_etag.decode()})
+        assert response.status == 304
+
+        response = await api_client.put(
+            transaction_path,
+            content=JSONContent(data={"description": "Updated"}),
+            headers={"If-Match": gzip_etag.decode()},
+        )
+        assert response.status == 200
+
+    async def test_list_transactions_expanded(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """List transactions with the accounts and commodities they reference."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_account_id = str(account_assets_cash_ledger_one.id)
+        food_account_id = str(account_expenses_food_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        for i in range(2):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {i}",
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {"account_id": cash_account_id, "amount": {"commodity_id": commodity_id, "amount": -1000}},
+                            {"account_id": food_account_id, "amount": {"commodity_id": commodity_id, "amount": 1000}},
+                        ],
+                    }
+                ),
+            )
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?expand=accounts,commodities"))
+        assert response.status == 200
+        result = await response.json()
+        assert len(result["transactions"]) == 2
+        assert set(result["accounts"]) == {cash_account_id, food_account_id}
+        assert result["accounts"][food_account_id]["path"] == account_expenses_food_ledger_one.path
+        assert list(result["commodities"]) == [commodity_id]
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?expand=accounts&fields=description"))
+        result = await response.json()
+        assert set(result["transactions"][0]) == {"id", "date_time", "description", "details"}
+        assert set(result["accounts"]) == {cash_account_id, food_account_id}
+        assert result["commodities"] == {}
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}"))
+        assert "accounts" not in await response.json()
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?expand=tags"))
+        assert response.status == 400
+
+    async def test_transaction_details_denormalized(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Details carry the account path and the commodity code, updated when the account is renamed."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        food_account_id = str(account_expenses_food_ledger_one.id)
+
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_id}"),
+            content=JSONContent(
+                data={
+                    "description": "Lunch",
+                    "date_time": "2024-01-15T10:30:00Z",
+                    "details": [
+                        {
+                            "account_id": str(account_assets_cash_ledger_one.id),
+                            "amount": {"commodity_id": commodity_id, "amount": -1000},
+                        },
+                        {"account_id": food_account_id, "amount": {"commodity_id": commodity_id, "amount": 1000}},
+                    ],
+                }
+            ),
+        )
+        assert response.status == 200
+        transaction = await response.json()
+        food_detail = transaction["details"][1]
+        assert food_detail["account_path"] == "Expenses:Food"
+        assert food_detail["commodity_code"] == commodity_usd_ledger_one.code
+        assert food_detail["commodity_subunit"] == commodity_usd_ledger_one.subunit
+
+        changes_path = f"/api/v1/ledgers/{ledger_id}/changes"
+        token = (await (await api_client.get(changes_path)).json())["token"]
+        response = await api_client.put(
+            f"/api/v1/accounts/{ledger_id}/{food_account_id}",
+            content=JSONContent(data={"name": "Meals", "path": "Expenses:Meals"}),
+        )
+        assert response.status == 200
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/{transaction['id']}"))
+        result = await response.json()
+        assert result["details"][1]["account_path"] == "Expenses:Meals"
+        assert result["details"][0]["account_path"] == account_assets_cash_ledger_one.path
+        # the rewritten transaction is revised and in the changes feed
+        assert result["revision"] == transaction["revision"] + 1
+        feed = await (await api_client.get(changes_path, query={"since": token})).json()
+        assert feed["transactions"] == [result]
+
+        # the rename invalidated the cached accounts the new transactions copy the paths from
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_id}"),
+            content=JSONContent(
+                data={
+                    "description": "Dinner",
+                    "date_time": "2024-01-15T19:30:00Z",
+                    "details": [
+                        {
+                            "account_id": str(account_assets_cash_ledger_one.id),
+                            "amount": {"commodity_id": commodity_id, "amount": -2000},
+                        },
+                        {"account_id": food_account_id, "amount": {"commodity_id": commodity_id, "amount": 2000}},
+                    ],
+                }
+            ),
+        )
+        assert response.status == 200
+        assert (await response.json())["details"][1]["account_path"] == "Expenses:Meals"
+
+    async def test_transaction_details_follow_commodity_code(
+        self,
+        api_client: TestClient,
+        monkeypatch: pytest.MonkeyPatch,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Details are rewritten when the commodity code changes, not when only the name does."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_id}"),
+            content=JSONContent(
+                data={
+                    "description": "Lunch",
+                    "date_time": "2024-01-15T10:30:00Z",
+                    "details": [
+                        {
+                            "account_id": str(account_assets_cash_ledger_one.id),
+                            "amount": {"commodity_id": commodity_id, "amount": -1000},
+                        },
+                        {
+                            "account_id": str(account_expenses_food_ledger_one.id),
+                            "amount": {"commodity_id": commodity_id, "amount": 1000},
+                        },
+                    ],
+                }
+            ),
+        )
+        transaction_id = (await response.json())["id"]
+
+        rewrites: list[str] = []
+        set_commodity_code = commodities.set_commodity_code
+
+        async def counting_set_commodity_code(*args: Any) -> int:
+            rewrites.append(args[2])
+            return await set_commodity_code(*args)
+
+        monkeypatch.setattr(commodities, "set_commodity_code", counting_set_commodity_code)
+        commodity = {
+            "name": "US Dollar",
+            "code": commodity_usd_ledger_one.code,
+            "symbol": commodity_usd_ledger_one.symbol,
+            "subunit": commodity_usd_ledger_one.subunit,
+            "no_market": commodity_usd_ledger_one.no_market,
+        }
+        commodity_path = f"/api/v1/commodities/{ledger_id}/{commodity_id}"
+        response = await api_client.put(commodity_path, content=JSONContent(commodity))
+        assert response.status == 200
+        assert (await response.json())["name"] == "US Dollar"
+        assert rewrites == []
+
+        response = await api_client.put(commodity_path, content=JSONContent({**commodity, "code": "USN"}))
         assert response.status == 200
+        assert rewrites == ["USN"]
 
-        result = await response.json()
-        assert result["count"] == 5
-        assert len(result["transactions"]) == 2
-        assert result["skip"] == 0
-        assert result["limit"] == 2
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/{transaction_id}"))
+        assert {detail["commodity_code"] for detail in (await response.json())["details"]} == {"USN"}
 
-        # Get second page
-        list_path = self._endpoint(f"/{ledger_id}?skip=2&limit=2")
-        response = await api_client.get(list_path)
-        assert response.status == 200
+    async def test_list_transactions_with_invalid_cursor(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+    ) -> None:
+        """An invalid cursor should return 400."""
+        response = await api_client.get(self._endpoint(f"/{ledger_one.id}?cursor=not-a-cursor"))
+        assert response.status == 400
 
-        result = await response.json()
-        assert result["count"] == 5
-        assert len(result["transactions"]) == 2
-        assert result["skip"] == 2
+    async def test_list_transactions_with_invalid_limit_or_count(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+    ) -> None:
+        """A limit below 1 or an unknown count mode should return 400."""
+        for query in ("limit=0", "limit=-5", "count=foo"):
+            response = await api_client.get(self._endpoint(f"/{ledger_one.id}?{query}"))
+            assert response.status == 400, query
 
     async def test_list_transactions_with_account_filter(
         self,
@@ -377,6 +901,61 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
         assert result["count"] == 1
         assert result["transactions"][0]["description"] == "Food expense"
 
+    async def test_list_transactions_account_filter_follows_account_updates(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+        account_expenses_rent_ledger_one: Account,
+    ) -> None:
+        """Account filters are resolved with the accounts as they are after an update."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_account_id = str(account_assets_cash_ledger_one.id)
+        food_account_id = str(account_expenses_food_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        for description, account_id in (
+            ("Food expense", food_account_id),
+            ("Rent payment", str(account_expenses_rent_ledger_one.id)),
+        ):
+            response = await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": description,
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {
+                                "account_id": cash_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+            assert response.status == 200
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?accounts=Expenses:Food"))
+        result = await response.json()
+        assert [transaction["description"] for transaction in result["transactions"]] == ["Food expense"]
+
+        response = await api_client.put(
+            f"/api/v1/accounts/{ledger_id}/{food_account_id}",
+            content=JSONContent(data={"path": "Expenses:Dining"}),
+        )
+        assert response.status == 200
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?accounts=Expenses:Dining"))
+        result = await response.json()
+        assert [transaction["description"] for transaction in result["transactions"]] == ["Food expense"]
+
     async def test_list_transactions_with_account_direction_filter(
         self,
         api_client: TestClient,
@@ -822,6 +1401,68 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
         get_response = await api_client.get(delete_path)
         assert get_response.status == 404
 
+    async def test_purge_deleted_documents(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+        account_expenses_rent_ledger_one: Account,
+    ) -> None:
+        """Purge removes the deleted transactions and the deleted accounts no live transaction uses."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_account_id = str(account_assets_cash_ledger_one.id)
+        food_account_id = str(account_expenses_food_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        transaction_ids = []
+        for description in ("Kept", "Deleted"):
+            response = await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": description,
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {
+                                "account_id": cash_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": food_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                    }
+                ),
+            )
+            transaction_ids.append((await response.json())["id"])
+
+        response = await api_client.delete(self._endpoint(f"/{ledger_id}/{transaction_ids[1]}"))
+        assert response.status in (200, 204)
+        for account_id in (food_account_id, str(account_expenses_rent_ledger_one.id)):
+            response = await api_client.delete(f"/api/v1/accounts/{ledger_id}/{account_id}")
+            assert response.status in (200, 204)
+
+        purger = Purger(PurgeSettings(retention_days=1, batch_size=1, batch_delay=0))
+        reports = await purger.purge()
+        assert [report.purged for report in reports] == [0, 0, 0]
+
+        reports = await purger.purge(now=datetime.now(timezone.utc) + timedelta(days=2))
+        assert [(report.collection, report.purged, report.kept) for report in reports] == [
+            ("transactions", 1, 0),
+            ("accounts", 1, 1),
+            ("commodities", 0, 0),
+        ]
+        assert reports[0].size > 0
+
+        assert await TransactionModel.find(TransactionModel.ledger_id == ledger_one.id).count() == 1
+        assert await AccountModel.find(AccountModel.id == account_expenses_rent_ledger_one.id).count() == 0
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/{transaction_ids[0]}"))
+        assert response.status == 200
+
     async def test_delete_transaction_with_etag(
         self,
         api_client: TestClient,
@@ -964,3 +1605,310 @@ class TestTransactionsEndpoints(BaseTestEndpoints):
         get_response = await api_client.get(update_path)
         transaction = await get_response.json()
         assert transaction["state"] == "cleared"
+
+    async def test_account_balance_follows_transaction_writes(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Materialized balances are updated by create, update and delete."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_account_id = str(account_assets_cash_ledger_one.id)
+        food_account_id = str(account_expenses_food_ledger_one.id)
+        balance_path = f"/api/v1/accounts/{ledger_id}/{food_account_id}/balance"
+
+        async def food_balance() -> dict[str, int]:
+            response = await api_client.get(balance_path)
+            assert response.status == 200
+            return {item["id"]: item["balance"] for item in await response.json()}
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        transaction_ids = []
+        for amount in (1000, 2500):
+            response = await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": "Lunch",
+                        "date_time": "2024-01-15T10:30:00Z",
+                        "details": [
+                            {
+                                "account_id": cash_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -amount},
+                            },
+                            {
+                                "account_id": food_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": amount},
+                            },
+                        ],
+                    }
+                ),
+            )
+            assert response.status == 200
+            transaction_ids.append((await response.json())["id"])
+
+        assert await food_balance() == {commodity_id: 3500}
+
+        update_path = self._endpoint(f"/{ledger_id}/{transaction_ids[0]}")
+        response = await api_client.put(
+            update_path,
+            content=JSONContent(
+                data={
+                    "details": [
+                        {
+                            "account_id": cash_account_id,
+                            "amount": {"commodity_id": commodity_id, "amount": -1500},
+                        },
+                        {
+                            "account_id": food_account_id,
+                            "amount": {"commodity_id": commodity_id, "amount": 1500},
+                        },
+                    ]
+                }
+            ),
+        )
+        assert response.status == 200
+        assert await food_balance() == {commodity_id: 4000}
+
+        response = await api_client.delete(self._endpoint(f"/{ledger_id}/{transaction_ids[1]}"))
+        assert response.status in (200, 204)
+        assert await food_balance() == {commodity_id: 1500}
+
+        # rebuilding from the transactions gives the same result
+        assert await BalancesDAL().recompute(ledger_one.id) == 2
+        assert await food_balance() == {commodity_id: 1500}
+
+        # a balance write lost after its transaction write is reported by the verified balance
+        response = await api_client.get(balance_path, query={"verify": "true"})
+        assert response.status == 200
+        assert response.headers.get_first(b"X-Balance-Drift") is None
+
+        await BalancesDAL().apply_deltas(
+            ledger_one.id, {(account_expenses_food_ledger_one.id, commodity_usd_ledger_one.id): 500}
+        )
+        response = await api_client.get(balance_path, query={"verify": "true"})
+        assert response.status == 200
+        assert response.headers.get_first(b"X-Balance-Drift") == commodity_id.encode()
+
+        # the balances left without transactions are deleted after the rebuilt ones are merged
+        await BalanceModel(
+            ledger_id=ledger_one.id,
+            account_id=uuid7(),
+            commodity_id=commodity_usd_ledger_one.id,
+            balance=700,
+            updated_at=datetime.now(timezone.utc) - timedelta(minutes=1),
+        ).insert()
+        assert await BalancesDAL().recompute(ledger_one.id) == 2
+        response = await api_client.get(balance_path, query={"verify": "true"})
+        assert response.headers.get_first(b"X-Balance-Drift") is None
+        assert {item["id"]: item["balance"] for item in await response.json()} == {commodity_id: 1500}
+
+    async def test_account_register(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """The register lists the account details in date order with running balances across pages."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_account_id = str(account_assets_cash_ledger_one.id)
+        food_account_id = str(account_expenses_food_ledger_one.id)
+        register_path = f"/api/v1/accounts/{ledger_id}/{food_account_id}/register"
+
+        # created out of date order, the register follows the dates
+        for day, amount in ((3, 300), (1, 100), (2, 200)):
+            response = await api_client.post(
+                self._endpoint(f"/{ledger_id}"),
+                content=JSONContent(
+                    data={
+                        "description": f"Lunch {day}",
+                        "date_time": f"2024-01-0{day}T12:00:00Z",
+                        "details": [
+                            {
+                                "account_id": cash_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -amount},
+                            },
+                            {
+                                "account_id": food_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": amount},
+                            },
+                        ],
+                    }
+                ),
+            )
+            assert response.status == 200
+
+        response = await api_client.get(f"{register_path}?limit=2")
+        assert response.status == 200
+        page = await response.json()
+        assert [entry["description"] for entry in page["entries"]] == ["Lunch 1", "Lunch 2"]
+        assert [entry["balance"] for entry in page["entries"]] == [100, 300]
+        assert all(entry["index"] == 1 for entry in page["entries"])
+        assert page["balances"] == {commodity_id: 300}
+        assert page["has_more"] is True
+
+        response = await api_client.get(f"{register_path}?limit=2&cursor={page['next_cursor']}")
+        page = await response.json()
+        assert [entry["balance"] for entry in page["entries"]] == [600]
+        assert page["has_more"] is False
+        assert page["next_cursor"] is None
+
+        # the first page after a date starts from the balance before it
+        after = int(datetime(2024, 1, 2, tzinfo=timezone.utc).timestamp())
+        response = await api_client.get(f"{register_path}?after={after}")
+        page = await response.json()
+        assert [entry["balance"] for entry in page["entries"]] == [300, 600]
+
+        response = await api_client.get(f"/api/v1/accounts/{ledger_id}/{cash_account_id}/register")
+        page = await response.json()
+        assert [entry["balance"] for entry in page["entries"]] == [-100, -300, -600]
+
+        response = await api_client.get(f"{register_path}?cursor=not-a-cursor")
+        assert response.status == 400
+
+    async def test_create_transactions_in_bulk(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Create several transactions with one request, invalid ones are reported per item."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        account1_id = str(account_assets_cash_ledger_one.id)
+        account2_id = str(account_expenses_food_ledger_one.id)
+
+        def transaction(description: str, amount: int) -> dict:
+            return {
+                "description": description,
+                "date_time": "2024-01-15T10:30:00Z",
+                "details": [
+                    {
+                        "account_id": account1_id,
+                        "amount": {"commodity_id": commodity_id, "amount": -1000},
+                    },
+                    {
+                        "account_id": account2_id,
+                        "amount": {"commodity_id": commodity_id, "amount": amount},
+                    },
+                ],
+            }
+
+        bulk_path = self._endpoint(f"/{ledger_id}/bulk")
+        items = [transaction("First", 1000), transaction("Unbalanced", 900), transaction("Third", 1000)]
+
+        # unordered: the invalid transaction does not stop the others
+        response = await api_client.post(bulk_path, content=JSONContent(data={"transactions": items, "ordered": False}))
+        assert response.status == 200
+        result = await response.json()
+        assert result["created"] == 2
+        assert [item["index"] for item in result["results"]] == [0, 1, 2]
+        assert result["results"][0]["id"] is not None
+        assert result["results"][1]["id"] is None
+        assert "not balanced" in result["results"][1]["error"]
+        assert result["results"][2]["id"] is not None
+
+        get_response = await api_client.get(self._endpoint(f"/{ledger_id}/{result['results'][2]['id']}"))
+        assert get_response.status == 200
+        assert (await get_response.json())["description"] == "Third"
+
+        # ordered: processing stops at the first invalid transaction
+        response = await api_client.post(bulk_path, content=JSONContent(data={"transactions": items}))
+        assert response.status == 200
+        result = await response.json()
+        assert result["created"] == 1
+        assert result["results"][0]["id"] is not None
+        assert result["results"][1]["error"] is not None
+        assert result["results"][2] == {"index": 2, "id": None, "error": "Not processed"}
+
+        list_response = await api_client.get(self._endpoint(f"/{ledger_id}"))
+        assert (await list_response.json())["count"] == 3
+
+        # an item that is not an object fails alone, the body is validated in one pass
+        response = await api_client.post(
+            bulk_path, content=JSONContent(data={"transactions": [items[0], "oops"], "ordered": False})
+        )
+        assert response.status == 200
+        result = await response.json()
+        assert result["created"] == 1
+        assert result["results"][1]["error"].startswith("value: ")
+
+    async def test_create_transactions_in_bulk_for_nonexistent_ledger_fails(self, api_client: TestClient) -> None:
+        """Bulk creation for a nonexistent ledger should return 404."""
+        path = self._endpoint("/01936d3c-6e4b-7c3a-8e1f-2b5d9a7c4e60/bulk")
+        response = await api_client.post(path, content=JSONContent(data={"transactions": []}))
+        assert response.status == 404
+
+    async def test_export_transactions(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+        account_expenses_rent_ledger_one: Account,
+    ) -> None:
+        """Export transactions as NDJSON and CSV with the listing filters."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_account_id = str(account_assets_cash_ledger_one.id)
+
+        create_path = self._endpoint(f"/{ledger_id}")
+        for i, (date, account) in enumerate(
+            [
+                ("2024-01-10T10:00:00Z", account_expenses_food_ledger_one),
+                ("2024-01-11T10:00:00Z", account_expenses_rent_ledger_one),
+                ("2024-01-12T10:00:00Z", account_expenses_food_ledger_one),
+            ]
+        ):
+            await api_client.post(
+                create_path,
+                content=JSONContent(
+                    data={
+                        "description": f"Transaction {i}",
+                        "date_time": date,
+                        "details": [
+                            {
+                                "account_id": cash_account_id,
+                                "amount": {"commodity_id": commodity_id, "amount": -1000},
+                            },
+                            {
+                                "account_id": str(account.id),
+                                "amount": {"commodity_id": commodity_id, "amount": 1000},
+                            },
+                        ],
+                        "tags": ["export"],
+                    }
+                ),
+            )
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/export"))
+        assert response.status == 200
+        assert response.content_type() == b"application/x-ndjson"
+        lines = (await response.text()).splitlines()
+        assert [json.loads(line)["description"] for line in lines] == [
+            "Transaction 0",
+            "Transaction 1",
+            "Transaction 2",
+        ]
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/export?format=csv&accounts=Expenses:Food"))
+        assert response.status == 200
+        rows = list(csv.DictReader(io.StringIO(await response.text())))
+        # a row per detail of the two matching transactions
+        assert len(rows) == 4
+        assert {row["description"] for row in rows} == {"Transaction 0", "Transaction 2"}
+        assert {row["amount"] for row in rows} == {"-1000", "1000"}
+        assert rows[0]["tags"] == "export"
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/export?format=xml"))
+        assert response.status == 400
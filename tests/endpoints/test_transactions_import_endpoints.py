@@ -0,0 +1,179 @@
+# ruff: noqa: S101, D100, D101, D102, D103
+import pytest
+from blacksheep.contents import Content
+from blacksheep.testing import TestClient
+
+from opum_ledger.core.exceptions import PayloadTooLarge
+from opum_ledger.domain.accounts import Account
+from opum_ledger.domain.commodities import Commodity
+from opum_ledger.domain.imports import iter_lines
+from opum_ledger.domain.ledgers import Ledger
+from tests.base import BaseTestEndpoints
+
+
+class TestTransactionsImportEndpoints(BaseTestEndpoints):
+    api_path: str = "/api/v1/transactions/"
+
+    async def test_import_journal(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        commodity_eur_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_assets_cash_eur_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Import an hledger journal, invalid transactions are reported by line."""
+        ledger_id = str(ledger_one.id)
+        journal = "\n".join(
+            [
+                "; groceries and travel",
+                "account Assets:Cash",
+                "",
+                "2024-01-15 * Grocery shopping  ; weekly",
+                "    Expenses:Food         $50.00",
+                "    Assets:Cash",
+                "",
+                "2024/01/16 ! Lunch in Paris",
+                "    Expenses:Food         $20.00",
+                "    Assets:Cash:EUR       -18.40 EUR @@ $20.00",
+                "",
+                "2024-01-17 Unknown account",
+                "    Expenses:Travel       $10",
+                "    Assets:Cash",
+                "",
+                "2024-01-18 Unbalanced",
+                "    Expenses:Food         $10",
+                "    Assets:Cash           $-5",
+            ]
+        )
+
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_id}/import?format=journal"),
+            content=Content(b"text/plain", journal.encode("utf-8")),
+        )
+        assert response.status == 200
+        result = await response.json()
+        assert result["created"] == 2
+        assert result["failed"] == 2
+        assert [error["line"] for error in result["errors"]] == [12, 16]
+        assert "Expenses:Travel" in result["errors"][0]["error"]
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}?order_by=%2Bdate_time"))
+        transactions = (await response.json())["transactions"]
+        assert [transaction["description"] for transaction in transactions] == [
+            "Grocery shopping",
+            "Lunch in Paris",
+        ]
+        assert transactions[0]["state"] == "cleared"
+        assert {detail["amount"]["amount"] for detail in transactions[0]["details"]} == {5000, -5000}
+        assert transactions[1]["state"] == "pending"
+        assert transactions[1]["details"][1]["amount"]["amount"] == -1840
+        assert transactions[1]["details"][1]["price"]["commodity_id"] == str(commodity_usd_ledger_one.id)
+
+    async def test_import_exported_csv(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        ledger_two: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Rows reference accounts and commodities by id or by path and code, exports can be imported."""
+        ledger_id = str(ledger_one.id)
+        commodity_id = str(commodity_usd_ledger_one.id)
+        cash_id = str(account_assets_cash_ledger_one.id)
+        csv_file = "\n".join(
+            [
+                "transaction_id,date_time,description,state,tags,account_id,account,commodity_id,commodity,amount",
+                f'1,2024-01-15T10:30:00+00:00,"Lunch, with friends",cleared,food;fun,{cash_id},,{commodity_id},,-1500',
+                "1,2024-01-15T10:30:00+00:00,,,,,Expenses:Food,,USD,1500",
+                "2,2024-01-16T10:30:00+00:00,Dinner,,,,Assets:Cash,,USD,-1500",
+                "2,2024-01-16T10:30:00+00:00,Dinner,,,,Expenses:Food,,GBP,1500",
+            ]
+        )
+
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_id}/import?format=csv"),
+            content=Content(b"text/csv", csv_file.encode("utf-8")),
+        )
+        assert response.status == 200
+        result = await response.json()
+        assert result["created"] == 1
+        assert result["errors"] == [{"line": 4, "error": "Unknown commodity 'GBP'"}]
+
+        response = await api_client.get(self._endpoint(f"/{ledger_id}/export?format=csv"))
+        exported = await response.text()
+
+        # the exported ids belong to ledger one and are unknown in ledger two
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_two.id}/import?format=csv"),
+            content=Content(b"text/csv", exported.encode("utf-8")),
+        )
+        result = await response.json()
+        assert result["created"] == 0
+        assert result["failed"] == 1
+
+    async def test_import_csv_rows_with_wrong_value_count(
+        self,
+        api_client: TestClient,
+        ledger_one: Ledger,
+        commodity_usd_ledger_one: Commodity,
+        account_assets_cash_ledger_one: Account,
+        account_expenses_food_ledger_one: Account,
+    ) -> None:
+        """Rows with fewer or more values than the header fail their transaction."""
+        csv_file = "\n".join(
+            [
+                "transaction_id,date_time,description,account,commodity,amount",
+                "1,2024-01-15T10:30:00+00:00,Short,Assets:Cash,USD",
+                "1,2024-01-15T10:30:00+00:00,Short,Expenses:Food,USD,1500",
+                "2,2024-01-16T10:30:00+00:00,Long,Assets:Cash,USD,-1500,extra",
+                "2,2024-01-16T10:30:00+00:00,Long,Expenses:Food,USD,1500",
+                "3,2024-01-17T10:30:00+00:00,Dinner,Assets:Cash,USD,-1500",
+                "3,2024-01-17T10:30:00+00:00,Dinner,Expenses:Food,USD,1500",
+            ]
+        )
+
+        response = await api_client.post(
+            self._endpoint(f"/{ledger_one.id}/import?format=csv"),
+            content=Content(b"text/csv", csv_file.encode("utf-8")),
+        )
+        assert response.status == 200
+        result = await response.json()
+        assert result["created"] == 1
+        assert result["errors"] == [
+            {"line": 2, "error": "Line 2 has 5 values, the header has 6 columns"},
+            {"line": 4, "error": "Line 4 has 7 values, the header has 6 columns"},
+        ]
+
+    async def test_import_rejects_invalid_files(self, api_client: TestClient, ledger_one: Ledger) -> None:
+        """Unknown formats, CSV files without required columns and non UTF-8 files are rejected."""
+        path = self._endpoint(f"/{ledger_one.id}/import")
+
+        response = await api_client.post(f"{path}?format=ofx", content=Content(b"text/plain", b""))
+        assert response.status == 400
+
+        response = await api_client.post(path, content=Content(b"text/csv", b"date_time,amount\n"))
+        assert response.status == 400
+
+        response = await api_client.post(path, content=Content(b"text/csv", b"\xff\xfe\x00"))
+        assert response.status == 400
+
+    async def test_iter_lines_enforces_size_limit(self) -> None:
+        """Reading stops as soon as the stream exceeds the size limit."""
+
+        async def chunks():
+            yield b"first line\nsecond "
+            yield b"line\r\nthird"
+
+        assert [line async for line in iter_lines(chunks(), size_limit=100)] == [
+            (1, "first line"),
+            (2, "second line"),
+            (3, "third"),
+        ]
+
+        with pytest.raises(PayloadTooLarge):
+            _ = [line async for line in iter_lines(chunks(), size_limit=20)]